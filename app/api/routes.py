@@ -1,5 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import metrics, stage_seconds
 from app.services.matches import MatchesService
+from app.services.staking import StakingService
+from app.core.schemas import StakeRequestModel
+from app.services.push import ConnectionQueue, Subscription, push_hub
+from app.core.match_index import MatchQuery, SortKey, decode_cursor
+from app.core.bookmakers import odds_aggregator
+from datetime import datetime
+from typing import List, Optional
+import asyncio
+import json
 
 
 router = APIRouter()
@@ -9,12 +20,41 @@ router = APIRouter()
 def health():
 	return {"status": "ok"}
 
+@router.get("/metrics")
+async def get_metrics():
+	# Rendered on the event loop, which owns the state the gauge callbacks read
+	return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @router.get("/matches")
-async def get_matches():
+async def get_matches(
+	tournament: List[str] = Query(default=[]),
+	start_from: Optional[datetime] = None,
+	start_to: Optional[datetime] = None,
+	min_odds: Optional[float] = None,
+	max_odds: Optional[float] = None,
+	min_ev: Optional[float] = None,
+	sort: SortKey = 'start_time',
+	limit: Optional[int] = Query(default=None, ge=1, le=500),
+	cursor: Optional[str] = None,
+):
+	"""
+	Coming matches, optionally filtered. A match is kept when one of its outcomes has odds within [min_odds, max_odds] and an expected value
+	of at least min_ev. With a limit, the response has at most that many matches and a next_cursor to pass for the next page.
+	"""
+	try:
+		cursor_key = None if cursor is None else decode_cursor(cursor, sort)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	query = MatchQuery(tuple(tournament), start_from, start_to, min_odds, max_odds, min_ev, sort, limit, cursor_key)
+	if query == MatchQuery():
+		# Without parameters the whole feed is returned in upstream order, as before the query parameters
+		query = None
 	matches_service = MatchesService()
 	try:
-		matches = await matches_service.get_coming_matches()
-		return matches
+		matches = await matches_service.get_coming_matches(query)
+		with stage_seconds.time(stage='serialize'):
+			body = matches.model_dump_json()
+		return Response(content=body, media_type="application/json")
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 	finally:
@@ -27,8 +67,68 @@ async def get_match(NT_id: str):
 		match = await match_service.get_detailed_match(NT_id)
 		if match is None:
 			raise HTTPException(status_code=404, detail="Match not found")
-		return match
+		with stage_seconds.time(stage='serialize'):
+			body = match.model_dump_json()
+		return Response(content=body, media_type="application/json")
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 	finally:
 		await match_service.norsk_tipping_api.close()
+
+@router.get("/arbitrages")
+async def get_arbitrages():
+	"""Markets where backing every selection at the best prices across the bookmakers returns more than the total stake"""
+	return [
+		{
+			'home_team': event[0],
+			'away_team': event[1],
+			'date': event[2],
+			'market': market,
+			'overround': overround,
+			'prices': {
+				selection: dict(zip(['odds', 'source'], odds_aggregator.index.best_price(event, market, selection)))
+				for selection in sorted(odds_aggregator.index.selections[(event, market)])
+			},
+		}
+		for event, market, overround in odds_aggregator.index.arbitrages()
+	]
+
+@router.post("/stakes")
+def get_stakes(request: StakeRequestModel):
+	try:
+		stakes = StakingService().optimize(request)
+		with stage_seconds.time(stage='serialize'):
+			body = stakes.model_dump_json()
+		return Response(content=body, media_type="application/json")
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	except Exception as e:
+		raise HTTPException(status_code=500, detail=str(e))
+
+@router.websocket("/ws/matches")
+async def push_matches(websocket: WebSocket):
+	"""
+	Pushes match updates. The client sends a subscription, {"tournaments": [...], "events": [...], "min_ev": 1.05}, and may send a new one at any time.
+	"""
+	await websocket.accept()
+	queue = ConnectionQueue()
+
+	async def send_updates():
+		while True:
+			await websocket.send_text(await queue.get())
+
+	sender = asyncio.create_task(send_updates())
+	try:
+		while True:
+			try:
+				subscription = Subscription.from_message(await websocket.receive_json())
+			except (ValueError, TypeError, AttributeError, KeyError) as e:
+				# An invalid subscription gets an error frame, and the connection and its previous subscription stay open
+				queue.put('error', json.dumps({'type': 'error', 'detail': f'Invalid subscription: {e}'}))
+				continue
+			push_hub.subscribe(queue, subscription)
+	except WebSocketDisconnect:
+		pass
+	finally:
+		sender.cancel()
+		push_hub.unsubscribe(queue)
@@ -1,69 +1,115 @@
-from typing import Optional
+from typing import Callable, List, Optional
 from asyncio import Task
 import aiohttp
-import pandas as pd
+import csv
 import io
 import os
 import asyncio
+import time
 from datetime import date
+import logging
+from app.config.config import settings
+from app.core.metrics import stage_seconds, upstream_requests_total
+from app.core.scheduler import upstream_scheduler, upstream_priority, RequestClass
 #from app.predictor.training import PredictorTrainer
 
+logger = logging.getLogger(__name__)
+
+def key_columns_first(text: str, key_columns: List[str]) -> str:
+	"""
+	The CSV with key_columns moved to the front, the layout the repositories read. Raises ValueError when one is missing.
+	Done with the csv module, so the serving process never needs pandas for the updates.
+	"""
+	rows = [row for row in csv.reader(io.StringIO(text)) if row]
+	header = rows[0]
+	order = [header.index(column) for column in key_columns] + [i for i, column in enumerate(header) if column not in key_columns]
+	output = io.StringIO()
+	csv.writer(output, lineterminator='\n').writerows([row[i] if i < len(row) else '' for i in order] for row in rows)
+	return output.getvalue()
+
 class DataUpdater:
 	def __init__(self):
-		self.elo_rating_url = f"http://api.clubelo.com/{date.today().isoformat()}"
-		self.fixtures_url = "http://api.clubelo.com/Fixtures"
-		self.elo_csv_path = "app/files/elo_ratings.csv"
-		self.fixtures_csv_path = "app/files/fixtures.csv"
+		self.elo_rating_url = f"{settings.CLUBELO_URL}/{date.today().isoformat()}"
+		self.fixtures_url = f"{settings.CLUBELO_URL}/Fixtures"
+		self.elo_csv_path = settings.ELO_CSV_PATH
+		self.fixtures_csv_path = settings.FIXTURES_CSV_PATH
 		self.update_task: Optional[Task] = None
+		# Called after new ratings or fixtures are saved
+		self.listeners: List[Callable[[], None]] = []
 		self._stop_flag = False
 	
+	async def fetch_csv(self, url: str) -> Optional[str]:
+		"""The CSV at url, or None when ClubELO does not answer 200. Sent through the upstream scheduler like every other ClubELO request."""
+		async def fetch():
+			async with aiohttp.ClientSession() as session:
+				async with session.get(url) as response:
+					upstream_requests_total.inc(source='clubelo', status=response.status)
+					if response.status != 200:
+						logger.warning("Failed to fetch CSV: %s", response.status, extra={'url': str(response.url)})
+						return None
+					return await response.text()
+		# Snapshot downloads yield to user requests, and get longer than a user request to finish
+		with upstream_priority(RequestClass.REFRESH, deadline=settings.DOWNLOAD_DEADLINE):
+			return await upstream_scheduler.submit('clubelo', fetch)
+
 	async def download_elo_csv(self) -> bool:
 		try:
-			async with aiohttp.ClientSession() as session:
-				async with session.get(self.elo_rating_url) as response:
-					if response.status == 200:
-						data = await response.text()
-						df = pd.read_csv(io.StringIO(data)) 
-						df.set_index('Club', inplace=True)
-						os.makedirs(os.path.dirname(self.elo_csv_path), exist_ok=True)
-						df.to_csv(self.elo_csv_path)
-						print(f"CSV downloaded and saved to {self.elo_csv_path}")
-						return True
-					else:
-						print(f"Failed to fetch CSV: {response.status}")
-						return False
+			with stage_seconds.time(stage='download_elo_csv'):
+				data = await self.fetch_csv(self.elo_rating_url)
+				if data is None:
+					return False
+				data = key_columns_first(data, ['Club'])
+				os.makedirs(os.path.dirname(self.elo_csv_path), exist_ok=True)
+				with open(self.elo_csv_path, 'w', encoding='utf-8') as f:
+					f.write(data)
+				logger.info("CSV downloaded and saved to %s", self.elo_csv_path)
+				return True
 		except Exception as e:
-			print(f"Error downloading ELO CSV: {e}")
+			logger.error("Error downloading ELO CSV: %s", e)
 			return False
 		
 	async def download_fixtures_csv(self) -> bool:
 		try:
-			async with aiohttp.ClientSession() as session:
-				async with session.get(self.fixtures_url) as response:
-					if response.status == 200:
-						data = await response.text()
-						df = pd.read_csv(io.StringIO(data), index_col=['Home', 'Away'])
-						os.makedirs(os.path.dirname(self.fixtures_csv_path), exist_ok=True)
-						df.to_csv(self.fixtures_csv_path)
-						print(f"CSV downloaded and saved to {self.fixtures_csv_path}")
-						return True
-					else:
-						print(f"Failed to fetch CSV: {response.status}")
-						return False
+			with stage_seconds.time(stage='download_fixtures_csv'):
+				data = await self.fetch_csv(self.fixtures_url)
+				if data is None:
+					return False
+				data = key_columns_first(data, ['Home', 'Away'])
+				os.makedirs(os.path.dirname(self.fixtures_csv_path), exist_ok=True)
+				with open(self.fixtures_csv_path, 'w', encoding='utf-8') as f:
+					f.write(data)
+				logger.info("CSV downloaded and saved to %s", self.fixtures_csv_path)
+				return True
 		except Exception as e:
-			print(f"Error downloading fixtures CSV: {e}")
+			logger.error("Error downloading fixtures CSV: %s", e)
 			return False
 		
+	def seconds_until_stale(self) -> float:
+		"""Time until the oldest snapshot file is SNAPSHOT_MAX_AGE old, 0 when one is missing or already stale"""
+		try:
+			oldest = min(os.stat(path).st_mtime for path in [self.elo_csv_path, self.fixtures_csv_path])
+		except FileNotFoundError:
+			return 0
+		return max(0, settings.SNAPSHOT_MAX_AGE - (time.time() - oldest))
+
 	async def update_loop(self):
+		# Files written shortly before a restart are served as they are instead of downloaded again at boot
+		wait = self.seconds_until_stale()
+		if wait > 0:
+			logger.info("Snapshots are fresh, next download in %.0f s", wait)
+			await asyncio.sleep(wait)
 		while not self._stop_flag:
 			try:
-				await asyncio.gather(
+				downloaded = await asyncio.gather(
 					self.download_elo_csv(),
 					self.download_fixtures_csv(),
 				)
+				if any(downloaded):
+					for listener in self.listeners:
+						listener()
 				await asyncio.sleep(60*60*24) #Vil egentlig ha ved et fikset tidspunkt hver dag
 			except Exception as e:
-				print(f"Error in update loop: {e}")
+				logger.error("Error in update loop: %s", e)
 				await asyncio.sleep(5)
 	
 	async def start(self):
@@ -1,15 +1,40 @@
 from pydantic_settings import BaseSettings
-from datetime import date
+from typing import Dict, Tuple
 
 
 class Settings(BaseSettings):
-    ELO_URL = f"http://api.clubelo.com/{date.today().isoformat()}"
-    FIXTURES_URL = "http://api.clubelo.com/Fixtures"
-    ELO_CSV_PATH = "app/files/elo_ratings.csv"
-    FIXTURES_CSV_PATH = "app/files/fixtures.csv"
-    UPDATE_INTERVAL = 60
+    NORSK_TIPPING_URL: str = "https://api.norsk-tipping.no/OddsenGameInfo/v1/api"
+    CLUBELO_URL: str = "http://api.clubelo.com"
+    PINNACLE_URL: str = "https://api.pinnacle.com"
+    PINNACLE_USERNAME: str = ""
+    PINNACLE_PASSWORD: str = ""
+    BOOKMAKER_TIMEOUT: float = 5.0
+    # Seconds between refreshes of the best prices across bookmakers
+    BOOKMAKER_INTERVAL: float = 60.0
+    # Requests per second and burst size allowed per upstream host
+    UPSTREAM_RATE_LIMITS: Dict[str, Tuple[float, int]] = {"norsk_tipping": (10.0, 20), "clubelo": (2.0, 5), "pinnacle": (1.0, 3)}
+    UPSTREAM_DEADLINE: float = 10.0
+    # Deadline of the ratings and fixtures snapshot downloads, which are a few MB each
+    DOWNLOAD_DEADLINE: float = 60.0
+    ELO_CSV_PATH: str = "app/files/elo_ratings.csv"
+    FIXTURES_CSV_PATH: str = "app/files/fixtures.csv"
+    ELO_HISTORY_PATH: str = "app/files/elo_history"
+    # HUB calibration written by app.predictor.evaluation, applied to the fixtures probabilities when present
+    CALIBRATION_PATH: str = "app/files/calibration.json"
+    CURRENT_DATA_CSV_PATH: str = "app/files/current_data.csv"
+    UPDATE_INTERVAL: int = 60
+    # Snapshot files younger than this are not downloaded again at boot
+    SNAPSHOT_MAX_AGE: float = 24 * 60 * 60
+    # Odds payloads are reused for ODDS_CACHE_TTL seconds, and payloads restored at boot for WARM_ODDS_MAX_AGE
+    ODDS_CACHE_TTL: float = 10.0
+    WARM_ODDS_MAX_AGE: float = 120.0
+    WARM_CACHE_DIR: str = "app/files/cache"
+    WARM_CACHE_INTERVAL: float = 300.0
+    PROFILING_ENABLED: bool = False
+    PUSH_INTERVAL: float = 30.0
+    PUSH_QUEUE_SIZE: int = 100
 
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,380 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, date, timezone
+from typing import Dict, List, Optional, Tuple
+import unicodedata
+import asyncio
+import aiohttp
+import logging
+import re
+from app.config.config import settings
+from app.core.external_services import ExternalDataSource, NorskTippingAPI
+from app.core.metrics import upstream_request_seconds, upstream_requests_total
+from app.core.scheduler import upstream_scheduler, upstream_priority, RequestClass
+from app.core.schemas import BestPricesModel, HUBModel
+from app.utils.utils import NT_to_ClubELO_names_mapping
+
+logger = logging.getLogger(__name__)
+
+# Unified market schema: markets are named as Norsk Tipping names them with the team names replaced by home and away (the names
+# app.core.markets prices), and selections are home, draw and away for three-way markets and true and false for two-way markets.
+EventKey = Tuple[str, str, date]
+PriceKey = Tuple[EventKey, str, str]
+
+# Markets whose selections are mutually exclusive and cover every result, so an overround below 1 at the best prices is an arbitrage
+arbitrage_markets = re.compile(r'^(HUB|Handikap 3-veis \d+:\d+|Totalt antall .*|Begge lag scorer|.* holder nullen|Asiatisk .*)$')
+
+def total_market_name(line: float) -> str:
+	"""Half-goal lines are plain over/under markets, the others Asian totals"""
+	if (line * 2) % 2 == 1:
+		return f'Totalt antall mål - Over/Under {line:g}'
+	return f'Asiatisk over/under {line:g}'
+
+def asian_handicap_market_name(home_line: float) -> str:
+	return f'Asiatisk handikap {home_line:+g}' if home_line else 'Asiatisk handikap 0'
+
+@dataclass
+class BookEvent:
+	source: str
+	event_id: str
+	home_team: str
+	away_team: str
+	start_time: datetime
+	# market name: {selection: decimal odds}
+	markets: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+class TeamResolver:
+	"""
+	Resolves team names from any bookmaker to one canonical name, the ClubELO name. Known aliases are looked up first, then a normalized form
+	of the name (no accents, case, punctuation or club prefixes and suffixes such as FC), so small spelling differences between books still match.
+	"""
+	noise_tokens = {'fc', 'afc', 'cf', 'sc', 'ac', 'ssc', 'as', 'ogc', 'vfb', 'vfl', 'tsg', 'fk', 'sk', 'if', 'bk', '1'}
+
+	def __init__(self, aliases: Dict[str, str] = NT_to_ClubELO_names_mapping):
+		self._names: Dict[str, str] = {}
+		for alias, canonical in aliases.items():
+			self.add(canonical, canonical)
+			self.add(alias, canonical)
+
+	@classmethod
+	def normalize(cls, name: str) -> str:
+		name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().casefold()
+		return ' '.join(token for token in re.sub(r'[^\w\s]', ' ', name).split() if token not in cls.noise_tokens)
+
+	def add(self, alias: str, canonical: str):
+		self._names[alias] = canonical
+		self._names.setdefault(self.normalize(alias), canonical)
+
+	def resolve(self, name: str) -> str:
+		resolved = self._names.get(name)
+		if resolved is None:
+			normalized = self.normalize(name)
+			resolved = self._names.get(normalized, normalized)
+			self._names[name] = resolved
+		return resolved
+
+class BookmakerAdapter(ABC):
+	"""One bookmaker's events and prices in the unified market schema"""
+	source: str
+
+	def __init__(self, timeout: float = settings.BOOKMAKER_TIMEOUT):
+		self.timeout = timeout
+
+	@abstractmethod
+	async def fetch_events(self) -> List[BookEvent]:
+		pass
+
+	async def close(self):
+		pass
+
+class NorskTippingAdapter(BookmakerAdapter):
+	"""Main-market (HUB) prices of the coming Norsk Tipping events"""
+	source = 'norsk_tipping'
+
+	def __init__(self, api: Optional[NorskTippingAPI] = None, timeout: float = settings.BOOKMAKER_TIMEOUT):
+		super().__init__(timeout)
+		self.api = api or NorskTippingAPI()
+
+	@staticmethod
+	def compact_event(event: Dict) -> Optional[Dict]:
+		selections = (event.get('mainMarket') or {}).get('selections') or []
+		if len(selections) != 3:
+			return None
+		return {
+			'eventId': event.get('eventId'),
+			'homeParticipant': event.get('homeParticipant'),
+			'awayParticipant': event.get('awayParticipant'),
+			'startTime': event.get('startTime'),
+			'odds': [selection.get('selectionOdds') for selection in selections],
+		}
+
+	async def fetch_events(self) -> List[BookEvent]:
+		data = await self.api.get_coming_matches(keep=self.compact_event)
+		return [
+			BookEvent(
+				source=self.source,
+				event_id=str(event['eventId']),
+				home_team=event['homeParticipant'],
+				away_team=event['awayParticipant'],
+				start_time=datetime.fromisoformat(event['startTime']),
+				markets={'HUB': dict(zip(['home', 'draw', 'away'], event['odds']))},
+			)
+			for event in data.get('eventList', [])
+		]
+
+	async def close(self):
+		await self.api.close()
+
+class PinnacleAPI(ExternalDataSource):
+	"""Pinnacle's v1 fixtures and odds feeds for soccer, with decimal odds"""
+	sport_id = 29
+
+	def __init__(self, base_url: Optional[str] = None):
+		super().__init__()
+		self.base_url = base_url
+
+	async def fetch_data(self, extension) -> dict:
+		auth = aiohttp.BasicAuth(settings.PINNACLE_USERNAME, settings.PINNACLE_PASSWORD) if settings.PINNACLE_USERNAME else None
+		async def fetch():
+			with upstream_request_seconds.time(source='pinnacle'):
+				async with self.session.get(f"{self.base_url or settings.PINNACLE_URL}/{extension}", auth=auth) as response:
+					upstream_requests_total.inc(source='pinnacle', status=response.status)
+					response.raise_for_status()
+					return await response.json()
+		return await upstream_scheduler.submit('pinnacle', fetch)
+
+	async def get_fixtures(self):
+		return await self.fetch_data(f"v1/fixtures?sportId={self.sport_id}")
+
+	async def get_odds(self):
+		return await self.fetch_data(f"v1/odds?sportId={self.sport_id}&oddsFormat=Decimal")
+
+class PinnacleAdapter(BookmakerAdapter):
+	"""Full-time (period 0) moneyline, totals and spreads from Pinnacle"""
+	source = 'pinnacle'
+
+	def __init__(self, api: Optional[PinnacleAPI] = None, timeout: float = settings.BOOKMAKER_TIMEOUT):
+		super().__init__(timeout)
+		self.api = api or PinnacleAPI()
+
+	@staticmethod
+	def parse_period(period: Dict) -> Dict[str, Dict[str, float]]:
+		markets = {}
+		moneyline = period.get('moneyline')
+		if moneyline and {'home', 'draw', 'away'} <= moneyline.keys():
+			markets['HUB'] = {selection: moneyline[selection] for selection in ['home', 'draw', 'away']}
+		for total in period.get('totals') or []:
+			markets[total_market_name(total['points'])] = {'true': total['over'], 'false': total['under']}
+		for spread in period.get('spreads') or []:
+			markets[asian_handicap_market_name(spread['hdp'])] = {'true': spread['home'], 'false': spread['away']}
+		return markets
+
+	async def fetch_events(self) -> List[BookEvent]:
+		fixtures, odds = await asyncio.gather(self.api.get_fixtures(), self.api.get_odds())
+		periods = {
+			event['id']: period
+			for league in odds.get('leagues', [])
+			for event in league.get('events', [])
+			for period in event.get('periods', [])
+			if period.get('number') == 0
+		}
+		return [
+			BookEvent(
+				source=self.source,
+				event_id=str(event['id']),
+				home_team=event['home'],
+				away_team=event['away'],
+				start_time=datetime.fromisoformat(event['starts'].replace('Z', '+00:00')),
+				markets=self.parse_period(periods[event['id']]),
+			)
+			for league in fixtures.get('league', [])
+			for event in league.get('events', [])
+			if event['id'] in periods
+		]
+
+	async def close(self):
+		await self.api.close()
+
+class BestPriceIndex:
+	"""
+	Best price per (event, market, selection) across sources, kept up to date as prices change, so lookups are one dict access.
+	When the source holding the best price lowers or withdraws it, the best is recomputed from the few other sources quoting that selection.
+	"""
+	def __init__(self):
+		self.prices: Dict[PriceKey, Dict[str, float]] = {}
+		self.best: Dict[PriceKey, Tuple[float, str]] = {}
+		self.selections: Dict[Tuple[EventKey, str], set] = {}
+		self._source_keys: Dict[str, set] = {}
+
+	def update(self, key: PriceKey, source: str, odds: float):
+		self.prices.setdefault(key, {})[source] = odds
+		self.selections.setdefault(key[:2], set()).add(key[2])
+		self._source_keys.setdefault(source, set()).add(key)
+		best = self.best.get(key)
+		if best is None or odds >= best[0]:
+			self.best[key] = (odds, source)
+		elif best[1] == source:
+			self._recompute(key)
+
+	def remove(self, key: PriceKey, source: str):
+		quotes = self.prices.get(key)
+		if not quotes or quotes.pop(source, None) is None:
+			return
+		self._source_keys[source].discard(key)
+		if not quotes:
+			del self.prices[key], self.best[key]
+			selections = self.selections[key[:2]]
+			selections.discard(key[2])
+			if not selections:
+				del self.selections[key[:2]]
+		elif self.best[key][1] == source:
+			self._recompute(key)
+
+	def _recompute(self, key: PriceKey):
+		source, odds = max(self.prices[key].items(), key=lambda quote: quote[1])
+		self.best[key] = (odds, source)
+
+	def replace_source(self, source: str, prices: Dict[PriceKey, float]):
+		"""Sets all prices of a source at once, withdrawing the ones it no longer quotes"""
+		for key in self._source_keys.get(source, set()) - prices.keys():
+			self.remove(key, source)
+		for key, odds in prices.items():
+			self.update(key, source, odds)
+
+	def best_price(self, event: EventKey, market: str, selection: str) -> Optional[Tuple[float, str]]:
+		return self.best.get((event, market, selection))
+
+	def overround(self, event: EventKey, market: str) -> float:
+		"""Sum of the implied probabilities of the best prices. Below 1 when backing every selection at the best prices is an arbitrage."""
+		return sum(1 / self.best[(event, market, selection)][0] for selection in self.selections[(event, market)])
+
+	def arbitrages(self) -> List[Tuple[EventKey, str, float]]:
+		"""(event, market, overround) of every market with an overround below 1 at the best prices"""
+		found = []
+		for (event, market), selections in self.selections.items():
+			if not arbitrage_markets.match(market) or len(selections) < (3 if 'draw' in selections or market.startswith(('HUB', 'Handikap')) else 2):
+				continue
+			overround = self.overround(event, market)
+			if overround < 1:
+				found.append((event, market, overround))
+		return found
+
+def default_adapters() -> List[BookmakerAdapter]:
+	"""Norsk Tipping, and Pinnacle when PINNACLE_USERNAME is set"""
+	adapters: List[BookmakerAdapter] = [NorskTippingAdapter()]
+	if settings.PINNACLE_USERNAME:
+		adapters.append(PinnacleAdapter())
+	return adapters
+
+@dataclass
+class MatchedEvent:
+	home_team: str
+	away_team: str
+	start_time: datetime
+	# source: that source's event id
+	event_ids: Dict[str, str] = field(default_factory=dict)
+
+class OddsAggregator:
+	"""
+	Fetches every bookmaker concurrently, each bounded by its own timeout, matches their events on resolved team names and kickoff date,
+	and keeps the best-price index. A source that fails or times out has its prices withdrawn until it answers again. Without adapters,
+	the default_adapters are created on the first refresh, inside the event loop their sessions need.
+	"""
+	def __init__(self, adapters: Optional[List[BookmakerAdapter]] = None, resolver: Optional[TeamResolver] = None, interval: float = settings.BOOKMAKER_INTERVAL):
+		self.adapters = adapters
+		self.resolver = resolver or TeamResolver()
+		self.interval = interval
+		self.index = BestPriceIndex()
+		self.events: Dict[EventKey, MatchedEvent] = {}
+		self.task: Optional[asyncio.Task] = None
+
+	def match_key(self, home_team: str, away_team: str, start_time: datetime) -> EventKey:
+		"""Resolved team names and the kickoff date in UTC, since each book gives kickoffs in its own timezone. Naive kickoffs are taken as UTC."""
+		if start_time.tzinfo is not None:
+			start_time = start_time.astimezone(timezone.utc)
+		return (self.resolver.resolve(home_team), self.resolver.resolve(away_team), start_time.date())
+
+	def event_key(self, event: BookEvent) -> EventKey:
+		return self.match_key(event.home_team, event.away_team, event.start_time)
+
+	async def _fetch(self, adapter: BookmakerAdapter) -> Optional[List[BookEvent]]:
+		try:
+			# Bookmaker polling yields to user-facing requests for the same upstream
+			with upstream_priority(RequestClass.PREFETCH, deadline=adapter.timeout):
+				return await asyncio.wait_for(adapter.fetch_events(), adapter.timeout)
+		except asyncio.TimeoutError:
+			upstream_requests_total.inc(source=adapter.source, status='timeout')
+			logger.warning("Bookmaker timed out", extra={'source': adapter.source, 'timeout': adapter.timeout})
+		except Exception as e:
+			logger.warning("Bookmaker fetch failed: %s", e, extra={'source': adapter.source})
+		return None
+
+	async def refresh(self) -> Dict[str, Optional[int]]:
+		"""Fetches all sources once. Returns the number of events per source, None for the ones that failed."""
+		if self.adapters is None:
+			self.adapters = default_adapters()
+		results = await asyncio.gather(*(self._fetch(adapter) for adapter in self.adapters))
+		counts, matched_events = {}, {}
+		for adapter, events in zip(self.adapters, results):
+			counts[adapter.source] = None if events is None else len(events)
+			prices = {}
+			for event in events or []:
+				key = self.event_key(event)
+				matched = matched_events.setdefault(key, MatchedEvent(key[0], key[1], event.start_time))
+				matched.event_ids[adapter.source] = event.event_id
+				for market, selections in event.markets.items():
+					for selection, odds in selections.items():
+						if odds and odds > 1:
+							prices[(key, market, selection)] = float(odds)
+			self.index.replace_source(adapter.source, prices)
+		self.events = matched_events
+		return counts
+
+	def expected_values(self, event: EventKey, market: str, probs: Dict[str, float]) -> Dict[str, Optional[float]]:
+		"""Probability times the best available price per selection"""
+		values = {}
+		for selection, probability in probs.items():
+			best = self.index.best_price(event, market, selection)
+			values[selection] = None if best is None else best[0] * probability
+		return values
+
+	def best_prices(self, home_team: str, away_team: str, start_time: datetime, probs: HUBModel) -> Optional[BestPricesModel]:
+		"""Best HUB prices of a match across the books, with the expected values and overround at them, or None unless all three are quoted"""
+		key = self.match_key(home_team, away_team, start_time)
+		best = {selection: self.index.best_price(key, 'HUB', selection) for selection in ('home', 'draw', 'away')}
+		if None in best.values():
+			return None
+		expected_values = self.expected_values(key, 'HUB', probs.model_dump())
+		return BestPricesModel(
+			odds=HUBModel(**{selection: odds for selection, (odds, _) in best.items()}),
+			sources={selection: source for selection, (_, source) in best.items()},
+			expected_value=HUBModel(**expected_values),
+			overround=self.index.overround(key, 'HUB'),
+		)
+
+	async def run(self):
+		while True:
+			try:
+				counts = await self.refresh()
+				logger.info("Refreshed bookmaker prices", extra={'events': counts})
+			except Exception as e:
+				logger.error("Error refreshing bookmaker prices: %s", e)
+			await asyncio.sleep(self.interval)
+
+	async def start(self):
+		self.task = asyncio.create_task(self.run())
+
+	async def stop(self):
+		if self.task:
+			self.task.cancel()
+			try:
+				await self.task
+			except asyncio.CancelledError:
+				pass
+			self.task = None
+		await self.close()
+
+	async def close(self):
+		await asyncio.gather(*(adapter.close() for adapter in self.adapters or []))
+
+odds_aggregator = OddsAggregator()
@@ -0,0 +1,80 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import numpy as np
+import json
+import os
+from .markets import gd_columns, score_columns
+
+OUTCOMES = ('home', 'draw', 'away')
+
+@dataclass
+class CalibrationMap:
+    """
+    Maps predicted probabilities of one outcome to calibrated ones. Isotonic maps interpolate linearly between the fitted knots x -> y
+    and are flat outside them, Platt maps are sigmoid(a * logit(p) + b).
+    """
+    method: str
+    x: List[float] = field(default_factory=list)
+    y: List[float] = field(default_factory=list)
+    a: float = 1.0
+    b: float = 0.0
+
+    def __call__(self, p) -> np.ndarray:
+        p = np.asarray(p, dtype=float)
+        if self.method == 'isotonic':
+            return np.interp(p, self.x, self.y)
+        p = np.clip(p, 1e-6, 1 - 1e-6)
+        return 1 / (1 + np.exp(-(self.a * (np.log(p) - np.log1p(-p)) + self.b)))
+
+@dataclass
+class HUBCalibration:
+    """One-vs-rest calibration maps for the home, draw and away probabilities, renormalized to sum to one"""
+    maps: Dict[str, CalibrationMap]
+
+    def apply(self, probs: np.ndarray) -> np.ndarray:
+        """(n, 3) calibrated HUB probabilities. Rows with no probability (all zero or NaN) are left as they are."""
+        probs = np.asarray(probs, dtype=float)
+        calibrated = np.column_stack([self.maps[outcome](probs[:, i]) for i, outcome in enumerate(OUTCOMES)])
+        total = calibrated.sum(axis=1, keepdims=True)
+        known = (np.nan_to_num(probs).sum(axis=1) > 0) & (total[:, 0] > 0)
+        return np.where(known[:, None], calibrated / np.where(total > 0, total, 1), probs)
+
+    def calibrate_columns(self, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Fixture probability columns in the ClubELO format, with the home win, draw and away win parts of the GD and exact score columns
+        each rescaled to the calibrated HUB probability. Every market derived from the calibrated columns then agrees with the calibrated
+        1X2 odds, and the distribution within each part is unchanged.
+        """
+        n = len(next(iter(columns.values()), []))
+        gd = np.column_stack([np.nan_to_num(columns[column]) if column in columns else np.zeros(n) for column in gd_columns])
+        # GD<-5 ... GD=-1 are away wins, GD=0 a draw and GD=1 ... GD>5 home wins
+        raw = np.column_stack([gd[:, 7:].sum(axis=1), gd[:, 6], gd[:, :6].sum(axis=1)])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scale = np.where(raw > 0, self.apply(raw) / raw, 1.0)
+        calibrated = dict(columns)
+        for j, column in enumerate(gd_columns):
+            if column in columns:
+                calibrated[column] = columns[column] * scale[:, 0 if j > 6 else 1 if j == 6 else 2]
+        for home_goals, away_goals in score_columns:
+            column = f'R:{home_goals}-{away_goals}'
+            if column in columns:
+                calibrated[column] = columns[column] * scale[:, 0 if home_goals > away_goals else 1 if home_goals == away_goals else 2]
+        return calibrated
+
+    def to_dict(self) -> dict:
+        return {outcome: calibration_map.__dict__ for outcome, calibration_map in self.maps.items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HUBCalibration':
+        return cls({outcome: CalibrationMap(**data[outcome]) for outcome in OUTCOMES})
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+
+def load_calibration(path: Optional[str]) -> Optional[HUBCalibration]:
+    """The calibration saved at path, or None when there is none"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return HUBCalibration.from_dict(json.load(f))
@@ -0,0 +1,211 @@
+"""
+Point-in-time ClubELO ratings. A backfill fetches club histories or daily rankings concurrently through the upstream scheduler, and
+RatingHistory answers "rating of team X as of date D" by binary search, for one team or for arrays of teams and dates.
+
+Run with: python -m app.core.elo_history [--clubs Arsenal Chelsea] [--start 2020-07-01 --end 2021-06-30 --step-days 7]
+"""
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple, Union
+import numpy as np
+import argparse
+import asyncio
+import logging
+import aiohttp
+import bisect
+import json
+import sys
+import os
+from app.config.config import settings
+from app.core.external_services import ClubELOAPI
+from app.core.scheduler import upstream_priority, RequestClass
+from app.utils.utils import read_csv_columns
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DateLike = Union[str, date, np.datetime64]
+
+# Lookup keys are team id * 2**32 + day + 2**31, so every int32 day of a team sorts within the team's block
+_DAY_SPAN = np.int64(1 << 32)
+_DAY_OFFSET = np.int64(1 << 31)
+
+def to_days(dates) -> np.ndarray:
+    """Days since 1970-01-01 as int32, from ISO strings, dates or datetime64 values"""
+    return np.asarray(dates).astype('datetime64[D]').astype(np.int32)
+
+class RatingHistory:
+    """
+    ClubELO ratings over time. Each team's periods are a block of the days and ratings arrays, sorted by the first day the rating
+    applied (ClubELO's From date), and offsets[i]:offsets[i + 1] is team i's block. The rating as of a date is the one of the last period
+    starting on or before it, so a lookup on a match date gives the rating before the match.
+    """
+    array_names = ['days', 'ratings', 'offsets']
+
+    def __init__(self, teams: List[str], days: np.ndarray, ratings: np.ndarray, offsets: np.ndarray):
+        self.teams = [sys.intern(team) for team in teams]
+        self.team_ids = {team: i for i, team in enumerate(self.teams)}
+        self.days = days.astype(np.int32)
+        self.ratings = ratings.astype(np.float32)
+        self.offsets = offsets.astype(np.int64)
+        self._build_keys()
+
+    def _build_keys(self):
+        team_of_row = np.repeat(np.arange(len(self.teams), dtype=np.int64), np.diff(self.offsets))
+        self.keys = team_of_row * _DAY_SPAN + self.days + _DAY_OFFSET
+
+    @classmethod
+    def from_periods(cls, clubs: Sequence[str], starts, ratings) -> 'RatingHistory':
+        """From one row per rating period: club, first day and rating. For periods of a club starting on the same day, the last is kept."""
+        starts = to_days(starts)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        known = ~np.isnan(ratings)
+        clubs = [club for club, keep in zip(clubs, known) if keep]
+        starts, ratings = starts[known], ratings[known]
+        teams = sorted(set(clubs))
+        team_ids = {team: i for i, team in enumerate(teams)}
+        ids = np.array([team_ids[club] for club in clubs], dtype=np.int64)
+        keys = ids * _DAY_SPAN + starts + _DAY_OFFSET
+        # Stable, so among equal keys the last row comes last and wins the dedupe below
+        order = np.argsort(keys, kind='stable')
+        keys, ids, starts, ratings = keys[order], ids[order], starts[order], ratings[order]
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+        ids, starts, ratings = ids[last], starts[last], ratings[last]
+        offsets = np.searchsorted(ids, np.arange(len(teams) + 1))
+        return cls(teams, starts, ratings, offsets)
+
+    @classmethod
+    def from_frames(cls, frames: Sequence['pd.DataFrame']) -> 'RatingHistory':
+        """From ClubELO ranking or history frames (Club, Elo and From columns)"""
+        return cls.from_periods(
+            [club for frame in frames for club in frame['Club']],
+            np.concatenate([frame['From'].to_numpy(dtype=str) for frame in frames] or [np.array([], dtype=str)]),
+            np.concatenate([frame['Elo'].to_numpy(dtype=float) for frame in frames] or [np.array([])]),
+        )
+
+    def periods(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Club, first day and rating of every period, the inverse of from_periods"""
+        clubs = [team for i, team in enumerate(self.teams) for _ in range(self.offsets[i + 1] - self.offsets[i])]
+        return clubs, self.days.astype('datetime64[D]'), self.ratings
+
+    def merge(self, other: 'RatingHistory') -> 'RatingHistory':
+        """Both histories in one. Where both have a period of a club starting on the same day, other's rating is kept."""
+        clubs, days, ratings = self.periods()
+        other_clubs, other_days, other_ratings = other.periods()
+        return RatingHistory.from_periods(clubs + other_clubs, np.concatenate([days, other_days]), np.concatenate([ratings, other_ratings]))
+
+    def history(self, team: str) -> Tuple[np.ndarray, np.ndarray]:
+        """First days and ratings of the team's periods, empty for unknown teams"""
+        i = self.team_ids.get(team)
+        if i is None:
+            return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float32)
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.days[lo:hi].astype('datetime64[D]'), self.ratings[lo:hi]
+
+    def rating_as_of(self, team: str, as_of: DateLike) -> float:
+        """The team's rating on the date, NaN for unknown teams and dates before the team's first rating"""
+        i = self.team_ids.get(team)
+        if i is None:
+            return float('nan')
+        day = int(np.datetime64(as_of, 'D').astype(np.int64))
+        lo = int(self.offsets[i])
+        j = bisect.bisect_right(self.days, day, lo, int(self.offsets[i + 1]))
+        return float(self.ratings[j - 1]) if j > lo else float('nan')
+
+    def ratings_as_of(self, teams: Sequence[str], dates) -> np.ndarray:
+        """rating_as_of for arrays of teams and dates, with one binary search over all periods for the whole batch"""
+        ids = np.array([self.team_ids.get(team, -1) for team in teams], dtype=np.int64)
+        days = np.broadcast_to(to_days(dates), ids.shape)
+        found = ids >= 0
+        j = np.searchsorted(self.keys, ids * _DAY_SPAN + days + _DAY_OFFSET, side='right') - 1
+        found &= j >= self.offsets[np.where(found, ids, 0)]
+        return np.where(found, self.ratings[np.maximum(j, 0)] if len(self.ratings) else np.nan, np.nan)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held: the arrays, the lookup keys, the interned names and the name lookup"""
+        arrays = [getattr(self, name) for name in self.array_names] + [self.keys]
+        return sum(array.nbytes for array in arrays) + sum(sys.getsizeof(team) for team in self.teams) + sys.getsizeof(self.team_ids) + sys.getsizeof(self.teams)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in self.array_names:
+            np.save(f'{path}/{name}.npy', getattr(self, name))
+        with open(f'{path}/teams.json', 'w', encoding='utf-8') as f:
+            json.dump(self.teams, f)
+
+    @classmethod
+    def load(cls, path: str) -> 'RatingHistory':
+        history = cls.__new__(cls)
+        with open(f'{path}/teams.json', encoding='utf-8') as f:
+            history.teams = [sys.intern(team) for team in json.load(f)]
+        history.team_ids = {team: i for i, team in enumerate(history.teams)}
+        for name in cls.array_names:
+            setattr(history, name, np.load(f'{path}/{name}.npy'))
+        history._build_keys()
+        return history
+
+async def _fetch_all(fetch, names: Sequence[str], concurrency: int) -> Tuple[RatingHistory, List[str]]:
+    """Runs fetch(name) for every name, at most concurrency at a time, as prefetch requests. Returns the history and the names that failed."""
+    semaphore = asyncio.Semaphore(concurrency)
+    frames: Dict[str, 'pd.DataFrame'] = {}
+    failed = []
+
+    async def fetch_one(name):
+        async with semaphore:
+            try:
+                with upstream_priority(RequestClass.PREFETCH):
+                    frames[name] = await fetch(name)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning("Could not fetch ClubELO ratings for %s: %s", name, e)
+                failed.append(name)
+
+    await asyncio.gather(*(fetch_one(name) for name in names))
+    # In request order, so a rerun gives the same history whatever order the responses came in
+    return RatingHistory.from_frames([frames[name] for name in names if name in frames]), failed
+
+async def backfill_club_histories(api: ClubELOAPI, clubs: Sequence[str], concurrency: int = 4) -> Tuple[RatingHistory, List[str]]:
+    """Every period of each club's history, one request per club"""
+    return await _fetch_all(api.get_one_clubs_rating_history, list(dict.fromkeys(clubs)), concurrency)
+
+async def backfill_daily_rankings(api: ClubELOAPI, start: date, end: date, step_days: int = 1, concurrency: int = 4) -> Tuple[RatingHistory, List[str]]:
+    """
+    The periods in effect on every step_days-th day from start to end, one request per day. Lookups are exact on the fetched days;
+    a period that started and ended between two of them is missing, so club histories are the better backfill when the clubs are known.
+    """
+    days = [(start + timedelta(days=offset)).isoformat() for offset in range(0, (end - start).days + 1, step_days)]
+    return await _fetch_all(api.get_one_days_ranking, days, concurrency)
+
+async def _backfill(args) -> Tuple[RatingHistory, List[str]]:
+    api = ClubELOAPI()
+    try:
+        if args.start:
+            return await backfill_daily_rankings(api, date.fromisoformat(args.start), date.fromisoformat(args.end or date.today().isoformat()), args.step_days, args.concurrency)
+        clubs = args.clubs or list(dict.fromkeys(read_csv_columns(settings.ELO_CSV_PATH, ['Club'])['Club']))
+        return await backfill_club_histories(api, clubs, args.concurrency)
+    finally:
+        await api.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clubs', nargs='+', default=None, help='Clubs whose histories to fetch. Defaults to every club in ELO_CSV_PATH.')
+    parser.add_argument('--start', default=None, help='Fetch daily rankings from this date instead of club histories')
+    parser.add_argument('--end', default=None, help='Last date of daily rankings, today by default')
+    parser.add_argument('--step-days', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--path', default=settings.ELO_HISTORY_PATH)
+    args = parser.parse_args()
+
+    history, failed = asyncio.run(_backfill(args))
+    if os.path.isdir(args.path):
+        # Earlier backfills are kept, and their periods are replaced where this one fetched the same ones
+        history = RatingHistory.load(args.path).merge(history)
+    history.save(args.path)
+    print(f'Saved {len(history.days)} rating periods of {len(history.teams)} clubs ({history.nbytes / 1e6:.1f} MB) to {args.path}')
+    if failed:
+        print(f'Failed, rerun to fill them in: {" ".join(failed)}')
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,14 @@
 from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
 import aiohttp
-import pandas as pd
+import ijson
 from io import StringIO
+import logging
+from app.config.config import settings
+from app.core.metrics import upstream_request_seconds, upstream_requests_total
+from app.core.scheduler import upstream_scheduler
+
+logger = logging.getLogger(__name__)
 
 class ExternalDataSource(ABC):
 	def __init__(self):
@@ -16,29 +23,61 @@ class ExternalDataSource(ABC):
 
 class NorskTippingAPI(ExternalDataSource):
 	async def fetch_data(self, extension) -> dict:
-		async with self.session.get(
-			f"https://api.norsk-tipping.no/OddsenGameInfo/v1/api/{extension}",
-			headers={}
-		) as response:
-			response.raise_for_status()
-			return await response.json()
+		async def fetch():
+			with upstream_request_seconds.time(source='norsk_tipping'):
+				async with self.session.get(
+					f"{settings.NORSK_TIPPING_URL}/{extension}",
+					headers={}
+				) as response:
+					upstream_requests_total.inc(source='norsk_tipping', status=response.status)
+					response.raise_for_status()
+					return await response.json()
+		return await upstream_scheduler.submit('norsk_tipping', fetch)
 		
-	async def get_coming_matches(self):
-		return await self.fetch_data("events/FBL")
+	async def stream_events(self, extension, keep: Callable[[Dict], Optional[Dict]]) -> dict:
+		"""
+		Streams the eventList of an events payload and collects keep(event) for every event, dropping those where it returns None.
+		The body is parsed incrementally, so only one raw event is held at a time instead of the whole payload.
+		"""
+		async def fetch():
+			with upstream_request_seconds.time(source='norsk_tipping'):
+				async with self.session.get(
+					f"{settings.NORSK_TIPPING_URL}/{extension}",
+					headers={}
+				) as response:
+					upstream_requests_total.inc(source='norsk_tipping', status=response.status)
+					response.raise_for_status()
+					events = [
+						kept async for event in ijson.items_async(response.content, 'eventList.item', use_float=True)
+						if (kept := keep(event)) is not None
+					]
+					return {'eventList': events}
+		return await upstream_scheduler.submit('norsk_tipping', fetch)
+
+	async def get_coming_matches(self, keep: Optional[Callable[[Dict], Optional[Dict]]] = None):
+		if keep is None:
+			return await self.fetch_data("events/FBL")
+		return await self.stream_events("events/FBL", keep)
 	
 	async def get_market_for_match(self, NT_id: str):
 		return await self.fetch_data(f"markets/{NT_id}")
 	
 class ClubELOAPI(ExternalDataSource):
 	async def fetch_data(self, extension):
-		print(f'api.clubelo.com/{extension}')
-		async with self.session.get(
-			f"http://api.clubelo.com/{extension}",
-			headers={}
-		) as response:
-			response.raise_for_status()
-			csv = await response.text()
-			return pd.read_csv(StringIO(csv))
+		logger.debug("Fetching ClubELO %s", extension)
+		async def fetch():
+			with upstream_request_seconds.time(source='clubelo'):
+				async with self.session.get(
+					f"{settings.CLUBELO_URL}/{extension}",
+					headers={}
+				) as response:
+					upstream_requests_total.inc(source='clubelo', status=response.status)
+					response.raise_for_status()
+					csv = await response.text()
+					# Only the predictor fetches ClubELO through here, so pandas is not imported with the app
+					import pandas as pd
+					return pd.read_csv(StringIO(csv))
+		return await upstream_scheduler.submit('clubelo', fetch)
 		
 	async def get_one_days_ranking(self, date): #Date på format YYYY-MM-DD
 		return await self.fetch_data(date)
@@ -0,0 +1,118 @@
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+import logging
+import queue
+import copy
+import json
+import time
+import sys
+
+correlation_id: ContextVar[Optional[str]] = ContextVar('correlation_id', default=None)
+
+# Attributes every LogRecord has; anything else on a record came in through extra= and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'correlation_id'}
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the correlation id and any extra= fields"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'correlation_id', None):
+            entry['correlation_id'] = record.correlation_id
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted by DroppingQueueHandler.prepare before the record crossed threads
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class CorrelationIdFilter(logging.Filter):
+    """Stamps records with the correlation id of the request being handled. Handler filters run in the caller's thread before the record is queued, so the request's context is still current."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` records at WARNING or above per logger and message template every `interval` seconds.
+    The next record let through for a template carries the number suppressed since, so repeated parse failures stay visible without flooding the log.
+    """
+    def __init__(self, burst: int = 5, interval: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows: Dict[Tuple[str, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            window = self._windows[key] = [now, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed
+        if window[1] >= self.burst:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the queue is full the record is dropped and counted instead."""
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        A copy for the writer thread with the message merged with its args, as QueueHandler.prepare makes. The traceback is formatted
+        into exc_text instead of being appended to the message, so JSONFormatter still writes it as the 'exception' field.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging(level: int = logging.INFO, max_queue_size: int = 10000):
+    """Routes the root logger through a bounded queue to a background thread that writes JSON lines to stdout."""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(max_queue_size)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(CorrelationIdFilter())
+    handler.addFilter(RateLimitFilter())
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    """Flushes the queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
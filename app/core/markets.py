@@ -0,0 +1,307 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+import json
+import sys
+import os
+import re
+from .schemas import HUBModel, BoolModel
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MAX_GOALS = 6  # ClubELO publishes exact scores up to six goals in total
+MAX_GD = 6  # GD<-5 and GD>5 are stored as -6 and 6
+
+score_columns = [(home, total - home) for total in range(MAX_GOALS + 1) for home in range(total + 1)]
+gd_columns = ['GD<-5'] + [f'GD={gd}' for gd in range(-5, 6)] + ['GD>5']
+probability_columns = gd_columns + [f'R:{home}-{away}' for home, away in score_columns]
+
+def _cdf_at(cdf: np.ndarray, k: int, offset: int = 0) -> float:
+    """P(X <= k) from a cumulative array whose first entry is P(X <= -offset). Clamped to the published range."""
+    index = k + offset
+    if index < 0:
+        return 0.0
+    return float(cdf[min(index, len(cdf) - 1)])
+
+class ScoreGrids:
+    """
+    Score distributions of every fixture, as float32 arrays with precomputed cumulative sums.
+    grid[i, h, a] is the probability of h-a in fixture i, gd_cdf[i, d + 6] is P(GD <= d) from the GD columns,
+    and total_cdf, home_cdf and away_cdf are P(total <= t), P(home goals <= g) and P(away goals <= g) within the grid.
+    Team names are interned once in teams, and fixtures are found by binary search over the sorted int32 keys
+    home id * len(teams) + away id, so no per-fixture Python objects are kept.
+    """
+    array_names = ['keys', 'rows', 'grid', 'gd_cdf', 'total_cdf', 'home_cdf', 'away_cdf', 'odd', 'mass']
+
+    def __init__(self, teams: List[str], home_ids: np.ndarray, away_ids: np.ndarray, grid: np.ndarray, gd_pmf: np.ndarray):
+        self.teams = [sys.intern(team) for team in teams]
+        self.team_ids = {team: i for i, team in enumerate(self.teams)}
+        keys = home_ids.astype(np.int32) * np.int32(len(self.teams)) + away_ids.astype(np.int32)
+        # Stable, so the first of duplicated fixtures is the one found
+        self.rows = np.argsort(keys, kind='stable').astype(np.int32)
+        self.keys = keys[self.rows]
+        self.grid = grid.astype(np.float32)
+        self.gd_cdf = np.cumsum(gd_pmf, axis=1, dtype=np.float64).astype(np.float32)
+        goals = np.arange(MAX_GOALS + 1)
+        totals = np.add.outer(goals, goals)
+        total_pmf = np.stack([grid[:, totals == t].sum(axis=1) for t in range(MAX_GOALS + 1)], axis=1)
+        self.total_cdf = np.cumsum(total_pmf, axis=1).astype(np.float32)
+        self.home_cdf = np.cumsum(grid.sum(axis=2), axis=1).astype(np.float32)
+        self.away_cdf = np.cumsum(grid.sum(axis=1), axis=1).astype(np.float32)
+        self.odd = grid[:, totals % 2 == 1].sum(axis=1).astype(np.float32)
+        self.mass = grid.sum(axis=(1, 2)).astype(np.float32)
+
+    @classmethod
+    def from_columns(cls, home: List[str], away: List[str], columns: Dict[str, np.ndarray]) -> 'ScoreGrids':
+        """From team names and probability columns in the ClubELO format, keyed by column name. Rows keep their order in the arrays."""
+        grid = np.zeros((len(home), MAX_GOALS + 1, MAX_GOALS + 1))
+        for home_goals, away_goals in score_columns:
+            column = columns.get(f'R:{home_goals}-{away_goals}')
+            if column is not None:
+                grid[:, home_goals, away_goals] = column
+        gd_pmf = np.column_stack([np.nan_to_num(columns[column]) if column in columns else np.zeros(len(home)) for column in gd_columns])
+        teams = list(dict.fromkeys([*home, *away]))
+        team_ids = {team: i for i, team in enumerate(teams)}
+        return cls(teams, np.array([team_ids[team] for team in home]), np.array([team_ids[team] for team in away]), grid, gd_pmf)
+
+    @classmethod
+    def from_fixtures(cls, fixtures: 'pd.DataFrame') -> 'ScoreGrids':
+        """From a fixtures DataFrame indexed by at least Home and Away"""
+        return cls.from_columns(
+            list(fixtures.index.get_level_values('Home')),
+            list(fixtures.index.get_level_values('Away')),
+            {column: fixtures[column].to_numpy(dtype=float) for column in fixtures.columns if column in probability_columns},
+        )
+
+    def position(self, home: str, away: str) -> Optional[int]:
+        """Row of the fixture, or None when it is not published"""
+        home_id, away_id = self.team_ids.get(home), self.team_ids.get(away)
+        if home_id is None or away_id is None:
+            return None
+        key = home_id * len(self.teams) + away_id
+        j = int(np.searchsorted(self.keys, key))
+        if j == len(self.keys) or self.keys[j] != key:
+            return None
+        return int(self.rows[j])
+
+    def get(self, home: str, away: str) -> Optional['ScoreGrid']:
+        i = self.position(home, away)
+        return None if i is None else ScoreGrid(self, i)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held: the arrays, the interned names and the name lookup"""
+        arrays = [getattr(self, name) for name in self.array_names]
+        return sum(array.nbytes for array in arrays) + sum(sys.getsizeof(team) for team in self.teams) + sys.getsizeof(self.team_ids) + sys.getsizeof(self.teams)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in self.array_names:
+            np.save(f'{path}/{name}.npy', getattr(self, name))
+        with open(f'{path}/teams.json', 'w', encoding='utf-8') as f:
+            json.dump(self.teams, f)
+
+    @classmethod
+    def load(cls, path: str) -> 'ScoreGrids':
+        """ScoreGrids written by save, without recomputing the cumulative arrays"""
+        grids = cls.__new__(cls)
+        with open(f'{path}/teams.json', encoding='utf-8') as f:
+            grids.teams = [sys.intern(team) for team in json.load(f)]
+        grids.team_ids = {team: i for i, team in enumerate(grids.teams)}
+        for name in cls.array_names:
+            setattr(grids, name, np.load(f'{path}/{name}.npy'))
+        return grids
+
+class ScoreGrid:
+    """One fixture's row of ScoreGrids. Every market is a handful of lookups in the cumulative arrays."""
+    def __init__(self, grids: ScoreGrids, i: int):
+        self.grids = grids
+        self.i = i
+
+    def gd_cdf(self, k: int) -> float:
+        return _cdf_at(self.grids.gd_cdf[self.i], k, MAX_GD)
+
+    def total_cdf(self, t: int) -> float:
+        return _cdf_at(self.grids.total_cdf[self.i], t)
+
+    def team_cdf(self, side: str, g: int) -> float:
+        cdf = self.grids.home_cdf if side == 'home' else self.grids.away_cdf
+        return _cdf_at(cdf[self.i], g)
+
+    def hub(self) -> HUBModel:
+        return self.european_handicap(0)
+
+    def european_handicap(self, away_minus_home: int) -> HUBModel:
+        """Three-way handicap h:a, decided on GD + h - a."""
+        k = away_minus_home
+        return HUBModel(home=1 - self.gd_cdf(k), draw=self.gd_cdf(k) - self.gd_cdf(k - 1), away=self.gd_cdf(k - 1))
+
+    def double_chance(self) -> HUBModel:
+        """Selections in Norsk Tipping order: home or draw, home or away, draw or away"""
+        hub = self.hub()
+        return HUBModel(home=hub.home + hub.draw, draw=hub.home + hub.away, away=hub.draw + hub.away)
+
+    def total_over(self, line: float) -> Optional[BoolModel]:
+        """
+        Scores above six goals are not published, but they all count as over 6.5 or lower, so under is exact and over is its complement.
+        Higher lines split the unpublished tail, so they get no price.
+        """
+        if line > MAX_GOALS + 0.5:
+            return None
+        under = self.total_cdf(int(np.floor(line)))
+        return BoolModel(true=1 - under, false=under)
+
+    def team_total_over(self, side: str, line: float) -> BoolModel:
+        under = self.team_cdf(side, int(np.floor(line)))
+        side_total = self.team_cdf(side, MAX_GOALS)
+        return BoolModel(true=side_total - under, false=under)
+
+    def odd_even(self) -> BoolModel:
+        return BoolModel(true=self.grids.odd[self.i], false=self.grids.mass[self.i] - self.grids.odd[self.i])
+
+    def both_teams_to_score(self) -> BoolModel:
+        grid = self.grids.grid[self.i]
+        no = grid[0, :].sum() + grid[1:, 0].sum()
+        return BoolModel(true=self.grids.mass[self.i] - no, false=no)
+
+    def clean_sheet(self, side: str) -> BoolModel:
+        """side keeps a clean sheet: the other team scores nothing"""
+        other = 'away' if side == 'home' else 'home'
+        yes = self.team_cdf(other, 0)
+        return BoolModel(true=yes, false=self.grids.mass[self.i] - yes)
+
+    def win_to_nil(self, side: str) -> BoolModel:
+        grid = self.grids.grid[self.i]
+        yes = grid[1:, 0].sum() if side == 'home' else grid[0, 1:].sum()
+        return BoolModel(true=yes, false=self.grids.mass[self.i] - yes)
+
+    def correct_score(self, home_goals: int, away_goals: int) -> float:
+        if home_goals + away_goals > MAX_GOALS:
+            return 0.0
+        return float(self.grids.grid[self.i, home_goals, away_goals])
+
+    def _asian(self, cdf: Callable[[int], float], line: float) -> BoolModel:
+        """
+        Two-way line on a discrete variable X with pushes and quarter lines. true is the first selection, winning when X > line.
+        Quarter lines are two half stakes on the neighbouring lines. The probabilities are conditional on the stake not being returned, which keeps
+        odds * probability > 1 exactly when the bet has positive expected value.
+        """
+        halves = [line - 0.25, line + 0.25] if (line * 4) % 2 == 1 else [line]
+        win = lose = 0.0
+        for half in halves:
+            if float(half).is_integer():
+                win += 1 - cdf(int(half))
+                lose += cdf(int(half) - 1)
+            else:
+                win += 1 - cdf(int(np.floor(half)))
+                lose += cdf(int(np.floor(half)))
+        decided = win + lose
+        if decided == 0:
+            return BoolModel(true=0, false=0)
+        return BoolModel(true=win / decided, false=lose / decided)
+
+    def asian_handicap(self, home_line: float) -> BoolModel:
+        """Home covers when GD + home_line > 0"""
+        return self._asian(self.gd_cdf, -home_line)
+
+    def asian_total(self, line: float) -> Optional[BoolModel]:
+        """No price above 6.5 goals, where a half of the stake would be decided inside the unpublished tail, as in total_over"""
+        if line > MAX_GOALS + 0.5:
+            return None
+        return self._asian(self.total_cdf, line)
+
+Probabilities = Union[HUBModel, BoolModel]
+
+def score_outcomes(grid: ScoreGrid) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The fixture's distribution as (home goals, away goals, probability) arrays: the published exact scores, plus one outcome per GD bucket for
+    the mass above six goals, at the lowest score with that goal difference. Every market on the match is settled on these outcomes, so bets on
+    the same match are correlated exactly as the grid says. Only team totals settle approximately on the tail outcomes.
+    """
+    home, away = np.array(score_columns).T
+    probability = grid.grids.grid[grid.i, home, away].astype(float)
+    gd_pmf = np.diff(grid.grids.gd_cdf[grid.i].astype(float), prepend=0.0)
+    grid_gd_pmf = np.bincount(np.clip(home - away, -MAX_GD, MAX_GD) + MAX_GD, weights=probability, minlength=2 * MAX_GD + 1)
+    # The GD<-5 and GD>5 buckets go to 0-7 and 7-0, the others to seven or eight goals depending on parity
+    tail_gd = np.arange(-MAX_GD, MAX_GD + 1)
+    tail_gd = np.where(np.abs(tail_gd) == MAX_GD, np.sign(tail_gd) * (MAX_GOALS + 1), tail_gd)
+    tail_total = np.where(np.abs(tail_gd) > MAX_GD, MAX_GOALS + 1, MAX_GOALS + 2 - (tail_gd % 2))
+    tail_home, tail_away = (tail_total + tail_gd) // 2, (tail_total - tail_gd) // 2
+    tail_probability = np.clip(gd_pmf - grid_gd_pmf, 0.0, None)
+    probability = np.concatenate([probability, tail_probability])
+    return np.concatenate([home, tail_home]), np.concatenate([away, tail_away]), probability / probability.sum()
+
+Settlement = Tuple[np.ndarray, np.ndarray]
+
+def _settle(*wins: np.ndarray) -> Settlement:
+    won = np.stack(wins).astype(float)
+    return won, np.zeros_like(won)
+
+def _settle_asian(x: np.ndarray, line: float) -> Settlement:
+    """Asian line on x as in ScoreGrid._asian, with the stake on a quarter line split over the two neighbouring lines"""
+    halves = [line - 0.25, line + 0.25] if (line * 4) % 2 == 1 else [line]
+    won, returned = np.zeros((2, len(x))), np.zeros((2, len(x)))
+    for half in halves:
+        won[0] += (x > half) / len(halves)
+        won[1] += (x < half) / len(halves)
+        returned += (x == half) / len(halves)
+    return won, returned
+
+def _goals(home: np.ndarray, away: np.ndarray, side: str) -> np.ndarray:
+    return home if side == 'home' else away
+
+# Norsk Tipping market names, with the team names replaced by home and away, and the probabilities and settlement they map to.
+# A settlement gives, per selection and outcome, the share of the stake paid at the odds and the share returned.
+market_patterns = [
+    (r'HUB', lambda grid: grid.hub(),
+        lambda h, a: _settle(h > a, h == a, h < a)),
+    (r'Dobbelsjanse', lambda grid: grid.double_chance(),
+        lambda h, a: _settle(h >= a, h != a, h <= a)),
+    (r'Totalt antall mål - Over/Under (\d+\.5)', lambda grid, line: grid.total_over(float(line)),
+        lambda h, a, line: _settle(h + a > float(line), h + a < float(line))),
+    (r'Totalt antall (home|away) mål over/under (\d+\.5)', lambda grid, side, line: grid.team_total_over(side, float(line)),
+        lambda h, a, side, line: _settle(_goals(h, a, side) > float(line), _goals(h, a, side) < float(line))),
+    (r'Totalt antall mål - oddetall/partall', lambda grid: grid.odd_even(),
+        lambda h, a: _settle((h + a) % 2 == 1, (h + a) % 2 == 0)),
+    (r'Begge lag scorer', lambda grid: grid.both_teams_to_score(),
+        lambda h, a: _settle((h > 0) & (a > 0), (h == 0) | (a == 0))),
+    (r'(home|away) holder nullen', lambda grid, side: grid.clean_sheet(side),
+        lambda h, a, side: _settle(_goals(a, h, side) == 0, _goals(a, h, side) > 0)),
+    (r'(home|away) vinner og holder nullen', lambda grid, side: grid.win_to_nil(side),
+        lambda h, a, side: _settle((_goals(h, a, side) > 0) & (_goals(a, h, side) == 0), (_goals(h, a, side) == 0) | (_goals(a, h, side) > 0))),
+    (r'Handikap 3-veis (\d+):(\d+)', lambda grid, home, away: grid.european_handicap(int(away) - int(home)),
+        lambda h, a, home, away: _settle(h - a + int(home) - int(away) > 0, h - a + int(home) - int(away) == 0, h - a + int(home) - int(away) < 0)),
+    (r'Asiatisk handikap ([+-]?\d+(?:\.\d+)?)', lambda grid, line: grid.asian_handicap(float(line)),
+        lambda h, a, line: _settle_asian(h - a, -float(line))),
+    (r'Asiatisk over/under (\d+(?:\.\d+)?)', lambda grid, line: grid.asian_total(float(line)),
+        lambda h, a, line: _settle_asian(h + a, float(line))),
+]
+_compiled_market_patterns = [(re.compile(f'^{pattern}$'), derive, settle) for pattern, derive, settle in market_patterns]
+
+@lru_cache(maxsize=1024)
+def _match_market(market_name: str) -> Optional[Tuple[Callable, Callable, Tuple[str, ...]]]:
+    for pattern, derive, settle in _compiled_market_patterns:
+        match = pattern.match(market_name)
+        if match:
+            return derive, settle, match.groups()
+    return None
+
+def find_market(market_name: str) -> Optional[Callable[[ScoreGrid], Probabilities]]:
+    """
+    The derivation for a market name, or None if no pattern matches. Cached, since the same names repeat for every match.
+    The derivation itself returns None for lines the published scores cannot price.
+    """
+    matched = _match_market(market_name)
+    if matched is None:
+        return None
+    derive, _, arguments = matched
+    return lambda grid: derive(grid, *arguments)
+
+def find_settlement(market_name: str) -> Optional[Callable[[np.ndarray, np.ndarray], Settlement]]:
+    """How a market settles on arrays of home and away goals, or None if no pattern matches"""
+    matched = _match_market(market_name)
+    if matched is None:
+        return None
+    _, settle, arguments = matched
+    return lambda home, away: settle(home, away, *arguments)
@@ -0,0 +1,126 @@
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Literal, Optional, Sequence, Tuple
+from .schemas import MatchSummaryModel
+import base64
+import bisect
+import heapq
+import json
+
+SortKey = Literal['start_time', 'ev']
+CursorKey = Tuple[float, str]
+
+def best_expected_value(match: MatchSummaryModel) -> float:
+    return max(match.expected_value.home, match.expected_value.draw, match.expected_value.away)
+
+def encode_cursor(sort: SortKey, key: CursorKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode()
+
+def decode_cursor(cursor: str, sort: SortKey) -> CursorKey:
+    """The sort key of the last match of the previous page. Raises ValueError for cursors that are malformed or from another sort."""
+    try:
+        cursor_sort, value, NT_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        key = (float(value), str(NT_id))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+    if cursor_sort != sort:
+        raise ValueError(f'The cursor is for sort={cursor_sort}, not sort={sort}')
+    return key
+
+@dataclass
+class MatchQuery:
+    """
+    Filters, order and page of /matches. A match is kept when at least one of its outcomes has odds within [min_odds, max_odds]
+    and an expected value of at least min_ev. Sorting by ev puts the highest expected value of any outcome first.
+    """
+    tournaments: Sequence[str] = ()
+    start_from: Optional[datetime] = None
+    start_to: Optional[datetime] = None
+    min_odds: Optional[float] = None
+    max_odds: Optional[float] = None
+    min_ev: Optional[float] = None
+    sort: SortKey = 'start_time'
+    limit: Optional[int] = None
+    cursor: Optional[CursorKey] = None
+
+    @property
+    def filters_outcomes(self) -> bool:
+        return self.min_odds is not None or self.max_odds is not None or self.min_ev is not None
+
+    def accepts_outcomes(self, match: MatchSummaryModel) -> bool:
+        for outcome in ('home', 'draw', 'away'):
+            odds = getattr(match.odds, outcome)
+            if self.min_odds is not None and odds < self.min_odds:
+                continue
+            if self.max_odds is not None and odds > self.max_odds:
+                continue
+            if self.min_ev is not None and getattr(match.expected_value, outcome) < self.min_ev:
+                continue
+            return True
+        return False
+
+class MatchIndex:
+    """
+    Parsed matches in start-time order, with the indexes /matches queries are answered from: the start times as a sorted array for bisecting
+    the kickoff window and cursor, each tournament's ranks in that order, and the ranks ordered by expected value. A page only visits the
+    matches it returns and those filtered out on the way, not the whole feed. MatchesService builds it once per events payload, next to the
+    payload in odds_payloads, so requests only pay for query().
+    """
+    def __init__(self, matches: List[MatchSummaryModel]):
+        # The feed order, for responses without a query
+        self.feed = list(matches)
+        start_keys = [(match.start_time.timestamp(), match.NT_id) for match in self.feed]
+        order = sorted(range(len(self.feed)), key=start_keys.__getitem__)
+        self.matches = [self.feed[i] for i in order]
+        self.start_keys = [start_keys[i] for i in order]
+        self.start_times = [start_time for start_time, _ in self.start_keys]
+        self.by_tournament: Dict[str, List[int]] = {}
+        for rank, match in enumerate(self.matches):
+            self.by_tournament.setdefault(match.tournament, []).append(rank)
+        ev_keys = [(-best_expected_value(match), match.NT_id) for match in self.matches]
+        self.ev_order = sorted(range(len(self.matches)), key=ev_keys.__getitem__)
+        self.ev_keys = [ev_keys[rank] for rank in self.ev_order]
+
+    def _sort_key(self, sort: SortKey, match: MatchSummaryModel) -> CursorKey:
+        if sort == 'ev':
+            return (-best_expected_value(match), match.NT_id)
+        return (match.start_time.timestamp(), match.NT_id)
+
+    def _ranks_by_start(self, lo: int, hi: int, tournaments: Sequence[str]) -> Iterator[int]:
+        if not tournaments:
+            return iter(range(lo, hi))
+        lists = [self.by_tournament.get(tournament, []) for tournament in dict.fromkeys(tournaments)]
+        return heapq.merge(*(islice(ranks, bisect.bisect_left(ranks, lo), bisect.bisect_left(ranks, hi)) for ranks in lists))
+
+    def _ranks_by_ev(self, lo: int, hi: int, tournaments: Sequence[str], cursor: Optional[CursorKey]) -> Iterator[int]:
+        start = 0 if cursor is None else bisect.bisect_right(self.ev_keys, cursor)
+        wanted = set(tournaments)
+        return (
+            rank for rank in islice(self.ev_order, start, None)
+            if lo <= rank < hi and (not wanted or self.matches[rank].tournament in wanted)
+        )
+
+    def query(self, query: MatchQuery) -> Tuple[List[MatchSummaryModel], Optional[str]]:
+        """The page of matches and the cursor of the next page, None on the last page"""
+        lo = 0 if query.start_from is None else bisect.bisect_left(self.start_times, query.start_from.timestamp())
+        hi = len(self.matches) if query.start_to is None else bisect.bisect_right(self.start_times, query.start_to.timestamp())
+        if query.sort == 'ev':
+            ranks = self._ranks_by_ev(lo, hi, query.tournaments, query.cursor)
+        else:
+            if query.cursor is not None:
+                lo = max(lo, bisect.bisect_right(self.start_keys, query.cursor))
+            ranks = self._ranks_by_start(lo, hi, query.tournaments)
+
+        page = []
+        for rank in ranks:
+            match = self.matches[rank]
+            if query.filters_outcomes and not query.accepts_outcomes(match):
+                continue
+            page.append(match)
+            if query.limit is not None and len(page) > query.limit:
+                break
+        if query.limit is None or len(page) <= query.limit:
+            return page, None
+        page = page[:query.limit]
+        return page, encode_cursor(query.sort, self._sort_key(query.sort, page[-1]))
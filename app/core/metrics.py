@@ -0,0 +1,181 @@
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+import threading
+import bisect
+import time
+import sys
+import os
+from app.config.config import settings
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def labels_key(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Observing is a bisect and two additions, so it is cheap enough for per-lookup timing.
+    Like the other metrics it is updated from the event loop and from the worker threads of sync endpoints, so updates and renders take its lock.
+    """
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = labels_key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        with self._lock:
+            series = [(labels, (list(counts), total)) for labels, (counts, total) in self.series.items()]
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(labels, (("le", le),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines)
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.series: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = labels_key(labels)
+        with self._lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> str:
+        with self._lock:
+            series = list(self.series.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_format_labels(labels)} {value}' for labels, value in series]
+        return '\n'.join(lines)
+
+class Gauge:
+    """
+    Gauge set directly, or computed at scrape time by a callback returning {labels dict as tuple: value}. Callbacks may read state the
+    event loop owns, such as the scheduler's queues, so the registry is rendered on the loop.
+    """
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], Dict[Labels, float]]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.series: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = labels_key(labels)
+        with self._lock:
+            self.series[key] = value
+
+    def render(self) -> str:
+        with self._lock:
+            series = dict(self.series)
+        if self.callback:
+            series.update(self.callback())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        lines += [f'{self.name}{_format_labels(labels)} {value}' for labels, value in series.items()]
+        return '\n'.join(lines)
+
+class MetricsRegistry:
+    """Process-wide metrics, rendered in the Prometheus text format"""
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+def snapshot_ages() -> Dict[Labels, float]:
+    ages = {}
+    now = time.time()
+    for snapshot, path in [('elo_ratings', settings.ELO_CSV_PATH), ('fixtures', settings.FIXTURES_CSV_PATH), ('current_form', settings.CURRENT_DATA_CSV_PATH)]:
+        try:
+            ages[labels_key({'snapshot': snapshot})] = now - os.stat(path).st_mtime
+        except FileNotFoundError:
+            continue
+    return ages
+
+metrics = MetricsRegistry()
+stage_seconds = metrics.register(Histogram('betmax_stage_seconds', 'Time spent per request and background stage'))
+upstream_request_seconds = metrics.register(Histogram('betmax_upstream_request_seconds', 'Latency of upstream API calls'))
+upstream_requests_total = metrics.register(Counter('betmax_upstream_requests_total', 'Upstream API calls by source and outcome'))
+cache_requests_total = metrics.register(Counter('betmax_cache_requests_total', 'Cache lookups by cache and result (hit or miss)'))
+snapshot_age_seconds = metrics.register(Gauge('betmax_snapshot_age_seconds', 'Seconds since each snapshot file was written', snapshot_ages))
+snapshot_bytes = metrics.register(Gauge('betmax_snapshot_bytes', 'Memory held by each loaded snapshot'))
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread from a background thread every interval seconds, so sync endpoints and run_in_threadpool work in
+    the AnyIO worker threads show up next to the event loop. Each stack starts with its thread's name, and threads blocked in a wait
+    (idle workers, the logging listener, the event loop's select) are left out. Used for single opt-in requests; collapsed() returns the
+    samples in the collapsed-stack format flame graph tools read.
+    """
+    idle_files = ('threading.py', 'queue.py', 'selectors.py')
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.samples = _StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self._thread.ident or os.path.basename(frame.f_code.co_filename) in self.idle_files:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common()) + '\n'
@@ -1,39 +1,38 @@
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from .schemas import MatchSummaryModel, ELOModel, MatchDetailModel, HUBModel, MarketModel, BoolModel
 from .repositories import TeamRatingsRepository, FixturesRepository
-from app.utils.utils import tournaments_of_interest
+from app.utils.utils import tournaments_of_interest, elo_league_parameters, calculate_elo_probs_batch, DRAW_FACTOR, HOME_ADVANTAGE
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
 
 class MatchParser:
     """Handles parsing of raw match data into MatchModel objects"""
     def __init__(self, ratings_repo: TeamRatingsRepository, fixtures_repo: FixturesRepository):
         self.ratings_repo = ratings_repo
         self.fixtures_repo = fixtures_repo
-        self.market_parsers = {
-            'HUB': self.fixtures_repo.get_match_probabilities,
-            'Totalt antall mål - Over/Under 0.5': self.fixtures_repo.get_total_goals_over_05_probs,
-            'Totalt antall mål - Over/Under 1.5': self.fixtures_repo.get_total_goals_over_15_probs,
-            'Totalt antall mål - Over/Under 2.5': self.fixtures_repo.get_total_goals_over_25_probs,
-            'Totalt antall mål - Over/Under 3.5': self.fixtures_repo.get_total_goals_over_35_probs,
-            'Totalt antall mål - Over/Under 4.5': self.fixtures_repo.get_total_goals_over_45_probs,
-            'Totalt antall mål - Over/Under 5.5': self.fixtures_repo.get_total_goals_over_55_probs,
-            'Totalt antall mål - oddetall/partall': self.fixtures_repo.get_total_goals_odd_even_probs,
-            'Totalt antall home mål over/under 0.5': self.fixtures_repo.get_total_home_goals_over_05_probs,
-            'Totalt antall home mål over/under 1.5': self.fixtures_repo.get_total_home_goals_over_15_probs,
-            'Totalt antall home mål over/under 2.5': self.fixtures_repo.get_total_home_goals_over_25_probs,
-            'Totalt antall away mål over/under 0.5': self.fixtures_repo.get_total_away_goals_over_05_probs,
-            'Totalt antall away mål over/under 1.5': self.fixtures_repo.get_total_away_goals_over_15_probs,
-            'Totalt antall away mål over/under 2.5': self.fixtures_repo.get_total_away_goals_over_25_probs,
-            'home holder nullen': self.fixtures_repo.get_home_clean_sheet_probs,
-            'away holder nullen': self.fixtures_repo.get_away_clean_sheet_probs,
-            'home vinner og holder nullen': self.fixtures_repo.get_home_win_and_clean_sheet_probs,
-            'away vinner og holder nullen': self.fixtures_repo.get_away_win_and_clean_sheet_probs,
-            'Begge lag scorer': self.fixtures_repo.get_both_teams_to_score_probs,
-            'Handikap 3-veis 0:3': self.fixtures_repo.get_handicap_03_probs,
-            'Handikap 3-veis 0:2': self.fixtures_repo.get_handicap_02_probs,
-            'Handikap 3-veis 0:1': self.fixtures_repo.get_handicap_01_probs,
-            'Handikap 3-veis 1:0': self.fixtures_repo.get_handicap_10_probs,
-            'Handikap 3-veis 2:0': self.fixtures_repo.get_handicap_20_probs,
+
+    def compact_event(self, event: Dict) -> Optional[Dict]:
+        """Drops events outside tournaments_of_interest and reduces the rest to the fields parse_match reads"""
+        tournament = event.get("tournament") or {}
+        if tournament.get("name") not in tournaments_of_interest:
+            return None
+        main_market = event.get("mainMarket") or {}
+        return {
+            "eventId": event.get("eventId"),
+            "homeParticipant": event.get("homeParticipant"),
+            "awayParticipant": event.get("awayParticipant"),
+            "startTime": event.get("startTime"),
+            "tournament": {"name": tournament.get("name")},
+            "mainMarket": {
+                "marketName": main_market.get("marketName"),
+                "selections": [
+                    {key: value for key, value in selection.items() if key == "selectionOdds"}
+                    for selection in main_market.get("selections", [])
+                ],
+            },
         }
 
     def is_valid_match(self, match: Dict) -> bool:
@@ -71,7 +70,43 @@ class MatchParser:
         except (IndexError, TypeError):
             return None
 
-    def parse_match(self, match: Dict) -> Optional[MatchSummaryModel]:
+    def get_probabilities(self, matches: List[Dict]) -> List[Tuple[Optional[HUBModel], str]]:
+        """
+        HUB probabilities and their source for each match. ClubELO fixture probabilities are used where the fixture is published.
+        The other matches get probabilities from the ELO formula, computed in one batch from the current ratings with per-tournament draw factor and home advantage.
+        Matches where a team has no rating get (None, 'elo_formula').
+        """
+        results = []
+        uncovered = []
+        for i, match in enumerate(matches):
+            probs = self.fixtures_repo.get_match_probabilities(match.get("homeParticipant", ''), match.get("awayParticipant", ''))
+            if probs.home == 0 and probs.draw == 0 and probs.away == 0:
+                uncovered.append(i)
+            results.append((probs, 'clubelo_fixtures'))
+        if not uncovered:
+            return results
+
+        home_elo = self.ratings_repo.get_elo_ratings([matches[i].get("homeParticipant", '') for i in uncovered])
+        away_elo = self.ratings_repo.get_elo_ratings([matches[i].get("awayParticipant", '') for i in uncovered])
+        parameters = np.array([
+            elo_league_parameters.get(matches[i].get("tournament", {}).get("name", ''), (DRAW_FACTOR, HOME_ADVANTAGE))
+            for i in uncovered
+        ])
+        home, draw, away = calculate_elo_probs_batch(home_elo, away_elo, parameters[:, 0], parameters[:, 1])
+        for i, h, d, a in zip(uncovered, home, draw, away):
+            probs = None if np.isnan(h) else HUBModel(home=h, draw=d, away=a)
+            results[i] = (probs, 'elo_formula')
+        return results
+
+    def parse_matches(self, matches: List[Dict]) -> List[MatchSummaryModel]:
+        valid_matches = [match for match in matches if self.is_valid_match(match)]
+        return [
+            parsed_match
+            for match, (probs, probs_source) in zip(valid_matches, self.get_probabilities(valid_matches))
+            if (parsed_match := self.parse_match(match, probs, probs_source)) is not None
+        ]
+
+    def parse_match(self, match: Dict, probs: Optional[HUBModel] = None, probs_source: str = 'clubelo_fixtures') -> Optional[MatchSummaryModel]:
         if not self.is_valid_match(match):
             return None
 
@@ -82,23 +117,23 @@ class MatchParser:
             start_time = datetime.fromisoformat(match.get("startTime", ''))
             tournament = match.get("tournament", {}).get("name", '')
             odds = self.parse_odds(match.get('mainMarket', {}))
-            probs = self.fixtures_repo.get_match_probabilities(
-                home_team, 
-                away_team, 
-            )
+            if probs is None and probs_source == 'clubelo_fixtures':
+                probs, probs_source = self.get_probabilities([match])[0]
+
+            if not odds or not probs or (probs.home == 0 and probs.draw == 0 and probs.away == 0):
+                return None
+
             elo = ELOModel(
                 home_elo=self.ratings_repo.get_elo_rating(home_team),
                 away_elo=self.ratings_repo.get_elo_rating(away_team),
-                probs=probs
+                probs=probs,
+                probs_source=probs_source
             )
             expected_value = HUBModel(
                 home=odds.home * probs.home,
                 draw=odds.draw * probs.draw,
                 away=odds.away * probs.away
             )
-            
-            if not odds or not probs or (probs.home == 0 and probs.draw == 0 and probs.away == 0):
-                return None
 
             return MatchSummaryModel(
                 NT_id=NT_id,
@@ -111,7 +146,7 @@ class MatchParser:
                 expected_value=expected_value
             )
         except (ValueError, TypeError, KeyError) as e:
-            print(f"Error parsing match: {e}")  # You might want to use proper logging here
+            logger.warning("Error parsing match: %s", e, extra={'NT_id': match.get("eventId")})
             return None
     
     def parse_detailed_match(self, match: Dict, markets: list) -> Optional[MatchDetailModel]:
@@ -121,15 +156,13 @@ class MatchParser:
             away_team = match.get("awayParticipant", '')
             start_time=datetime.fromisoformat(match.get("startTime", ''))
             tournament=match.get("tournament", {}).get("name", '')
-            probs = self.fixtures_repo.get_match_probabilities(
-                home_team, 
-                away_team, 
-            )
+            probs, probs_source = self.get_probabilities([match])[0]
             markets = [processed_market for market in markets if (processed_market := self.parse_market(market, home_team, away_team)) is not None]
             elo=ELOModel(
                 home_elo=self.ratings_repo.get_elo_rating(home_team),
                 away_elo=self.ratings_repo.get_elo_rating(away_team),
-                probs=probs
+                probs=probs or HUBModel(home=0, draw=0, away=0),
+                probs_source=probs_source
             )
             return MatchDetailModel(
                 NT_id=NT_id,
@@ -141,33 +174,22 @@ class MatchParser:
                 elo=elo
             )
         except (ValueError, TypeError, KeyError) as e:
-            print(f"Error parsing match: {e}")  # You might want to use proper logging here
+            logger.warning("Error parsing detailed match: %s", e, extra={'NT_id': match.get("eventId")})
             return None
         
     def parse_market(self, market: Dict, home_team: str, away_team: str) -> Optional[MarketModel]:
-        market_name = market.get('marketName', '')
+        market_name = market.get('marketName', '').replace(home_team, 'home').replace(away_team, 'away')
         selections = market.get('selections', [])
-        if len(selections) < 2:
+        if len(selections) not in (2, 3):
             return None
-        elif len(selections) == 2:
+        probs = self.fixtures_repo.get_market_probabilities(home_team, away_team, market_name)
+        if len(selections) == 2 and isinstance(probs, BoolModel):
             odds = BoolModel(true=selections[0].get('selectionOdds'), false=selections[1].get('selectionOdds'))
-            market_name = market_name.replace(home_team, 'home').replace(away_team, 'away')
-            market_parser = self.market_parsers.get(market_name, lambda *args, **kwargs: None)
-            probs = market_parser(home_team, away_team)
-            if probs is None:
-                return None
-            probs = BoolModel(true=probs.true, false=probs.false)
             expected_value = BoolModel(true=odds.true * probs.true, false=odds.false * probs.false)
             return MarketModel(name=market_name, selections=odds, probs=probs, expected_value=expected_value)
-        elif len(selections) == 3:
+        elif len(selections) == 3 and isinstance(probs, HUBModel):
             odds = HUBModel(home=selections[0].get('selectionOdds'), draw=selections[1].get('selectionOdds'), away=selections[2].get('selectionOdds'))
-            market_parser = self.market_parsers.get(market_name, lambda *args, **kwargs: None)
-            probs = market_parser(home_team, away_team)
-            if probs is None:
-                return None
-            probs = HUBModel(home=probs.home, draw=probs.draw, away=probs.away)
             expected_value = HUBModel(home=odds.home * probs.home,draw=odds.draw * probs.draw,away=odds.away * probs.away)
             return MarketModel(name=market_name, selections=odds, probs=probs, expected_value=expected_value)
         else:
             return None
-
@@ -1,19 +1,56 @@
 from dataclasses import dataclass
-from typing import Dict
-import pandas as pd
-from .schemas import HUBModel, BoolModel
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
+import sys
+import os
+from .schemas import HUBModel
+from .metrics import stage_seconds, snapshot_bytes
+from .markets import ScoreGrids, ScoreGrid, Probabilities, find_market, probability_columns
+from .calibration import load_calibration
+from app.config.config import settings
+from app.utils.utils import read_csv_columns, float_column
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Parsed snapshots per file, reused until the file changes: (version, parsed snapshot)
+ratings_snapshots: Dict[str, Tuple[int, Dict[str, float]]] = {}
+fixtures_snapshots: Dict[str, Tuple[Tuple[int, int], ScoreGrids]] = {}
+
+def ratings_version(filepath: str) -> int:
+    return os.stat(filepath).st_mtime_ns
+
+def fixtures_version(filepath: str, calibration_path: Optional[str] = settings.CALIBRATION_PATH) -> Tuple[int, int]:
+    """The modification times of the fixtures file and of the calibration applied to it (0 without one), as the stored grids depend on both"""
+    calibrated = calibration_path is not None and os.path.exists(calibration_path)
+    return os.stat(filepath).st_mtime_ns, os.stat(calibration_path).st_mtime_ns if calibrated else 0
+
+def report_snapshot_bytes():
+    for ratings in ratings_snapshots.values():
+        snapshot_bytes.set(sys.getsizeof(ratings[1]) + sum(sys.getsizeof(club) + sys.getsizeof(elo) for club, elo in ratings[1].items()), snapshot='elo_ratings')
+    for grids in fixtures_snapshots.values():
+        snapshot_bytes.set(grids[1].nbytes, snapshot='fixtures')
 
 @dataclass
 class TeamRatingsRepository:
     """Handles access to team ELO ratings data"""
-    elo_ratings: pd.DataFrame
+    elo_ratings: Dict[str, float]
     name_mapping: Dict[str, str]
     default_elo: float = 1499
 
     @classmethod
     def from_csv(cls, filepath: str, name_mapping: Dict[str, str]) -> 'TeamRatingsRepository':
+        """From a ratings CSV with the club names in the first column and an Elo column, parsed once per version of the file"""
+        version = ratings_version(filepath)
+        cached = ratings_snapshots.get(filepath)
+        if cached is None or cached[0] != version:
+            columns = read_csv_columns(filepath)
+            clubs = next(iter(columns.values()), [])
+            elo_ratings = {sys.intern(club): float(elo) for club, elo in zip(clubs, float_column(columns.get('Elo', [])))}
+            cached = ratings_snapshots[filepath] = (version, elo_ratings)
+            report_snapshot_bytes()
         return cls(
-            elo_ratings=pd.read_csv(filepath, index_col=0),
+            elo_ratings=cached[1],
             name_mapping=name_mapping
         )
 
@@ -21,196 +58,64 @@ class TeamRatingsRepository:
         if not team_name:
             return self.default_elo
         mapped_name = self.name_mapping.get(team_name, team_name)
-        try:
-            return self.elo_ratings.loc[mapped_name]['Elo']
-        except KeyError:
-            return self.default_elo
+        with stage_seconds.time(stage='ratings_lookup'):
+            return self.elo_ratings.get(mapped_name, self.default_elo)
+
+    def get_elo_ratings(self, team_names: List[str]) -> np.ndarray:
+        """Ratings for many teams at once, NaN for teams ClubELO does not know"""
+        mapped_names = [self.name_mapping.get(team_name, team_name) for team_name in team_names]
+        with stage_seconds.time(stage='ratings_lookup'):
+            return np.array([self.elo_ratings.get(name, np.nan) for name in mapped_names], dtype=float)
+
 
 class FixturesRepository:
     """Handles access to fixtures and probability data"""
-    def __init__(self, fixtures_df: pd.DataFrame, name_mapping: Dict[str, str]):
-        self.fixtures = fixtures_df
+    def __init__(self, score_grids: ScoreGrids, name_mapping: Dict[str, str]):
+        self.score_grids = score_grids
         self.name_mapping = name_mapping
 
     @classmethod
-    def from_csv(cls, filepath: str, name_mapping: Dict[str, str]) -> 'FixturesRepository':
-        return cls(pd.read_csv(filepath, index_col=['Home', 'Away']), name_mapping=name_mapping)
-
-
-    def _get_hub_probs(self, home_team: str, away_team: str, home_cols: list, draw_cols: list, away_cols: list) -> HUBModel:
-        try:
-            home = self.name_mapping.get(home_team, home_team)
-            away = self.name_mapping.get(away_team, away_team)
-            row = self.fixtures.loc[home, away]
-            return HUBModel(
-                home=sum(row[col] for col in home_cols),
-                draw=sum(row[col] for col in draw_cols),
-                away=sum(row[col] for col in away_cols)
-            )
-        except KeyError:
-            return HUBModel(home=0, draw=0, away=0)
-    
-    def _get_bool_probs(self, home_team: str, away_team: str, true_cols: list, false_cols: list) -> BoolModel:
-        try:
-            home = self.name_mapping.get(home_team, home_team)
-            away = self.name_mapping.get(away_team, away_team)
-            row = self.fixtures.loc[home, away]
-            return BoolModel(
-                true=sum(row[col] for col in true_cols),
-                false=sum(row[col] for col in false_cols)
-            )
-        except KeyError:
-            return BoolModel(true=0, false=0)
+    def from_dataframe(cls, fixtures_df: 'pd.DataFrame', name_mapping: Dict[str, str]) -> 'FixturesRepository':
+        return cls(ScoreGrids.from_fixtures(fixtures_df), name_mapping)
 
+    @classmethod
+    def from_csv(cls, filepath: str, name_mapping: Dict[str, str], calibration_path: Optional[str] = settings.CALIBRATION_PATH) -> 'FixturesRepository':
+        """
+        From a fixtures CSV in the ClubELO format, parsed once per version of the file and of the calibration. When calibration_path
+        holds a calibration, it is applied to the probabilities here, so lookups return calibrated probabilities at no extra cost.
+        """
+        version = fixtures_version(filepath, calibration_path)
+        cached = fixtures_snapshots.get(filepath)
+        if cached is None or cached[0] != version:
+            columns = read_csv_columns(filepath, ['Home', 'Away', *probability_columns])
+            home, away = columns.pop('Home'), columns.pop('Away')
+            probabilities = {name: float_column(values) for name, values in columns.items()}
+            calibration = load_calibration(calibration_path)
+            if calibration is not None:
+                probabilities = calibration.calibrate_columns(probabilities)
+            grids = ScoreGrids.from_columns(home, away, probabilities)
+            cached = fixtures_snapshots[filepath] = (version, grids)
+            report_snapshot_bytes()
+        return cls(cached[1], name_mapping)
 
     def get_match_probabilities(self, home_team: str, away_team: str) -> HUBModel:
-        home_cols = ['GD=1', 'GD=2', 'GD=3', 'GD=4', 'GD=5', 'GD>5']
-        draw_cols = ['GD=0']
-        away_cols = ['GD=-1', 'GD=-2', 'GD=-3', 'GD=-4', 'GD=-5', 'GD<-5']
-
-        return self._get_hub_probs(home_team, away_team, home_cols, draw_cols, away_cols)
-    
-    def get_total_goals_over_05_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-1','R:1-0','R:0-2','R:1-1','R:2-0','R:0-3','R:1-2','R:2-1','R:3-0','R:0-4','R:1-3','R:2-2','R:3-1','R:4-0','R:0-5','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0','R:0-6','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-
-    def get_total_goals_over_15_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-2','R:1-1','R:2-0','R:0-3','R:1-2','R:2-1','R:3-0','R:0-4','R:1-3','R:2-2','R:3-1','R:4-0','R:0-5','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0','R:0-6','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0','R:0-1','R:1-0']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-
-    def get_total_goals_over_25_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-3','R:1-2','R:2-1','R:3-0','R:0-4','R:1-3','R:2-2','R:3-1','R:4-0','R:0-5','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0','R:0-6','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0','R:0-1','R:1-0','R:0-2','R:1-1','R:2-0']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-
-    def get_total_goals_over_35_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-4','R:1-3','R:2-2','R:3-1','R:4-0','R:0-5','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0','R:0-6','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0','R:0-1','R:1-0','R:0-2','R:1-1','R:2-0','R:0-3','R:1-2','R:2-1','R:3-0']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-
-    def get_total_goals_over_45_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-5','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0','R:0-6','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0','R:0-1','R:1-0','R:0-2','R:1-1','R:2-0','R:0-3','R:1-2','R:2-1','R:3-0','R:0-4','R:1-3','R:2-2','R:3-1','R:4-0']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-
-    def get_total_goals_over_55_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-6','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0','R:0-1','R:1-0','R:0-2','R:1-1','R:2-0','R:0-3','R:1-2','R:2-1','R:3-0','R:0-4','R:1-3','R:2-2','R:3-1','R:4-0','R:0-5','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_total_home_goals_over_05_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:1-0','R:1-1','R:2-0','R:1-2','R:2-1','R:3-0','R:1-3','R:2-2','R:3-1','R:4-0','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0','R:0-1','R:0-2','R:0-3','R:0-4','R:0-5','R:0-6']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_total_home_goals_over_15_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:2-0','R:2-1','R:3-0','R:2-2','R:3-1','R:4-0','R:2-3','R:3-2','R:4-1','R:5-0','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0','R:0-1','R:0-2','R:0-3','R:0-4','R:0-5','R:0-6','R:1-0','R:1-1','R:1-2','R:1-3','R:1-4','R:1-5']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_total_home_goals_over_25_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:3-0','R:3-1','R:4-0','R:3-2','R:4-1','R:5-0','R:3-3','R:4-2','R:5-1','R:6-0']
-        false_cols = ['R:0-0','R:0-1','R:0-2','R:0-3','R:0-4','R:0-5','R:0-6','R:1-0','R:1-1','R:1-2','R:1-3','R:1-4','R:1-5','R:2-0','R:2-1','R:2-2','R:2-3','R:2-4']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_total_away_goals_over_05_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-1','R:0-2','R:0-3','R:0-4','R:0-5','R:0-6','R:1-1','R:1-2','R:2-1','R:1-3','R:2-2','R:3-1','R:1-4','R:2-3','R:3-2','R:4-1','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1']
-        false_cols = ['R:0-0','R:1-0','R:2-0','R:3-0','R:4-0','R:5-0','R:6-0']
-
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-
-    def get_total_away_goals_over_15_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-2','R:0-3','R:0-4','R:0-5','R:0-6','R:1-2','R:1-3','R:2-2','R:1-4','R:2-3','R:3-2','R:1-5','R:2-4','R:3-3','R:4-2']
-        false_cols = ['R:0-0','R:1-0','R:2-0','R:3-0','R:4-0','R:5-0','R:6-0','R:0-1','R:1-1','R:2-1','R:3-1','R:4-1','R:5-1']
-
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_total_away_goals_over_25_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-3','R:0-4','R:0-5','R:0-6','R:1-3','R:1-4','R:2-3','R:1-5','R:2-4','R:3-3']
-        false_cols = ['R:0-0','R:1-0','R:2-0','R:3-0','R:4-0','R:5-0','R:6-0','R:0-1','R:1-1','R:2-1','R:3-1','R:4-1','R:5-1','R:0-2','R:1-2','R:2-2','R:3-2','R:4-2']
-
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    
-    def get_total_goals_odd_even_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:0-1', 'R:1-0', 'R:0-3', 'R:1-2', 'R:2-1', 'R:3-0', 'R:5-0', 'R:4-1', 'R:3-2', 'R:2-3', 'R:1-4', 'R:0-5']
-        false_cols = ['R:0-0','R:2-0', 'R:1-1', 'R:0-2', 'R:4-0', 'R:3-1', 'R:2-2', 'R:1-3', 'R:0-4', 'R:6-0', 'R:5-1', 'R:4-2', 'R:3-3', 'R:2-4', 'R:1-5', 'R:0-6']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_both_teams_to_score_probs(self, home_team: str, away_team: str) -> BoolModel:        
-        true_cols = ['R:1-1', 'R:2-1', 'R:1-2', 'R:3-1', 'R:2-2', 'R:1-3', 'R:4-1', 'R:3-2', 'R:2-3', 'R:1-4', 'R:5-1', 'R:4-2', 'R:3-3', 'R:2-4', 'R:1-5']
-        false_cols = ['R:0-0', 'R:1-0', 'R:2-0', 'R:3-0', 'R:4-0', 'R:5-0', 'R:6-0','R:0-1', 'R:0-2', 'R:0-3', 'R:0-4', 'R:0-5', 'R:0-6']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_home_clean_sheet_probs(self, home_team: str, away_team: str) -> BoolModel:     
-        true_cols = ['R:0-0','R:1-0','R:2-0','R:3-0','R:4-0','R:5-0','R:6-0']   
-        false_cols = ['R:0-1','R:0-2','R:1-1','R:0-3','R:1-2','R:2-1','R:0-4','R:1-3','R:2-2','R:3-1','R:0-5','R:1-4','R:2-3','R:3-2','R:4-1','R:0-6','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_away_clean_sheet_probs(self, home_team: str, away_team: str) -> BoolModel: 
-        true_cols = ['R:0-0','R:0-1','R:0-2','R:0-3','R:0-4','R:0-5','R:0-6']    
-        false_cols = ['R:1-0','R:1-1','R:2-0','R:1-2','R:2-1','R:3-0','R:1-3','R:2-2','R:3-1','R:4-0','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_home_win_and_clean_sheet_probs(self, home_team: str, away_team: str) -> BoolModel:     
-        true_cols = ['R:1-0','R:2-0','R:3-0','R:4-0','R:5-0','R:6-0']   
-        false_cols = ['R:0-0','R:0-1','R:0-2','R:1-1','R:0-3','R:1-2','R:2-1','R:0-4','R:1-3','R:2-2','R:3-1','R:0-5','R:1-4','R:2-3','R:3-2','R:4-1','R:0-6','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-    
-    def get_away_win_and_clean_sheet_probs(self, home_team: str, away_team: str) -> BoolModel: 
-        true_cols = ['R:0-1','R:0-2','R:0-3','R:0-4','R:0-5','R:0-6']    
-        false_cols = ['R:0-0','R:1-0','R:1-1','R:2-0','R:1-2','R:2-1','R:3-0','R:1-3','R:2-2','R:3-1','R:4-0','R:1-4','R:2-3','R:3-2','R:4-1','R:5-0','R:1-5','R:2-4','R:3-3','R:4-2','R:5-1','R:6-0']
-        
-        return self._get_bool_probs(home_team, away_team, true_cols, false_cols)
-
-    
-    def get_handicap_03_probs(self, home_team: str, away_team: str) -> HUBModel:
-        home_cols = ['GD=4', 'GD=5', 'GD>5']
-        draw_cols = ['GD=3']
-        away_cols = ['GD<-5', 'GD=-5', 'GD=-4', 'GD=-3', 'GD=-2', 'GD=-1', 'GD=0', 'GD=1', 'GD=2']
-        
-        return self._get_hub_probs(home_team, away_team, home_cols, draw_cols, away_cols)
-    
-    def get_handicap_02_probs(self, home_team: str, away_team: str) -> HUBModel:
-        home_cols = ['GD=3', 'GD=4', 'GD=5', 'GD>5']
-        draw_cols = ['GD=2']
-        away_cols = ['GD<-5', 'GD=-5', 'GD=-4', 'GD=-3', 'GD=-2', 'GD=-1', 'GD=0', 'GD=1']
-        
-        return self._get_hub_probs(home_team, away_team, home_cols, draw_cols, away_cols)
-    
-    def get_handicap_01_probs(self, home_team: str, away_team: str) -> HUBModel:
-        home_cols = ['GD=2', 'GD=3', 'GD=4', 'GD=5', 'GD>5']
-        draw_cols = ['GD=1']
-        away_cols = ['GD<-5', 'GD=-5', 'GD=-4', 'GD=-3', 'GD=-2', 'GD=-1', 'GD=0']
-        
-        return self._get_hub_probs(home_team, away_team, home_cols, draw_cols, away_cols)
-    
-    def get_handicap_10_probs(self, home_team: str, away_team: str) -> HUBModel:
-        home_cols = ['GD=0','GD=1','GD=2', 'GD=3', 'GD=4', 'GD=5', 'GD>5']
-        draw_cols = ['GD=-1']
-        away_cols = ['GD<-5', 'GD=-5', 'GD=-4', 'GD=-3', 'GD=-2']
-        
-        return self._get_hub_probs(home_team, away_team, home_cols, draw_cols, away_cols)
-
-    def get_handicap_20_probs(self, home_team: str, away_team: str) -> HUBModel:
-        home_cols = ['GD=-1', 'GD=0','GD=1','GD=2', 'GD=3', 'GD=4', 'GD=5', 'GD>5']
-        draw_cols = ['GD=-2']
-        away_cols = ['GD<-5', 'GD=-5', 'GD=-4', 'GD=-3']
-        
-        return self._get_hub_probs(home_team, away_team, home_cols, draw_cols, away_cols)
+        grid = self.get_score_grid(home_team, away_team)
+        if grid is None:
+            return HUBModel(home=0, draw=0, away=0)
+        return grid.hub()
+
+    def get_score_grid(self, home_team: str, away_team: str) -> Optional[ScoreGrid]:
+        home = self.name_mapping.get(home_team, home_team)
+        away = self.name_mapping.get(away_team, away_team)
+        with stage_seconds.time(stage='fixtures_lookup'):
+            return self.score_grids.get(home, away)
+
+    def get_market_probabilities(self, home_team: str, away_team: str, market_name: str) -> Optional[Probabilities]:
+        """Probabilities for a Norsk Tipping market (team names replaced by home and away), or None for unknown markets and fixtures, and for lines beyond the published scores"""
+        derive = find_market(market_name)
+        if derive is None:
+            return None
+        grid = self.get_score_grid(home_team, away_team)
+        if grid is None:
+            return None
+        return derive(grid)
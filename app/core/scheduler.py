@@ -0,0 +1,148 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from app.config.config import settings
+from app.core.metrics import metrics, Histogram, Gauge, upstream_requests_total, labels_key, Labels
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class RequestClass(IntEnum):
+    """Upstream request classes, in priority order"""
+    USER = 0
+    REFRESH = 1
+    PREFETCH = 2
+
+@dataclass(frozen=True)
+class RequestPriority:
+    request_class: RequestClass = RequestClass.USER
+    # Kickoff of the match the request is for, as a timestamp. Sooner kickoffs go first within a class.
+    kickoff: Optional[float] = None
+    # Seconds from submission until the request is no longer worth answering
+    deadline: Optional[float] = None
+
+request_priority: ContextVar[RequestPriority] = ContextVar('request_priority', default=RequestPriority())
+
+@contextmanager
+def upstream_priority(request_class: RequestClass, kickoff: Optional[float] = None, deadline: Optional[float] = None):
+    """Upstream requests made inside the block are scheduled with this class, kickoff and deadline"""
+    token = request_priority.set(RequestPriority(request_class, kickoff, deadline))
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    pass
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to burst requests"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+class UpstreamScheduler:
+    """
+    Admits upstream requests per host through a token bucket, in priority order: by request class, then kickoff, then arrival.
+    A request waits in its host's queue until a token is free and nothing more urgent is waiting. Requests whose deadline passes while
+    queued are dropped without being sent, and the ones in flight are cancelled at the deadline.
+    """
+    def __init__(self, rate_limits: Dict[str, Tuple[float, int]], default_limit: Tuple[float, int] = (5.0, 10)):
+        self.rate_limits = rate_limits
+        self.default_limit = default_limit
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.queues: Dict[str, List[list]] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+        self._sequence = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _host_state(self, host: str):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Queued futures and dispatcher tasks belong to one event loop
+            self._loop = loop
+            self.queues, self._wakeups, self._dispatchers = {}, {}, {}
+        if host not in self._dispatchers:
+            self.buckets.setdefault(host, TokenBucket(*self.rate_limits.get(host, self.default_limit)))
+            self.queues[host] = []
+            self._wakeups[host] = asyncio.Event()
+            self._dispatchers[host] = loop.create_task(self._dispatch(host))
+        return self.queues[host], self._wakeups[host]
+
+    async def _dispatch(self, host: str):
+        queue, wakeup, bucket = self.queues[host], self._wakeups[host], self.buckets[host]
+        while True:
+            while not queue:
+                wakeup.clear()
+                await wakeup.wait()
+            await bucket.acquire()
+            while queue:
+                permit = heapq.heappop(queue)[-1]
+                if not permit.done():
+                    permit.set_result(None)
+                    break
+            else:
+                # Everything queued expired while waiting for the token
+                bucket.refund()
+
+    async def submit(self, host: str, fetch: Callable[[], Awaitable[T]]) -> T:
+        """Runs fetch() once the host's bucket and queue admit it, under the request_priority of the caller's context"""
+        priority = request_priority.get()
+        deadline = priority.deadline if priority.deadline is not None else settings.UPSTREAM_DEADLINE
+        start = time.monotonic()
+        queue, wakeup = self._host_state(host)
+        permit = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue, [priority.request_class, priority.kickoff or float('inf'), next(self._sequence), permit])
+        wakeup.set()
+        labels = {'host': host, 'request_class': priority.request_class.name.lower()}
+        try:
+            await asyncio.wait_for(permit, deadline)
+        except asyncio.TimeoutError:
+            raise self._deadline_exceeded(host, deadline, labels, sent=False)
+        upstream_queue_wait_seconds.observe(time.monotonic() - start, **labels)
+        try:
+            return await asyncio.wait_for(fetch(), max(deadline - (time.monotonic() - start), 0))
+        except asyncio.TimeoutError:
+            # Timeouts raised inside fetch(), such as aiohttp's, are the upstream's own and pass through; only the spent budget is ours
+            if time.monotonic() - start < deadline:
+                raise
+            raise self._deadline_exceeded(host, deadline, labels, sent=True)
+
+    @staticmethod
+    def _deadline_exceeded(host: str, deadline: float, labels: Dict[str, str], sent: bool) -> DeadlineExceeded:
+        upstream_requests_total.inc(source=host, status='deadline_exceeded')
+        logger.warning("Upstream request passed its deadline", extra={**labels, 'deadline': deadline, 'sent': sent})
+        return DeadlineExceeded(f'{host} request exceeded its {deadline}s deadline')
+
+    def queue_depths(self) -> Dict[Labels, float]:
+        return {labels_key({'host': host}): sum(not entry[-1].done() for entry in queue) for host, queue in self.queues.items()}
+
+upstream_scheduler = UpstreamScheduler(settings.UPSTREAM_RATE_LIMITS)
+upstream_queue_wait_seconds = metrics.register(Histogram('betmax_upstream_queue_wait_seconds', 'Time upstream requests waited for the scheduler'))
+upstream_queue_depth = metrics.register(Gauge('betmax_upstream_queue_depth', 'Upstream requests waiting in the scheduler per host', upstream_scheduler.queue_depths))
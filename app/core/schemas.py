@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Union, TypeVar, Generic
+from typing import Dict, List, Literal, Optional, Union, TypeVar, Generic
 
 class HUBModel(BaseModel):
 	home: float
@@ -23,7 +23,20 @@ class ELOModel(BaseModel):
 	home_elo: float
 	away_elo: float
 	probs: HUBModel
+	probs_source: Literal['clubelo_fixtures', 'elo_formula'] = 'clubelo_fixtures'
 	
+class PredictionModel(BaseModel):
+	goal_difference: float
+	probs: HUBModel
+
+class BestPricesModel(BaseModel):
+	odds: HUBModel
+	# Bookmaker offering each best price
+	sources: Dict[str, str]
+	expected_value: HUBModel
+	# Sum of the implied probabilities of the best prices, below 1 when backing all three outcomes is an arbitrage
+	overround: float
+
 class MatchSummaryModel(BaseModel):
 	NT_id: str
 	home_team: str
@@ -33,6 +46,9 @@ class MatchSummaryModel(BaseModel):
 	odds: HUBModel
 	elo: ELOModel
 	expected_value: HUBModel
+	prediction: Optional[PredictionModel] = None
+	# Best prices across the bookmakers, when every outcome is quoted
+	best_prices: Optional[BestPricesModel] = None
 
 class MatchDetailModel(BaseModel):
 	NT_id: str
@@ -45,3 +61,35 @@ class MatchDetailModel(BaseModel):
 
 class MatchListResponseModel(BaseModel):
 	eventList: List[MatchSummaryModel]
+	# Cursor of the next page when the request set a limit and more matches remain
+	next_cursor: Optional[str] = None
+
+Selection = Literal['home', 'draw', 'away', 'true', 'false']
+
+class StakeCandidateModel(BaseModel):
+	home_team: str
+	away_team: str
+	market: str
+	selection: Selection
+	odds: float
+
+class StakeRequestModel(BaseModel):
+	bankroll: float = Field(gt=0)
+	kelly_fraction: float = Field(default=0.25, gt=0, le=1)
+	# Largest share of the bankroll staked in total
+	max_exposure: float = Field(default=1.0, gt=0, le=1)
+	candidates: List[StakeCandidateModel]
+
+class StakeModel(StakeCandidateModel):
+	# Expected share of the stake paid at the odds and returned, from the score grid. Half wins and half pushes on quarter lines count as halves.
+	probability: Optional[float] = None
+	push_probability: Optional[float] = None
+	expected_value: Optional[float] = None
+	fraction: float = 0.0
+	stake: float = 0.0
+
+class StakeResponseModel(BaseModel):
+	bankroll: float
+	total_stake: float
+	expected_growth: float
+	stakes: List[StakeModel]
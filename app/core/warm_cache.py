@@ -0,0 +1,191 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+import threading
+import asyncio
+import logging
+import shutil
+import json
+import time
+import os
+from app.config.config import settings
+from app.core.markets import ScoreGrids
+from app.core.metrics import cache_requests_total
+from app.core.repositories import ratings_snapshots, fixtures_snapshots, ratings_version, fixtures_version, report_snapshot_bytes
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the layout of the cache directory or of a saved snapshot changes, so older caches are ignored
+CACHE_FORMAT_VERSION = 2
+
+@dataclass
+class CachedPayload:
+    payload: Any
+    fetched_at: float
+    # Restored from the warm cache at boot, rather than fetched by this process
+    restored: bool = False
+    # Values built from the payload, such as the parsed and indexed feed, dropped with it when the payload is replaced
+    derived: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+class PayloadCache:
+    """
+    Last upstream odds payloads by key, with the time they were fetched. A payload is served while younger than the caller's ttl, and one
+    restored at boot while younger than WARM_ODDS_MAX_AGE, so a restart does not refetch everything at once.
+    """
+    def __init__(self):
+        self.entries: Dict[str, CachedPayload] = {}
+
+    def get(self, key: str, ttl: float) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is not None and (entry.age <= ttl or (entry.restored and entry.age <= settings.WARM_ODDS_MAX_AGE)):
+            cache_requests_total.inc(cache='odds_payloads', result='hit')
+            return entry.payload
+        cache_requests_total.inc(cache='odds_payloads', result='miss')
+        return None
+
+    def put(self, key: str, payload: Any, fetched_at: Optional[float] = None):
+        self.entries[key] = CachedPayload(payload, fetched_at or time.time())
+        # Markets of matches that are long gone would otherwise stay forever
+        for stale in [cached for cached, entry in self.entries.items() if entry.age > settings.WARM_ODDS_MAX_AGE]:
+            del self.entries[stale]
+
+    def derived(self, key: str, payload: Any, name: str, build: Callable[[Any], Any]) -> Any:
+        """
+        build(payload), built once per cached payload and kept next to it. A payload that is no longer the cached one at key, replaced
+        by a refresh in the meantime, is built without caching.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry.payload is not payload:
+            return build(payload)
+        if name not in entry.derived:
+            entry.derived[name] = build(payload)
+        return entry.derived[name]
+
+odds_payloads = PayloadCache()
+
+class WarmCache:
+    """
+    Persists what a cold process would otherwise rebuild or refetch: the parsed ratings and fixtures snapshots and the recent odds payloads.
+    Each save is written to a fresh directory under one per CACHE_FORMAT_VERSION, periodically and on shutdown, and becomes current when
+    the CURRENT pointer file is atomically replaced to name it. A crash at any point of a save leaves CURRENT naming the previous complete
+    save. restore() only takes snapshots whose source file is unchanged, and payloads within WARM_ODDS_MAX_AGE.
+    """
+    def __init__(self, directory: str = settings.WARM_CACHE_DIR, interval: float = settings.WARM_CACHE_INTERVAL, payloads: PayloadCache = odds_payloads):
+        self.directory = os.path.join(directory, f'v{CACHE_FORMAT_VERSION}')
+        self.pointer = os.path.join(self.directory, 'CURRENT')
+        self.interval = interval
+        self.payloads = payloads
+        self.task: Optional[asyncio.Task] = None
+        # The periodic save runs in a thread, and may still be running when stop() saves
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[str]:
+        """Directory of the last complete save, or None before the first"""
+        try:
+            with open(self.pointer, encoding='utf-8') as f:
+                return os.path.join(self.directory, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = str(time.time_ns())
+        target = os.path.join(self.directory, name)
+        os.makedirs(target)
+        manifest = {'saved_at': time.time(), 'ratings': {}, 'fixtures': {}}
+        for i, (path, (version, ratings)) in enumerate(list(ratings_snapshots.items())):
+            with open(f'{target}/ratings_{i}.json', 'w', encoding='utf-8') as f:
+                json.dump(ratings, f)
+            manifest['ratings'][path] = {'version': version, 'file': f'ratings_{i}.json'}
+        for i, (path, (version, grids)) in enumerate(list(fixtures_snapshots.items())):
+            grids.save(f'{target}/fixtures_{i}')
+            manifest['fixtures'][path] = {'version': version, 'file': f'fixtures_{i}'}
+        payloads = [
+            {'key': key, 'fetched_at': entry.fetched_at, 'payload': entry.payload}
+            for key, entry in list(self.payloads.entries.items()) if entry.age <= settings.WARM_ODDS_MAX_AGE
+        ]
+        with open(f'{target}/payloads.json', 'w', encoding='utf-8') as f:
+            json.dump(payloads, f)
+        with open(f'{target}/manifest.json', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        with open(self.pointer + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(self.pointer + '.tmp', self.pointer)
+        # Older saves, and directories left by saves that crashed before updating the pointer
+        for entry in os.listdir(self.directory):
+            if entry != name and os.path.isdir(os.path.join(self.directory, entry)):
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+        logger.info("Saved warm cache", extra={'directory': target, 'payloads': len(payloads)})
+
+    @staticmethod
+    def _unchanged(current_version: Callable[[str], Any], path: str, version: Any) -> bool:
+        """Whether a snapshot saved at this version, as read back from JSON, is still the current one"""
+        try:
+            return current_version(path) == (tuple(version) if isinstance(version, list) else version)
+        except FileNotFoundError:
+            return False
+
+    def restore(self) -> Dict[str, int]:
+        """Loads whatever is still valid. Returns the number of snapshots and payloads restored; a missing or unreadable cache restores nothing."""
+        counts = {'ratings': 0, 'fixtures': 0, 'payloads': 0}
+        directory = self.current()
+        try:
+            if directory is None:
+                raise FileNotFoundError(self.pointer)
+            with open(f'{directory}/manifest.json', encoding='utf-8') as f:
+                manifest = json.load(f)
+            for path, entry in manifest['ratings'].items():
+                if self._unchanged(ratings_version, path, entry['version']):
+                    with open(f"{directory}/{entry['file']}", encoding='utf-8') as f:
+                        ratings_snapshots[path] = (entry['version'], json.load(f))
+                    counts['ratings'] += 1
+            for path, entry in manifest['fixtures'].items():
+                if self._unchanged(fixtures_version, path, entry['version']):
+                    fixtures_snapshots[path] = (tuple(entry['version']), ScoreGrids.load(f"{directory}/{entry['file']}"))
+                    counts['fixtures'] += 1
+            with open(f'{directory}/payloads.json', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    payload = CachedPayload(entry['payload'], entry['fetched_at'], restored=True)
+                    if payload.age <= settings.WARM_ODDS_MAX_AGE and entry['key'] not in self.payloads.entries:
+                        self.payloads.entries[entry['key']] = payload
+                        counts['payloads'] += 1
+        except FileNotFoundError:
+            logger.info("No warm cache at %s, starting cold", self.directory)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Could not restore the warm cache: %s", e, extra={'directory': directory})
+        report_snapshot_bytes()
+        logger.info("Restored warm cache", extra=counts)
+        return counts
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception as e:
+                logger.error("Error saving the warm cache: %s", e)
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stops the periodic saves and saves once more"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        try:
+            self.save()
+        except Exception as e:
+            logger.error("Error saving the warm cache: %s", e)
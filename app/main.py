@@ -1,17 +1,99 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+import asyncio
+import logging
+import uuid
 from app.api.routes import router
 from contextlib import asynccontextmanager
 from app.background.data_updater import DataUpdater
+from app.services.predictions import predictor_service
+from app.services.matches import MatchesService
+from app.services.push import OddsWatcher, push_hub
+from app.core.scheduler import upstream_priority, RequestClass
+from app.core.warm_cache import WarmCache
+from app.core.bookmakers import odds_aggregator
+from app.core.metrics import SamplingProfiler
+from app.core.log import setup_logging, shutdown_logging, correlation_id
+from app.config.config import settings
+
+logger = logging.getLogger(__name__)
 
 data_updater = DataUpdater()
 
+async def fetch_coming_matches():
+    matches_service = MatchesService()
+    try:
+        with upstream_priority(RequestClass.REFRESH):
+            return (await matches_service.get_coming_matches()).eventList
+    finally:
+        await matches_service.close()
+
+async def refresh_coming_matches():
+    """Replaces odds restored from the warm cache, behind the requests they are already serving"""
+    matches_service = MatchesService()
+    try:
+        with upstream_priority(RequestClass.PREFETCH):
+            await matches_service.refresh_events()
+    except Exception as e:
+        logger.error("Error refreshing restored odds: %s", e)
+    finally:
+        await matches_service.close()
+
+odds_watcher = OddsWatcher(push_hub, fetch_coming_matches)
+data_updater.listeners.append(odds_watcher.refresh_now)
+warm_cache = WarmCache()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handles startup and shutdown tasks."""
+    setup_logging()
+    restored = warm_cache.restore()
+    predictor_service.load()
     await data_updater.start()
+    await odds_watcher.start()
+    await warm_cache.start()
+    await odds_aggregator.start()
+    refresh = asyncio.create_task(refresh_coming_matches()) if restored['payloads'] else None
     yield  # Keep the app running
-    print("Server is shutting down...")
+    logger.info("Server is shutting down...")
+    if refresh:
+        refresh.cancel()
+    await odds_watcher.stop()
+    await odds_aggregator.stop()
+    await warm_cache.stop()
+    shutdown_logging()
 
 app = FastAPI(title="Bet Maximizer API", lifespan=lifespan)
 
-app.include_router(router)
\ No newline at end of file
+app.include_router(router)
+
+@app.middleware("http")
+async def add_correlation_id(request: Request, call_next):
+    """Tags every log record written while handling the request with its X-Request-ID, or a generated one."""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = correlation_id.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        correlation_id.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    With PROFILING_ENABLED, ?profile=1 on any request returns its sampled stacks in collapsed format instead of the response. Every thread
+    is sampled, so sync endpoints such as /stakes, which run in worker threads, are profiled too, along with whatever else
+    the process runs meanwhile.
+    """
+    if not (settings.PROFILING_ENABLED and request.query_params.get("profile")):
+        return await call_next(request)
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        response = await call_next(request)
+        async for _ in response.body_iterator:
+            pass
+    finally:
+        profiler.stop()
+    return PlainTextResponse(profiler.collapsed())
\ No newline at end of file
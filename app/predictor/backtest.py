@@ -0,0 +1,252 @@
+"""
+Replays historical matches against their closing odds to check whether betting on expected_value > threshold makes money.
+
+Probabilities come from the ELO formula on the ratings before each match (simulated here, or ClubELO's from a backfilled rating history),
+from predictions in the ClubELO fixtures format, or from the trained league models. Every metric is computed with array operations over all
+matches at once, and parameter grids run in a process pool.
+
+Run with: python -m app.predictor.backtest --source elo_formula --thresholds 1.0 1.05 1.1 --staking flat kelly --kelly-fractions 0.1 0.25
+"""
+from .util import util
+from .training import build_league_features
+from .forest import CompactForest
+from app.config.config import settings
+from app.core.markets import ScoreGrids, MAX_GD
+from app.core.elo_history import RatingHistory
+from app.utils.utils import calculate_elo_probs_batch, goal_difference_probs, football_data_to_ClubELO_names_mapping
+from concurrent.futures import ProcessPoolExecutor
+from joblib import dump, load
+import numpy as np
+import pandas as pd
+import itertools
+import argparse
+import tempfile
+import os
+
+# Closing 1X2 odds in football-data.co.uk files, in order of preference: Pinnacle, market average, Bet365
+closing_odds_columns = [
+	('PSCH', 'PSCD', 'PSCA'),
+	('AvgCH', 'AvgCD', 'AvgCA'),
+	('B365CH', 'B365CD', 'B365CA'),
+]
+
+def closing_odds(data: pd.DataFrame) -> np.ndarray:
+	"""(n, 3) home, draw and away closing odds from the first bookmaker quoting all three, 0 where none does."""
+	odds = np.zeros((len(data), 3))
+	for columns in closing_odds_columns:
+		if not set(columns) <= set(data.columns):
+			continue
+		quoted = data[list(columns)].to_numpy(dtype=float)
+		fill = (odds == 0).all(axis=1) & (quoted > 1).all(axis=1)
+		odds[fill] = quoted[fill]
+	return odds
+
+def match_outcomes(data: pd.DataFrame) -> np.ndarray:
+	"""0 for home wins, 1 for draws and 2 for away wins"""
+	return np.select([data['FTR'] == 'H', data['FTR'] == 'D'], [0, 1], 2)
+
+def load_matches(start_year, end_year, leagues) -> pd.DataFrame:
+	"""Matches with closing odds and the ELO ratings before each match, simulated as in PredictorTrainer.train_models, in date order."""
+	odds_columns = [column for columns in closing_odds_columns for column in columns]
+	data = util.fetch_data(start_year, end_year, leagues, extra_cols=odds_columns)
+	# Missing odds must not make clean_data drop the match, or the ELO simulation would skip it
+	quoted = [column for column in odds_columns if column in data.columns]
+	data[quoted] = data[quoted].fillna(0)
+	data = util.clean_data(data)
+	data = data.sort_values('Date', kind='stable').reset_index(drop=True)
+	draw_factor = data['FTR'].value_counts(normalize=True)['D']
+	ELO = util.ELO(data, init_rating=1500, draw_factor=draw_factor, k_factor=32, home_advantage=50)
+	data = ELO.perform_simulations(data)
+	data.attrs['draw_factor'] = draw_factor
+	return data
+
+def elo_formula_probs(data: pd.DataFrame, draw_factor=None, home_advantage=50) -> np.ndarray:
+	"""(n, 3) HUB probabilities from the ELO formula on the Home ELO and Away ELO columns"""
+	draw_factor = data.attrs.get('draw_factor', 0.25) if draw_factor is None else draw_factor
+	return np.column_stack(calculate_elo_probs_batch(data['Home ELO'], data['Away ELO'], draw_factor, home_advantage))
+
+def clubelo_history_probs(data: pd.DataFrame, history: RatingHistory, name_mapping=None, draw_factor=None, home_advantage=50) -> np.ndarray:
+	"""
+	(n, 3) HUB probabilities from the ELO formula on ClubELO's ratings as of each match date, NaN for matches where a team has no rating yet.
+	name_mapping maps football-data.co.uk names to ClubELO names.
+	"""
+	name_mapping = name_mapping or {}
+	dates = pd.to_datetime(data['Date']).to_numpy()
+	home_elo = history.ratings_as_of([name_mapping.get(team, team) for team in data['HomeTeam']], dates)
+	away_elo = history.ratings_as_of([name_mapping.get(team, team) for team in data['AwayTeam']], dates)
+	draw_factor = data.attrs.get('draw_factor', 0.25) if draw_factor is None else draw_factor
+	return np.column_stack(calculate_elo_probs_batch(home_elo, away_elo, draw_factor, home_advantage))
+
+def clubelo_fixtures_grids(data: pd.DataFrame, fixtures: pd.DataFrame, name_mapping=None):
+	"""
+	ScoreGrids of archived predictions in the ClubELO fixtures format (Date, Home, Away and the probability columns), and the row of each
+	match in them, -1 for matches without one. name_mapping maps football-data.co.uk names to ClubELO names.
+	"""
+	name_mapping = name_mapping or {}
+	fixtures = fixtures.assign(Date=pd.to_datetime(fixtures['Date'])).drop_duplicates(['Date', 'Home', 'Away']).set_index(['Date', 'Home', 'Away'])
+	keys = pd.MultiIndex.from_arrays([
+		pd.to_datetime(data['Date']),
+		data['HomeTeam'].map(lambda team: name_mapping.get(team, team)),
+		data['AwayTeam'].map(lambda team: name_mapping.get(team, team)),
+	])
+	return ScoreGrids.from_fixtures(fixtures), fixtures.index.get_indexer(keys)
+
+def clubelo_fixtures_probs(data: pd.DataFrame, fixtures: pd.DataFrame, name_mapping=None) -> np.ndarray:
+	"""(n, 3) HUB probabilities from archived predictions in the ClubELO fixtures format, NaN for matches without one"""
+	grids, position = clubelo_fixtures_grids(data, fixtures, name_mapping)
+	gd_cdf = grids.gd_cdf[position]
+	probs = np.column_stack([1 - gd_cdf[:, MAX_GD], gd_cdf[:, MAX_GD] - gd_cdf[:, MAX_GD - 1], gd_cdf[:, MAX_GD - 1]])
+	probs[position < 0] = np.nan
+	return probs
+
+def league_model_probs(data: pd.DataFrame, model_path: str) -> np.ndarray:
+	"""
+	(n, 3) HUB probabilities from the league models in model_path, NaN for leagues without one.
+	The models are fitted on a random split of all seasons, so only seasons after the training data give an out-of-sample result.
+	"""
+	probs = np.full((len(data), 3), np.nan)
+	for league, league_data in data.groupby('Div', sort=False):
+		forest_path = f'{model_path}/{league}_forest'
+		if os.path.isdir(forest_path):
+			model = CompactForest.load(forest_path)
+		elif os.path.exists(f'{model_path}/{league}_model.joblib'):
+			model = load(f'{model_path}/{league}_model.joblib', mmap_mode='r')
+		else:
+			continue
+		features = build_league_features(league_data.copy())
+		goal_difference = model.predict(features[list(model.feature_names_in_)])
+		std = getattr(model, 'residual_std_', 1.7)
+		probs[data.index.get_indexer(features.index)] = np.column_stack(goal_difference_probs(goal_difference, std))
+	return probs
+
+def backtest(probs, odds, outcome, season, threshold=1.05, staking='flat', stake=0.01, kelly_fraction=0.25, max_stake=0.05, max_odds=np.inf) -> dict:
+	"""
+	Bets on the selection with the highest expected value (probability times odds) of every match where it exceeds threshold.
+	Stakes are fractions of the starting bankroll: `stake` for flat staking, or kelly_fraction of the Kelly stake capped at max_stake.
+	Matches must be in date order; season holds integer season codes.
+	"""
+	with np.errstate(invalid='ignore'):
+		expected_value = np.where((odds > 1) & (odds <= max_odds) & ~np.isnan(probs), probs * odds, -np.inf)
+	selection = expected_value.argmax(axis=1)
+	rows = np.arange(len(selection))
+	best = expected_value[rows, selection]
+	bet = best > threshold
+	price = odds[rows, selection]
+	probability = np.nan_to_num(probs[rows, selection])
+	if staking == 'kelly':
+		stakes = np.clip(kelly_fraction * (probability * price - 1) / np.maximum(price - 1, 1e-9), 0, max_stake)
+	else:
+		stakes = np.full(len(selection), stake)
+	stakes = np.where(bet, stakes, 0.0)
+	won = selection == outcome
+	profit = np.where(won, stakes * (price - 1), -stakes)
+
+	bankroll = 1 + np.cumsum(profit)
+	peak = np.maximum.accumulate(np.concatenate([[1.0], bankroll]))[1:]
+	n_seasons = int(season.max()) + 1 if len(season) else 0
+	season_staked = np.bincount(season, weights=stakes, minlength=n_seasons)
+	season_profit = np.bincount(season, weights=profit, minlength=n_seasons)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		season_roi = season_profit / season_staked
+	return {
+		'bets': int(bet.sum()),
+		'hit_rate': float(won[bet].mean()) if bet.any() else np.nan,
+		'mean_odds': float(price[bet].mean()) if bet.any() else np.nan,
+		'staked': float(stakes.sum()),
+		'profit': float(profit.sum()),
+		'roi': float(profit.sum() / stakes.sum()) if stakes.sum() else np.nan,
+		'max_drawdown': float(((peak - bankroll) / peak).max()) if len(bankroll) else 0.0,
+		'final_bankroll': float(bankroll[-1]) if len(bankroll) else 1.0,
+		'worst_season_roi': float(np.nanmin(season_roi)) if (season_staked > 0).any() else np.nan,
+	}
+
+def calibration(probs, outcome, bins=10) -> pd.DataFrame:
+	"""Reliability table over all three selections: mean predicted probability and observed frequency per probability bin"""
+	known = ~np.isnan(probs).any(axis=1)
+	predicted = probs[known].ravel()
+	observed = (np.arange(3) == outcome[known, None]).ravel()
+	bin_index = np.minimum((predicted * bins).astype(int), bins - 1)
+	count = np.bincount(bin_index, minlength=bins)
+	with np.errstate(invalid='ignore'):
+		return pd.DataFrame({
+			'bin_low': np.arange(bins) / bins,
+			'bin_high': np.arange(1, bins + 1) / bins,
+			'count': count,
+			'mean_predicted': np.bincount(bin_index, weights=predicted, minlength=bins) / count,
+			'observed': np.bincount(bin_index, weights=observed, minlength=bins) / count,
+		})
+
+def brier_score(probs, outcome) -> float:
+	known = ~np.isnan(probs).any(axis=1)
+	return float(((probs[known] - (np.arange(3) == outcome[known, None])) ** 2).sum(axis=1).mean())
+
+def _run_parameters(arrays_path, parameters):
+	arrays = load(arrays_path, mmap_mode='r')
+	return {**parameters, **backtest(arrays['probs'], arrays['odds'], arrays['outcome'], arrays['season'], **parameters)}
+
+def parameter_grid(thresholds, staking, kelly_fractions, max_odds) -> list:
+	"""Every combination of the parameter lists, with the Kelly fractions only varied for Kelly staking"""
+	grid = []
+	for threshold, method, limit in itertools.product(thresholds, staking, max_odds):
+		for kelly_fraction in (kelly_fractions if method == 'kelly' else kelly_fractions[:1]):
+			grid.append({'threshold': threshold, 'staking': method, 'kelly_fraction': kelly_fraction, 'max_odds': limit})
+	return grid
+
+def run_grid(probs, odds, outcome, season, grid: list, n_workers=None) -> pd.DataFrame:
+	"""
+	Runs backtest for every parameter dict in grid in a process pool.
+	The arrays are dumped once and memory-mapped by the worker processes instead of being pickled for every combination.
+	"""
+	n_workers = n_workers or os.cpu_count() or 1
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		arrays_path = os.path.join(tmp_dir, 'arrays.joblib')
+		dump({'probs': probs, 'odds': odds, 'outcome': outcome, 'season': season}, arrays_path)
+		with ProcessPoolExecutor(max_workers=n_workers) as executor:
+			results = list(executor.map(_run_parameters, itertools.repeat(arrays_path), grid, chunksize=max(1, len(grid) // (4 * n_workers))))
+	return pd.DataFrame(results)
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--source', choices=['elo_formula', 'clubelo_history', 'clubelo_fixtures', 'league_model'], default='elo_formula')
+	parser.add_argument('--fixtures', default=None, help='CSV of archived predictions in the ClubELO fixtures format, for --source clubelo_fixtures')
+	parser.add_argument('--elo-history', default=settings.ELO_HISTORY_PATH, help='Rating history written by app.core.elo_history, for --source clubelo_history')
+	parser.add_argument('--model-path', default='app/files/models')
+	parser.add_argument('--stats-path', default='app/files/stats')
+	parser.add_argument('--leagues', nargs='+', default=['E0', 'E1', 'E2', 'E3', 'I1', 'SP1', 'D1', 'F1'])
+	parser.add_argument('--start-year', type=int, default=2012)
+	parser.add_argument('--end-year', type=int, default=2025)
+	parser.add_argument('--evaluate-from', default=None, help='First season to bet on, e.g. 2324. Earlier seasons only warm up the ratings.')
+	parser.add_argument('--thresholds', type=float, nargs='+', default=[1.0, 1.05, 1.1, 1.2])
+	parser.add_argument('--staking', nargs='+', default=['flat', 'kelly'])
+	parser.add_argument('--kelly-fractions', type=float, nargs='+', default=[0.25])
+	parser.add_argument('--max-odds', type=float, nargs='+', default=[np.inf])
+	parser.add_argument('--workers', type=int, default=None)
+	args = parser.parse_args()
+
+	data = load_matches(args.start_year, args.end_year, args.leagues)
+	if args.source == 'elo_formula':
+		probs = elo_formula_probs(data)
+	elif args.source == 'clubelo_history':
+		probs = clubelo_history_probs(data, RatingHistory.load(args.elo_history), football_data_to_ClubELO_names_mapping)
+	elif args.source == 'clubelo_fixtures':
+		probs = clubelo_fixtures_probs(data, pd.read_csv(args.fixtures), football_data_to_ClubELO_names_mapping)
+	else:
+		probs = league_model_probs(data, args.model_path)
+	if args.evaluate_from:
+		evaluated = (data['Season'] >= args.evaluate_from).to_numpy()
+		data, probs = data[evaluated], probs[evaluated]
+	odds = closing_odds(data)
+	outcome = match_outcomes(data)
+	season = pd.factorize(data['Season'], sort=True)[0]
+
+	grid = parameter_grid(args.thresholds, args.staking, args.kelly_fractions, args.max_odds)
+	results = run_grid(probs, odds, outcome, season, grid, args.workers)
+	os.makedirs(args.stats_path, exist_ok=True)
+	results.to_csv(f'{args.stats_path}/backtest_{args.source}.csv', index=False)
+	calibration(probs, outcome).to_csv(f'{args.stats_path}/backtest_{args.source}_calibration.csv', index=False)
+	print(results.sort_values('roi', ascending=False).to_string(index=False))
+	print(f'Brier score over {len(data)} matches: {brier_score(probs, outcome):.4f}')
+	print(f'Saved results to {args.stats_path}/backtest_{args.source}.csv')
+
+if __name__ == '__main__':
+	main()
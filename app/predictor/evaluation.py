@@ -0,0 +1,210 @@
+"""
+Measures how good stored probabilities were: joins predictions with results and scores them per league and market with Brier score,
+log-loss and ranked probability score, plus reliability curves. Optionally fits isotonic or Platt recalibration of the 1X2 probabilities
+on the earlier seasons and scores the calibrated probabilities on the rest. A calibration fitted on ClubELO fixtures can be saved to
+CALIBRATION_PATH, where FixturesRepository applies it when it parses the fixtures.
+
+Every score is computed with array operations over the whole history at once, and grouped per league with bincount.
+
+Run with: python -m app.predictor.evaluation --source clubelo_fixtures --fixtures archive.csv --fit isotonic --evaluate-from 2223
+"""
+from .backtest import load_matches, match_outcomes, elo_formula_probs, clubelo_history_probs, clubelo_fixtures_grids, league_model_probs
+from app.config.config import settings
+from app.core.calibration import CalibrationMap, HUBCalibration, OUTCOMES
+from app.core.elo_history import RatingHistory
+from app.core.markets import ScoreGrids, MAX_GD, probability_columns
+from app.utils.utils import football_data_to_ClubELO_names_mapping
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+import argparse
+import os
+
+def market_outcomes(data: pd.DataFrame) -> Dict[str, np.ndarray]:
+	"""
+	Index of the outcome that happened in every market, from the full-time score. The outcomes of each market are ordered, so the ranked
+	probability score is meaningful: home, draw, away for hub, over, under for over_2.5 and yes, no for btts.
+	"""
+	home_goals, away_goals = data['FTHG'].to_numpy(), data['FTAG'].to_numpy()
+	return {
+		'hub': match_outcomes(data),
+		'over_2.5': (home_goals + away_goals < 2.5).astype(int),
+		'btts': ((home_goals == 0) | (away_goals == 0)).astype(int),
+	}
+
+def market_probs(grids: ScoreGrids, position: np.ndarray) -> Dict[str, np.ndarray]:
+	"""Probabilities of every market for the grid rows in position, as FixturesRepository derives them, NaN where position is -1"""
+	gd_cdf = grids.gd_cdf[position].astype(float)
+	grid = grids.grid[position].astype(float)
+	mass = grids.mass[position].astype(float)
+	under = grids.total_cdf[position, 2].astype(float)
+	no_goal = grid[:, 0, :].sum(axis=1) + grid[:, 1:, 0].sum(axis=1)
+	probs = {
+		'hub': np.column_stack([1 - gd_cdf[:, MAX_GD], gd_cdf[:, MAX_GD] - gd_cdf[:, MAX_GD - 1], gd_cdf[:, MAX_GD - 1]]),
+		'over_2.5': np.column_stack([1 - under, under]),
+		# Only scores up to six goals are published, so yes and no are scaled to the published mass
+		'btts': np.column_stack([mass - no_goal, no_goal]) / np.maximum(mass, 1e-12)[:, None],
+	}
+	for values in probs.values():
+		values[position < 0] = np.nan
+	return probs
+
+def _indicators(probs: np.ndarray, outcome: np.ndarray) -> np.ndarray:
+	return (np.arange(probs.shape[1]) == outcome[:, None]).astype(float)
+
+def brier_scores(probs: np.ndarray, outcome: np.ndarray) -> np.ndarray:
+	"""Per match: the squared distance between the probabilities and the outcome, summed over the outcomes"""
+	return ((probs - _indicators(probs, outcome)) ** 2).sum(axis=1)
+
+def log_losses(probs: np.ndarray, outcome: np.ndarray, eps=1e-12) -> np.ndarray:
+	return -np.log(np.clip(probs[np.arange(len(outcome)), outcome], eps, 1))
+
+def ranked_probability_scores(probs: np.ndarray, outcome: np.ndarray) -> np.ndarray:
+	"""Per match: the Brier score of the cumulative probabilities, so predicting a draw is less wrong than an away win when home wins"""
+	cumulative = np.cumsum(probs, axis=1)[:, :-1] - np.cumsum(_indicators(probs, outcome), axis=1)[:, :-1]
+	return (cumulative ** 2).sum(axis=1) / (probs.shape[1] - 1)
+
+def evaluate(probs: Dict[str, np.ndarray], outcomes: Dict[str, np.ndarray], leagues: np.ndarray) -> pd.DataFrame:
+	"""Match count and mean Brier score, log-loss and ranked probability score per league and market, plus 'all' leagues"""
+	codes, names = pd.factorize(leagues, sort=True)
+	rows = []
+	for market, predicted in probs.items():
+		known = ~np.isnan(predicted).any(axis=1)
+		outcome, group = outcomes[market][known], codes[known]
+		scores = {
+			'brier': brier_scores(predicted[known], outcome),
+			'log_loss': log_losses(predicted[known], outcome),
+			'rps': ranked_probability_scores(predicted[known], outcome),
+		}
+		count = np.bincount(group, minlength=len(names))
+		sums = {name: np.bincount(group, weights=values, minlength=len(names)) for name, values in scores.items()}
+		for i, league in enumerate(list(names) + ['all']):
+			n = count[i] if i < len(names) else count.sum()
+			if n == 0:
+				continue
+			rows.append({'league': league, 'market': market, 'matches': int(n), **{
+				name: (total[i] if i < len(names) else total.sum()) / n for name, total in sums.items()
+			}})
+	return pd.DataFrame(rows)
+
+def reliability_curves(probs: Dict[str, np.ndarray], outcomes: Dict[str, np.ndarray], leagues: np.ndarray, bins=10) -> pd.DataFrame:
+	"""
+	Mean predicted probability and observed frequency per probability bin, for every league, market and outcome, with 'all' leagues.
+	A calibrated model has observed close to mean_predicted in every bin.
+	"""
+	codes, names = pd.factorize(leagues, sort=True)
+	names = list(names) + ['all']
+	frames = []
+	for market, market_predicted in probs.items():
+		known = ~np.isnan(market_predicted).any(axis=1)
+		k = market_predicted.shape[1]
+		predicted = market_predicted[known].ravel()
+		observed = _indicators(market_predicted[known], outcomes[market][known]).ravel()
+		outcome = np.tile(np.arange(k), known.sum())
+		bin_index = np.minimum((predicted * bins).astype(int), bins - 1)
+		for group in [np.repeat(codes[known], k), np.full(len(predicted), len(names) - 1)]:
+			# One bincount over the combined (league, outcome, bin) index
+			index = (group * k + outcome) * bins + bin_index
+			size = len(names) * k * bins
+			count = np.bincount(index, minlength=size)
+			with np.errstate(invalid='ignore'):
+				mean_predicted = np.bincount(index, weights=predicted, minlength=size) / count
+				frequency = np.bincount(index, weights=observed, minlength=size) / count
+			league, outcome_index, bin_low = np.unravel_index(np.arange(size), (len(names), k, bins))
+			frame = pd.DataFrame({
+				'league': np.array(names, dtype=object)[league],
+				'market': market,
+				'outcome': outcome_index,
+				'bin_low': bin_low / bins,
+				'bin_high': (bin_low + 1) / bins,
+				'count': count,
+				'mean_predicted': mean_predicted,
+				'observed': frequency,
+			})
+			frames.append(frame[frame['count'] > 0])
+	return pd.concat(frames, ignore_index=True)
+
+def fit_calibration(probs: np.ndarray, outcome: np.ndarray, method='isotonic') -> HUBCalibration:
+	"""One-vs-rest isotonic or Platt maps for the (n, 3) HUB probabilities, fitted on the matches with probabilities"""
+	from sklearn.isotonic import IsotonicRegression
+	from sklearn.linear_model import LogisticRegression
+	known = ~np.isnan(probs).any(axis=1)
+	probs, happened = probs[known], _indicators(probs[known], outcome[known])
+	maps = {}
+	for i, name in enumerate(OUTCOMES):
+		if method == 'isotonic':
+			isotonic = IsotonicRegression(y_min=0, y_max=1, out_of_bounds='clip').fit(probs[:, i], happened[:, i])
+			maps[name] = CalibrationMap('isotonic', x=isotonic.X_thresholds_.tolist(), y=isotonic.y_thresholds_.tolist())
+		else:
+			p = np.clip(probs[:, i], 1e-6, 1 - 1e-6)
+			platt = LogisticRegression(C=1e6).fit((np.log(p) - np.log1p(-p))[:, None], happened[:, i])
+			maps[name] = CalibrationMap('platt', a=float(platt.coef_[0, 0]), b=float(platt.intercept_[0]))
+	return HUBCalibration(maps)
+
+def calibrated_fixtures(fixtures: pd.DataFrame, calibration: HUBCalibration) -> pd.DataFrame:
+	"""The fixtures with their probability columns calibrated the way FixturesRepository calibrates them"""
+	columns = {column: fixtures[column].to_numpy(dtype=float) for column in fixtures.columns if column in probability_columns}
+	return fixtures.assign(**calibration.calibrate_columns(columns))
+
+def source_probs(data: pd.DataFrame, args, fixtures: Optional[pd.DataFrame] = None) -> Dict[str, np.ndarray]:
+	if args.source == 'clubelo_fixtures':
+		return market_probs(*clubelo_fixtures_grids(data, fixtures, football_data_to_ClubELO_names_mapping))
+	if args.source == 'clubelo_history':
+		return {'hub': clubelo_history_probs(data, RatingHistory.load(args.elo_history), football_data_to_ClubELO_names_mapping)}
+	if args.source == 'league_model':
+		return {'hub': league_model_probs(data, args.model_path)}
+	return {'hub': elo_formula_probs(data)}
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--source', choices=['elo_formula', 'clubelo_history', 'clubelo_fixtures', 'league_model'], default='elo_formula')
+	parser.add_argument('--fixtures', default=None, help='CSV of archived predictions in the ClubELO fixtures format, for --source clubelo_fixtures')
+	parser.add_argument('--elo-history', default=settings.ELO_HISTORY_PATH, help='Rating history written by app.core.elo_history, for --source clubelo_history')
+	parser.add_argument('--model-path', default='app/files/models')
+	parser.add_argument('--stats-path', default='app/files/stats')
+	parser.add_argument('--leagues', nargs='+', default=['E0', 'E1', 'E2', 'E3', 'I1', 'SP1', 'D1', 'F1'])
+	parser.add_argument('--start-year', type=int, default=2012)
+	parser.add_argument('--end-year', type=int, default=2025)
+	parser.add_argument('--evaluate-from', default=None, help='First season to score, e.g. 2324. Earlier seasons fit the calibration.')
+	parser.add_argument('--fit', choices=['none', 'isotonic', 'platt'], default='none')
+	parser.add_argument('--bins', type=int, default=10)
+	parser.add_argument('--save-calibration', action='store_true', help='Save the fitted calibration to CALIBRATION_PATH, for --source clubelo_fixtures')
+	args = parser.parse_args()
+	if args.fit != 'none' and not args.evaluate_from:
+		parser.error('--fit needs --evaluate-from, so the calibration is scored on seasons it was not fitted on')
+	if args.save_calibration and (args.fit == 'none' or args.source != 'clubelo_fixtures'):
+		parser.error('--save-calibration needs --fit and --source clubelo_fixtures, the probabilities the API serves')
+
+	data = load_matches(args.start_year, args.end_year, args.leagues)
+	fixtures = pd.read_csv(args.fixtures) if args.source == 'clubelo_fixtures' else None
+	probs = source_probs(data, args, fixtures)
+	outcomes = market_outcomes(data)
+	evaluated = (data['Season'] >= args.evaluate_from).to_numpy() if args.evaluate_from else np.ones(len(data), dtype=bool)
+	leagues = data['Div'].to_numpy()
+
+	scored = {'raw': probs}
+	if args.fit != 'none':
+		calibration = fit_calibration(probs['hub'][~evaluated], outcomes['hub'][~evaluated], args.fit)
+		if fixtures is not None:
+			scored[args.fit] = source_probs(data, args, calibrated_fixtures(fixtures, calibration))
+		else:
+			scored[args.fit] = {'hub': calibration.apply(probs['hub'])}
+		if args.save_calibration:
+			calibration.save(settings.CALIBRATION_PATH)
+			print(f'Saved the calibration to {settings.CALIBRATION_PATH}')
+
+	os.makedirs(args.stats_path, exist_ok=True)
+	results, curves = [], []
+	for name, name_probs in scored.items():
+		name_probs = {market: predicted[evaluated] for market, predicted in name_probs.items()}
+		name_outcomes = {market: outcome[evaluated] for market, outcome in outcomes.items()}
+		results.append(evaluate(name_probs, name_outcomes, leagues[evaluated]).assign(probabilities=name))
+		curves.append(reliability_curves(name_probs, name_outcomes, leagues[evaluated], args.bins).assign(probabilities=name))
+	results = pd.concat(results, ignore_index=True)
+	results.to_csv(f'{args.stats_path}/evaluation_{args.source}.csv', index=False)
+	pd.concat(curves, ignore_index=True).to_csv(f'{args.stats_path}/evaluation_{args.source}_reliability.csv', index=False)
+	print(results.to_string(index=False))
+	print(f'Saved the scores and reliability curves to {args.stats_path}/evaluation_{args.source}*.csv')
+
+if __name__ == '__main__':
+	main()
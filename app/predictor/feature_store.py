@@ -0,0 +1,54 @@
+from glob import glob
+from joblib import dump, load
+import pandas as pd
+import shutil
+import os
+
+class FeatureStore():
+	"""
+	Columnar store for the training pipeline.
+	Datasets ('matches' for ELO-simulated match rows, 'features' for engineered league features) are written as one parquet file per Div and Season partition:
+		{path}/{dataset}/Div={div}/Season={season}/part.parquet
+	The ELO checkpoint and the per-league watermark of the latest processed match date are kept in {path}/state.joblib.
+	"""
+	def __init__(self, path='app/files/feature_store'):
+		self.path = path
+		self.state_path = f'{path}/state.joblib'
+
+	def _partition_path(self, dataset, div, season):
+		return f'{self.path}/{dataset}/Div={div}/Season={season}/part.parquet'
+
+	def clear(self):
+		shutil.rmtree(self.path, ignore_errors=True)
+
+	def write(self, dataset, data: pd.DataFrame, append=False):
+		"""
+		Writes every Div/Season partition present in data. Existing partitions are overwritten, or extended with the new rows if append is True.
+		"""
+		for (div, season), partition in data.groupby(['Div', 'Season'], sort=False):
+			file_path = self._partition_path(dataset, div, season)
+			if append and os.path.exists(file_path):
+				partition = pd.concat([pd.read_parquet(file_path), partition], ignore_index=True)
+			os.makedirs(os.path.dirname(file_path), exist_ok=True)
+			partition.to_parquet(file_path, index=False)
+
+	def read(self, dataset, div=None, seasons=None) -> pd.DataFrame:
+		"""
+		Reads the partitions of a dataset, optionally limited to one Div and a list of seasons. Rows are returned in date order with a fresh RangeIndex.
+		"""
+		files = sorted(glob(self._partition_path(dataset, div or '*', '*')))
+		if seasons is not None:
+			files = [f for f in files if os.path.basename(os.path.dirname(f)).split('=', 1)[1] in seasons]
+		if not files:
+			return pd.DataFrame()
+		data = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+		return data.sort_values('Date', kind='stable', ignore_index=True)
+
+	def load_state(self):
+		if not os.path.exists(self.state_path):
+			return None
+		return load(self.state_path)
+
+	def save_state(self, state: dict):
+		os.makedirs(self.path, exist_ok=True)
+		dump(state, self.state_path)
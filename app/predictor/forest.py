@@ -0,0 +1,106 @@
+import numpy as np
+import json
+import os
+
+class CompactForest():
+	"""
+	A fitted RandomForestRegressor flattened into contiguous NumPy arrays, evaluated without sklearn.
+	All trees share one node table. feature, threshold, left, right and value are indexed by global node id, and roots holds the root node of every tree.
+	Leaves point to themselves, so every sample can be walked a fixed max_depth steps in lockstep.
+	missing_left holds the child sklearn sends missing (NaN) inputs to at each split; exports made before it was kept reject NaN inputs.
+	"""
+	array_names = ['feature', 'threshold', 'left', 'right', 'value', 'roots', 'missing_left']
+
+	def __init__(self, feature, threshold, left, right, value, roots, max_depth, feature_names_in_, residual_std_=None, missing_left=None):
+		self.feature = feature
+		self.threshold = threshold
+		self.left = left
+		self.right = right
+		self.value = value
+		self.roots = roots
+		self.missing_left = missing_left
+		self.max_depth = max_depth
+		self.feature_names_in_ = np.asarray(feature_names_in_)
+		if residual_std_ is not None:
+			self.residual_std_ = residual_std_
+
+	@classmethod
+	def from_sklearn(cls, forest, quantize=False) -> 'CompactForest':
+		"""
+		Args:
+			forest (RandomForestRegressor): Fitted single-output forest.
+			quantize (bool): Store thresholds and leaf values as float32. Thresholds are rounded down to the nearest float32, which keeps the split decisions identical because sklearn compares float32 inputs.
+		"""
+		trees = [estimator.tree_ for estimator in forest.estimators_]
+		sizes = np.array([tree.node_count for tree in trees])
+		roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+		node_ids = np.arange(sizes.sum(), dtype=np.int32)
+
+		left = np.concatenate([tree.children_left for tree in trees]).astype(np.int32)
+		right = np.concatenate([tree.children_right for tree in trees]).astype(np.int32)
+		is_leaf = left == -1
+		offsets = np.repeat(roots, sizes)
+		left = np.where(is_leaf, node_ids, left + offsets).astype(np.int32)
+		right = np.where(is_leaf, node_ids, right + offsets).astype(np.int32)
+		feature = np.where(is_leaf, 0, np.concatenate([tree.feature for tree in trees])).astype(np.int32)
+		threshold = np.concatenate([tree.threshold for tree in trees])
+		value = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+		missing_left = np.concatenate([tree.missing_go_to_left for tree in trees]).astype(bool)
+		if quantize:
+			threshold_32 = threshold.astype(np.float32)
+			rounded_up = threshold_32 > threshold
+			threshold_32[rounded_up] = np.nextafter(threshold_32[rounded_up], np.float32(-np.inf))
+			threshold = threshold_32
+			value = value.astype(np.float32)
+
+		return cls(
+			feature=feature,
+			threshold=threshold,
+			left=left,
+			right=right,
+			value=value,
+			roots=roots,
+			missing_left=missing_left,
+			max_depth=max(tree.max_depth for tree in trees),
+			feature_names_in_=getattr(forest, 'feature_names_in_', np.arange(forest.n_features_in_).astype(str)),
+			residual_std_=getattr(forest, 'residual_std_', None),
+		)
+
+	def predict(self, X) -> np.ndarray:
+		# sklearn evaluates splits on float32 inputs, so do the same for identical decisions
+		X = np.asarray(X, dtype=np.float32)
+		missing = np.isnan(X).any()
+		if missing and self.missing_left is None:
+			raise ValueError('Input contains NaN, and this forest was exported without the missing value directions')
+		rows = np.arange(len(X))[:, None]
+		nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+		for _ in range(self.max_depth):
+			x = X[rows, self.feature[nodes]]
+			go_left = x <= self.threshold[nodes]
+			if missing:
+				go_left = np.where(np.isnan(x), self.missing_left[nodes], go_left)
+			nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+		return self.value[nodes].mean(axis=1, dtype=np.float64)
+
+	@property
+	def nbytes(self) -> int:
+		return sum(getattr(self, name).nbytes for name in self.array_names if getattr(self, name) is not None)
+
+	def save(self, path):
+		os.makedirs(path, exist_ok=True)
+		for name in self.array_names:
+			if getattr(self, name) is not None:
+				np.save(f'{path}/{name}.npy', getattr(self, name))
+		with open(f'{path}/meta.json', 'w') as f:
+			json.dump({
+				'max_depth': int(self.max_depth),
+				'feature_names_in_': [str(name) for name in self.feature_names_in_],
+				'residual_std_': getattr(self, 'residual_std_', None),
+			}, f)
+
+	@classmethod
+	def load(cls, path, mmap_mode='r') -> 'CompactForest':
+		with open(f'{path}/meta.json') as f:
+			meta = json.load(f)
+		arrays = {name: np.load(f'{path}/{name}.npy', mmap_mode=mmap_mode) for name in cls.array_names if os.path.exists(f'{path}/{name}.npy')}
+		return cls(**arrays, **meta)
@@ -0,0 +1,202 @@
+"""
+Monte Carlo simulation of the rest of a league season, for title, top-four and relegation odds to compare with outright markets.
+
+Every remaining fixture gets a goal difference distribution over -6..6: from the GD columns of ClubELO fixtures.csv where the fixture is
+published, otherwise from the ELO formula on the current ratings with the winning margins spread as a rounded normal. Seasons are drawn
+in batches as NumPy arrays (one uniform per season and fixture), the tables are ranked on points, then goal difference, then a random
+draw, and the batches run in a process pool. Memory depends on the batch size only, and time grows linearly with seasons times fixtures.
+
+Run with: python -m app.predictor.season --results E0.csv --seasons 100000 [--source fixtures] [--workers 4]
+"""
+from app.config.config import settings
+from app.core.calibration import HUBCalibration, load_calibration
+from app.core.markets import MAX_GD, gd_columns
+from app.core.repositories import TeamRatingsRepository
+from app.utils.utils import calculate_elo_probs_batch, goal_difference_probs, ndtr, read_csv_columns, float_column, football_data_to_ClubELO_names_mapping, DRAW_FACTOR, HOME_ADVANTAGE
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import itertools
+import argparse
+import os
+
+# Goal differences of the GD columns: GD<-5 and GD>5 count as -6 and 6
+goal_differences = np.arange(-MAX_GD, MAX_GD + 1)
+
+def normal_gd_pmf(mean: np.ndarray, std: float) -> np.ndarray:
+	"""(n, 13) goal difference distributions of Normal(mean, std) rounded to the nearest integer, with the tails in -6 and 6"""
+	edges = ndtr((goal_differences[:-1] + 0.5 - np.asarray(mean, dtype=float)[:, None]) / std)
+	return np.diff(edges, prepend=0.0, append=1.0, axis=1)
+
+def elo_gd_pmf(home_elo, away_elo, draw_factor=DRAW_FACTOR, home_advantage=HOME_ADVANTAGE, std=1.7) -> np.ndarray:
+	"""
+	(n, 13) goal difference distributions with the HUB probabilities of the ELO formula. Within home wins and within away wins the margins
+	follow a rounded Normal(mean, std), with the mean for which the normal gives the same home minus away probability as the formula.
+	"""
+	home, draw, away = calculate_elo_probs_batch(home_elo, away_elo, draw_factor, home_advantage)
+	means = np.linspace(-6, 6, 1201)
+	normal_home, _, normal_away = goal_difference_probs(means, std)
+	mean = np.interp(home - away, normal_home - normal_away, means)
+	pmf = normal_gd_pmf(mean, std)
+	home_part, away_part = pmf[:, MAX_GD + 1:], pmf[:, :MAX_GD]
+	pmf[:, MAX_GD + 1:] = home_part * (home / np.maximum(home_part.sum(axis=1), 1e-12))[:, None]
+	pmf[:, MAX_GD] = draw
+	pmf[:, :MAX_GD] = away_part * (away / np.maximum(away_part.sum(axis=1), 1e-12))[:, None]
+	return pmf
+
+@dataclass
+class Season:
+	"""The table so far and the remaining fixtures, with a goal difference distribution per fixture"""
+	teams: List[str]
+	points: np.ndarray
+	goal_difference: np.ndarray
+	home: np.ndarray
+	away: np.ndarray
+	gd_pmf: np.ndarray
+
+	@property
+	def gd_cdf(self) -> np.ndarray:
+		cdf = np.cumsum(self.gd_pmf, axis=1)
+		return cdf / cdf[:, -1:]
+
+def simulate_batch(season: Season, n_seasons: int, seed) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+	Plays the remaining fixtures n_seasons times. Returns the (teams, positions) count of each team finishing in each position, and the
+	total points per team over the simulated seasons.
+	"""
+	rng = np.random.default_rng(seed)
+	n_teams, n_fixtures = len(season.teams), len(season.home)
+	cdf = season.gd_cdf
+	gd = np.empty((n_seasons, n_fixtures), dtype=np.float32)
+	for j in range(n_fixtures):
+		gd[:, j] = goal_differences[np.minimum(np.searchsorted(cdf[j], rng.random(n_seasons), side='right'), len(goal_differences) - 1)]
+	draw = gd == 0
+	home_points = np.float32(3) * (gd > 0) + draw
+	away_points = np.float32(3) * (gd < 0) + draw
+	# One-hot (fixtures, teams) matrices, so the tables are two matrix products per batch instead of a loop over fixtures
+	plays_home = np.zeros((n_fixtures, n_teams), dtype=np.float32)
+	plays_home[np.arange(n_fixtures), season.home] = 1
+	plays_away = np.zeros((n_fixtures, n_teams), dtype=np.float32)
+	plays_away[np.arange(n_fixtures), season.away] = 1
+	points = season.points + home_points @ plays_home + away_points @ plays_away
+	goal_difference = season.goal_difference + gd @ (plays_home - plays_away)
+	# Points, then goal difference, then a random draw. Goal differences stay well within +-500 over a season.
+	key = points.astype(np.float64) * 1000 + goal_difference + rng.random((n_seasons, n_teams))
+	order = np.argsort(-key, axis=1)
+	counts = np.bincount((order * n_teams + np.arange(n_teams)).ravel(), minlength=n_teams * n_teams).reshape(n_teams, n_teams)
+	return counts, points.sum(axis=0, dtype=np.float64)
+
+def simulate(season: Season, n_seasons=100_000, batch_size=10_000, n_workers=None, seed=0) -> pd.DataFrame:
+	"""
+	Position probabilities per team (columns 1 to the number of teams), with expected points and mean position. The batches get seeds
+	spawned from seed, so the result does not depend on the number of workers.
+	"""
+	sizes = [min(batch_size, n_seasons - start) for start in range(0, n_seasons, batch_size)]
+	seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+	n_workers = min(n_workers or os.cpu_count() or 1, len(sizes))
+	if n_workers > 1:
+		with ProcessPoolExecutor(max_workers=n_workers) as executor:
+			results = list(executor.map(simulate_batch, itertools.repeat(season), sizes, seeds))
+	else:
+		results = [simulate_batch(season, size, batch_seed) for size, batch_seed in zip(sizes, seeds)]
+	counts = sum(result[0] for result in results)
+	n_teams = len(season.teams)
+	positions = pd.DataFrame(counts / n_seasons, index=season.teams, columns=range(1, n_teams + 1))
+	positions.insert(0, 'mean_position', positions.to_numpy() @ np.arange(1, n_teams + 1))
+	positions.insert(0, 'expected_points', sum(result[1] for result in results) / n_seasons)
+	return positions.sort_values('mean_position')
+
+def outright_odds(positions: pd.DataFrame, top=4, relegated=3) -> pd.DataFrame:
+	"""Title, top and relegation probabilities from the position probabilities of simulate"""
+	n_teams = positions.shape[1] - 2
+	return pd.DataFrame({
+		'title': positions[1],
+		f'top_{top}': positions[list(range(1, top + 1))].sum(axis=1),
+		'relegation': positions[list(range(n_teams - relegated + 1, n_teams + 1))].sum(axis=1),
+	})
+
+class FixtureProbabilities:
+	"""Goal difference distributions of fixtures, from ClubELO fixtures where published and from the ELO formula otherwise"""
+	def __init__(self, ratings: TeamRatingsRepository, fixtures: Optional[Dict[Tuple[str, str], np.ndarray]] = None, draw_factor=DRAW_FACTOR, home_advantage=HOME_ADVANTAGE):
+		self.ratings = ratings
+		self.fixtures = fixtures or {}
+		self.draw_factor = draw_factor
+		self.home_advantage = home_advantage
+
+	@staticmethod
+	def read_fixtures(path: str, name_mapping: Dict[str, str], calibration: Optional[HUBCalibration] = None) -> Dict[Tuple[str, str], np.ndarray]:
+		"""
+		GD distributions per (home, away) in a ClubELO fixtures CSV, under the names name_mapping maps them to. With a calibration, they are
+		calibrated as FixturesRepository serves them.
+		"""
+		columns = read_csv_columns(path, ['Home', 'Away', *gd_columns])
+		home, away = columns.pop('Home'), columns.pop('Away')
+		columns = {name: float_column(values) for name, values in columns.items()}
+		if calibration is not None:
+			columns = calibration.calibrate_columns(columns)
+		pmf = np.nan_to_num(np.column_stack([columns.get(column, np.zeros(len(home))) for column in gd_columns]))
+		return {(name_mapping.get(h, h), name_mapping.get(a, a)): row for h, a, row in zip(home, away, pmf)}
+
+	def gd_pmf(self, home: List[str], away: List[str]) -> np.ndarray:
+		home_elo, away_elo = (np.nan_to_num(self.ratings.get_elo_ratings(teams), nan=self.ratings.default_elo) for teams in (home, away))
+		pmf = elo_gd_pmf(home_elo, away_elo, self.draw_factor, self.home_advantage)
+		for i, fixture in enumerate(zip(home, away)):
+			if fixture in self.fixtures and self.fixtures[fixture].sum() > 0:
+				pmf[i] = self.fixtures[fixture]
+		return pmf
+
+def season_from_results(results: pd.DataFrame, probabilities: FixtureProbabilities, teams: Optional[List[str]] = None) -> Season:
+	"""
+	The table from the played matches (HomeTeam, AwayTeam, FTHG and FTAG columns as in football-data.co.uk files) and the rest of the
+	double round robin between their teams as remaining fixtures.
+	"""
+	teams = teams or sorted(set(results['HomeTeam']) | set(results['AwayTeam']))
+	team_ids = {team: i for i, team in enumerate(teams)}
+	home = results['HomeTeam'].map(team_ids).to_numpy()
+	away = results['AwayTeam'].map(team_ids).to_numpy()
+	gd = (results['FTHG'] - results['FTAG']).to_numpy()
+	points = np.bincount(home, weights=np.where(gd > 0, 3, gd == 0), minlength=len(teams))
+	points += np.bincount(away, weights=np.where(gd < 0, 3, gd == 0), minlength=len(teams))
+	goal_difference = np.bincount(home, weights=gd, minlength=len(teams)) - np.bincount(away, weights=gd, minlength=len(teams))
+	played = set(zip(home, away))
+	remaining = np.array([(h, a) for h in range(len(teams)) for a in range(len(teams)) if h != a and (h, a) not in played], dtype=int).reshape(-1, 2)
+	gd_pmf = probabilities.gd_pmf([teams[h] for h in remaining[:, 0]], [teams[a] for a in remaining[:, 1]])
+	return Season(teams, points, goal_difference, remaining[:, 0], remaining[:, 1], gd_pmf)
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--results', required=True, help='Played matches of the season in the football-data.co.uk format, a path or URL')
+	parser.add_argument('--source', choices=['elo', 'fixtures'], default='fixtures', help='fixtures uses ClubELO fixtures.csv where published, the ELO formula elsewhere')
+	parser.add_argument('--ratings', default=settings.ELO_CSV_PATH)
+	parser.add_argument('--fixtures', default=settings.FIXTURES_CSV_PATH)
+	parser.add_argument('--draw-factor', type=float, default=DRAW_FACTOR)
+	parser.add_argument('--home-advantage', type=float, default=HOME_ADVANTAGE)
+	parser.add_argument('--seasons', type=int, default=100_000)
+	parser.add_argument('--batch-size', type=int, default=10_000)
+	parser.add_argument('--workers', type=int, default=None)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--top', type=int, default=4)
+	parser.add_argument('--relegated', type=int, default=3)
+	parser.add_argument('--output', default=None, help='CSV for the position probabilities')
+	args = parser.parse_args()
+
+	results = pd.read_csv(args.results).dropna(subset=['HomeTeam', 'AwayTeam', 'FTHG', 'FTAG'])
+	# Teams go by their football-data.co.uk names: ratings are looked up under the ClubELO names, and fixtures are keyed back to football-data names
+	ratings = TeamRatingsRepository.from_csv(args.ratings, football_data_to_ClubELO_names_mapping)
+	to_football_data = {club: team for team, club in football_data_to_ClubELO_names_mapping.items()}
+	fixtures = FixtureProbabilities.read_fixtures(args.fixtures, to_football_data, load_calibration(settings.CALIBRATION_PATH)) if args.source == 'fixtures' and os.path.exists(args.fixtures) else None
+	season = season_from_results(results, FixtureProbabilities(ratings, fixtures, args.draw_factor, args.home_advantage))
+	unrated = [team for team, rating in zip(season.teams, ratings.get_elo_ratings(season.teams)) if np.isnan(rating)]
+	if unrated:
+		print(f'No ClubELO rating, using {ratings.default_elo}: {", ".join(unrated)}')
+
+	positions = simulate(season, args.seasons, args.batch_size, args.workers, args.seed)
+	if args.output:
+		positions.to_csv(args.output)
+	print(f'{len(season.home)} remaining fixtures, {args.seasons} simulated seasons')
+	print(positions[['expected_points', 'mean_position']].join(outright_odds(positions, args.top, args.relegated)).round(3).to_string())
+
+if __name__ == '__main__':
+	main()
@@ -3,259 +3,411 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 import numpy as np
 import pandas as pd
-from joblib import dump
+from joblib import dump, load
 from sklearn.metrics import classification_report
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .feature_store import FeatureStore
+from .forest import CompactForest
+from app.utils.utils import goal_difference_probs
+import tempfile
+import time
 import os
 
+columns_to_remove = [
+	"FTR",
+	"HTHG",
+	"HTAG",
+	"HTR",
+	"HS",
+	"AS",
+	"HST",
+	"AST",
+	"HF",
+	"AF",
+	"HC",
+	"AC",
+	"HY",
+	"AY",
+	"HR",
+	"AR",
+	"Home ELO",
+	"Away ELO",
+	"FTHG_Sum_5",
+	"FTAG_Sum_5",
+	"FTHG_Sum_5_opponent",
+	"FTAG_Sum_5_opponent",
+	"Home Goal Difference last 5",
+	"Away Goal Difference last 5",
+	"Home_Points_5",
+	"Away_Points_5",
+	"Home ELO_Change_5",
+	"Away ELO_Change_5",
+	"Home ELO_Mean_5_opponent",
+	"Away ELO_Mean_5_opponent",
+	"HST_Sum_5",
+	"AST_Sum_5",
+	"HST_Sum_5_opponent",
+	"AST_Sum_5_opponent",
+	"HS_Sum_5",
+	"AS_Sum_5",
+	"HS_Sum_5_opponent",
+	"AS_Sum_5_opponent",
+	"HC_Sum_5",
+	"AC_Sum_5",
+	"HC_Sum_5_opponent",
+	"AC_Sum_5_opponent",
+	"HF_Sum_5",
+	"AF_Sum_5",
+	"HF_Sum_5_opponent",
+	"AF_Sum_5_opponent",
+	"HY_Sum_5",
+	"AY_Sum_5",
+	"HR_Sum_5",
+	"AR_Sum_5",
+]
+
+def build_league_features(league_data: pd.DataFrame) -> pd.DataFrame:
+	"""
+	Adds the last-5 form features used by the league models, drops the raw match columns and adds the Outcome (goal difference) target.
+	"""
+	league_data = util.add_form_column(league_data, 'FTHG', 'FTAG', n=5, operation='Sum', regard_opponent=False, include_current=False)
+	league_data['Diff_goals_scored'] = league_data['FTHG_Sum_5'] - league_data['FTAG_Sum_5']
+	league_data = util.add_form_column(league_data, 'FTHG', 'FTAG', n=5, operation='Sum', regard_opponent=True, include_current=False)
+	league_data['Diff_goals_conceded'] = league_data['FTHG_Sum_5_opponent'] - league_data['FTAG_Sum_5_opponent']
+	league_data['Home Goal Difference last 5'] = league_data['FTHG_Sum_5'] - league_data['FTHG_Sum_5_opponent']
+	league_data['Away Goal Difference last 5'] = league_data['FTAG_Sum_5'] - league_data['FTAG_Sum_5_opponent']
+	league_data['Diff_goal_diff'] = league_data['Home Goal Difference last 5'] - league_data['Away Goal Difference last 5']
+	league_data = util.add_form_column(league_data, 'Home', 'Away', n=5, operation='Points', regard_opponent=False, include_current=False)
+	league_data['Diff_points'] = league_data['Home_Points_5'] - league_data['Away_Points_5']
+	league_data = util.add_form_column(league_data, 'Home ELO', 'Away ELO', n=5, operation='Change', regard_opponent=False, include_current=True)
+	league_data['Diff_change_in_ELO'] = league_data['Home ELO_Change_5'] - league_data['Away ELO_Change_5']
+	league_data = util.add_form_column(league_data, 'Home ELO', 'Away ELO', n=5, operation='Mean', regard_opponent=True, include_current=False)
+	league_data['Diff_opposition_mean_ELO'] = league_data['Home ELO_Mean_5_opponent'] - league_data['Away ELO_Mean_5_opponent']
+	league_data = util.add_form_column(league_data, 'HST', 'AST', n=5, operation='Sum', regard_opponent=False, include_current=False)
+	league_data['Diff_shots_on_target_attempted'] = league_data['HST_Sum_5'] - league_data['AST_Sum_5']
+	league_data = util.add_form_column(league_data, 'HST', 'AST', n=5, operation='Sum', regard_opponent=True, include_current=False)
+	league_data['Diff_shots_on_target_allowed'] = league_data['HST_Sum_5_opponent'] - league_data['AST_Sum_5_opponent']
+	league_data = util.add_form_column(league_data, 'HS', 'AS', n=5, operation='Sum', regard_opponent=False, include_current=False)
+	league_data['Diff_shots_attempted'] = league_data['HS_Sum_5'] - league_data['AS_Sum_5']
+	league_data = util.add_form_column(league_data, 'HS', 'AS', n=5, operation='Sum', regard_opponent=True, include_current=False)
+	league_data['Diff_shots_allowed'] = league_data['HS_Sum_5_opponent'] - league_data['AS_Sum_5_opponent']
+	league_data = util.add_form_column(league_data, 'HC', 'AC', n=5, operation='Sum', regard_opponent=False, include_current=False)
+	league_data['Diff_corners_awarded'] = league_data['HC_Sum_5'] - league_data['AC_Sum_5']
+	league_data = util.add_form_column(league_data, 'HC', 'AC', n=5, operation='Sum', regard_opponent=True, include_current=False)
+	league_data['Diff_corners_conceded'] = league_data['HC_Sum_5_opponent'] - league_data['AC_Sum_5_opponent']
+	league_data = util.add_form_column(league_data, 'HF', 'AF', n=5, operation='Sum', regard_opponent=False, include_current=False)
+	league_data['Diff_fouls_commited'] = league_data['HF_Sum_5'] - league_data['AF_Sum_5']
+	league_data = util.add_form_column(league_data, 'HF', 'AF', n=5, operation='Sum', regard_opponent=True, include_current=False)
+	league_data['Diff_fouls_suffered'] = league_data['HF_Sum_5_opponent'] - league_data['AF_Sum_5_opponent']
+	league_data = util.add_form_column(league_data, 'HY', 'AY', n=5, operation='Sum', regard_opponent=False, include_current=False)
+	league_data['Diff_yellow_cards'] = league_data['HY_Sum_5'] - league_data['AY_Sum_5']
+	league_data = util.add_form_column(league_data, 'HR', 'AR', n=5, operation='Sum', regard_opponent=False, include_current=False)
+	league_data['Diff_red_cards'] = league_data['HR_Sum_5'] - league_data['AR_Sum_5']
+	league_data.drop(columns=columns_to_remove, inplace=True)
+	league_data["Outcome"] = league_data["FTHG"] - league_data["FTAG"]
+	return league_data
+
+def form_history_index(matches: pd.DataFrame, n=5) -> pd.Index:
+	"""
+	Returns the index of the rows holding the last n matches of every team in matches (rows in chronological order).
+	These rows are all add_form_column needs to compute the n-match form of the next match of each team.
+	"""
+	table = util.get_team_match_table(matches)
+	return table.groupby('Team', sort=False).tail(n).index.unique().sort_values()
+
+current_form_columns = [
+	'Div',
+	'Team',
+	'ELO',
+	'Goals scored',
+	'Goals conceded',
+	'Goals difference',
+	'Points',
+	'Change in ELO',
+	'Opposition mean ELO',
+	'Shots on target attempted',
+	'Shots on target allows',
+	'Shots attemped',
+	'Shots allowed',
+	'Corners awarded',
+	'Corners allowed',
+	'Fouls commited',
+	'Fouls suffered',
+	'Yellow cards',
+	'Red cards',
+]
+
+def build_current_form(data: pd.DataFrame, ratings: dict, leagues: list, n=5) -> pd.DataFrame:
+	"""
+	Current form of every team in the latest season of each league: its current ELO and totals over its last n matches in data.
+	Change in ELO is the current rating minus the rating before the last match, Opposition mean ELO is the mean opponent rating over the n matches.
+	"""
+	latest_season = data.groupby('Div')['Season'].transform('max')
+	current = data[(data['Season'] == latest_season) & data['Div'].isin(leagues)]
+	teams = current[['Div', 'HomeTeam']].drop_duplicates('HomeTeam').rename(columns={'HomeTeam': 'Team'})
+	teams = teams.sort_values('Div', key=lambda div: div.map({league: i for i, league in enumerate(leagues)}), kind='stable')
+
+	table = util.get_team_match_table(data)
+	table = table[table['Team'].isin(teams['Team'])]
+	last_matches = table.groupby('Team', sort=False).tail(n).groupby('Team', sort=False)
+	sum_columns = [column for column in current_form_columns[2:] if column in table.columns]
+	form = last_matches[sum_columns].sum()
+	form['Goals difference'] = form['Goals scored'] - form['Goals conceded']
+	form['Opposition mean ELO'] = last_matches['Opposition ELO'].mean()
+
+	snapshot = teams.join(form, on='Team')
+	snapshot['ELO'] = snapshot['Team'].map(ratings)
+	snapshot['Change in ELO'] = snapshot['ELO'] - snapshot['Team'].map(last_matches['ELO before'].last())
+	return snapshot[current_form_columns].reset_index(drop=True)
+
+# Feature rows columns that are identifiers or the target, not model inputs
+non_feature_columns = ["Outcome", "FTHG", "FTAG", "Season", "Div", "Date", "HomeTeam", "AwayTeam"]
+
+def fit_league_model(league, league_data, model_path, stats_path, n_jobs=1, warm_start_trees=0):
+	"""
+	Fits and evaluates the model for one league on its feature rows and dumps it to model_path.
+	With warm_start_trees > 0 the existing model is loaded and that many trees are added instead of fitting a new forest.
+	"""
+	X = league_data.drop(columns=non_feature_columns)
+	y = league_data["Outcome"]
+	file_path = f'{model_path}/{league}_model.joblib'
+	if warm_start_trees and os.path.exists(file_path):
+		rf = load(file_path)
+		rf.set_params(warm_start=True, n_estimators=rf.n_estimators + warm_start_trees, n_jobs=n_jobs)
+	else:
+		rf = RandomForestRegressor(n_estimators=200, random_state=42, n_jobs=n_jobs)
+	X_train, X_test, y_train, y_test = train_test_split(
+		X, y, test_size=0.2, random_state=42)
+	rf.fit(X_train,y_train)
+	predictions = rf.predict(X_test)
+	# Spread of the actual goal difference around the prediction, used by the serving side to turn predictions into HUB probabilities
+	rf.residual_std_ = float(np.std(y_test - predictions))
+	print('Ordinary stats for model for', league)
+	categorized_preds = util.categorize_preds(predictions, 1, -1)
+	categorized_goal_diff = util.categorize_goal_diff(y_test)
+
+	report = classification_report(categorized_goal_diff, categorized_preds)
+	print(report)
+	filtered_predictions, filtered_targets = util.remove_uncertain(categorized_preds, categorized_goal_diff)
+	print('Filtered (-1,1) stats for model for', league)
+	report = classification_report(filtered_predictions, filtered_targets, output_dict=True)
+	print(report)
+	report_df = pd.DataFrame(report).transpose()
+	report_df.to_csv(f'{stats_path}/{league}_report.csv', index=True)
+
+	rf.set_params(warm_start=False)
+	dump(rf, file_path)
+	print(f'Saved model for {league} to {file_path}')
+
+def train_league_model(league, data_path, store_path, model_path, stats_path, n_jobs=1):
+	"""
+	Builds features for one league, writes them to the feature store and fits the league model.
+	Runs in a worker process. The ELO-simulated dataset is read from data_path with mmap_mode='r', so the numeric columns are shared between workers instead of being pickled for every task.
+	Returns the league and the elapsed time in seconds.
+	"""
+	start = time.perf_counter()
+	data = load(data_path, mmap_mode='r')
+	league_data = data[data['Div'] == league].copy()
+	league_data = build_league_features(league_data)
+	FeatureStore(store_path).write('features', league_data)
+	fit_league_model(league, league_data, model_path, stats_path, n_jobs)
+	return league, time.perf_counter() - start
+
+def retrain_league_model(league, store_path, model_path, stats_path, n_jobs=1, warm_start_trees=0):
+	"""
+	Fits the league model from the features already in the feature store. With warm_start_trees > 0 only the latest season is used to grow the added trees.
+	Returns the league and the elapsed time in seconds.
+	"""
+	start = time.perf_counter()
+	store = FeatureStore(store_path)
+	league_data = store.read('features', league)
+	if warm_start_trees:
+		league_data = league_data[league_data['Season'] == league_data['Season'].max()]
+	fit_league_model(league, league_data, model_path, stats_path, n_jobs, warm_start_trees)
+	return league, time.perf_counter() - start
+
+def walk_forward_fold(league, matrix_path, test_season, n_jobs=1):
+	"""
+	Fits a forest on every season before test_season and evaluates it on test_season.
+	Runs in a worker process. The feature matrix is memory-mapped from matrix_path, so the folds of a league share one copy in the page cache.
+	Returns the fold metrics as a dict.
+	"""
+	start = time.perf_counter()
+	matrix = load(matrix_path, mmap_mode='r')
+	season = matrix['season']
+	train, test = season < test_season, season == test_season
+	# The residual spread for the probabilities comes from out-of-bag predictions, so nothing from the test season leaks into them
+	rf = RandomForestRegressor(n_estimators=200, random_state=42, n_jobs=n_jobs, oob_score=True)
+	rf.fit(matrix['X'][train], matrix['y'][train])
+	y_train, y_test = matrix['y'][train], matrix['y'][test]
+	predictions = rf.predict(matrix['X'][test])
+	home, draw, away = goal_difference_probs(predictions, float(np.std(y_train - rf.oob_prediction_)))
+	probs = np.clip(np.column_stack([home, draw, away]), 1e-12, 1)
+	outcome = np.select([y_test > 0, y_test == 0], [0, 1], 2)
+	observed = np.arange(3) == outcome[:, None]
+	return {
+		'league': league,
+		'test_season': matrix['season_names'][test_season],
+		'train_seasons': int(test_season),
+		'train_rows': int(train.sum()),
+		'test_rows': int(test.sum()),
+		'mae': float(np.abs(y_test - predictions).mean()),
+		'rmse': float(np.sqrt(((y_test - predictions) ** 2).mean())),
+		'residual_std': float(np.std(y_test - predictions)),
+		'accuracy': float((probs.argmax(axis=1) == outcome).mean()),
+		'brier': float(((probs - observed) ** 2).sum(axis=1).mean()),
+		'log_loss': float(-np.log(probs[observed]).mean()),
+		'seconds': round(time.perf_counter() - start, 2),
+	}
+
 class PredictorTrainer():
-	def __init__(self):
+	def __init__(self, n_workers=None, n_jobs=1, quantize=True):
+		"""
+		Args:
+			n_workers (int): Number of processes training leagues in parallel. Defaults to one per league, capped at the CPU count.
+			n_jobs (int): Number of threads each RandomForestRegressor uses for tree building. Keep n_workers * n_jobs at or below the CPU count.
+			quantize (bool): Store thresholds and leaf values of the exported compact forests as float32.
+		"""
 		self.model_path = 'app/files/models'
 		self.stats_path = 'app/files/stats'
 		self.current_data_path = 'app/files/current_data.csv'
+		self.feature_store = FeatureStore('app/files/feature_store')
 		self.leagues = ['E0', 'E1', 'E2', 'E3', 'I1', 'SP1', 'D1', 'F1']
+		self.start_year = 2005
+		self.end_year = 2025
+		self.n_workers = n_workers or min(len(self.leagues), os.cpu_count() or 1)
+		self.n_jobs = n_jobs
+		self.quantize = quantize
+
+	def run_league_pool(self, worker, *args):
+		"""Runs worker(league, *args) for every league in a process pool and reports progress and timing per league."""
+		os.makedirs(self.model_path, exist_ok=True)
+		os.makedirs(self.stats_path, exist_ok=True)
+		start = time.perf_counter()
+		with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+			futures = [executor.submit(worker, league, *args) for league in self.leagues]
+			for done, future in enumerate(as_completed(futures), start=1):
+				league, elapsed = future.result()
+				print(f'[{done}/{len(self.leagues)}] Trained model for {league} in {elapsed:.1f}s')
+		print(f'Trained {len(self.leagues)} league models in {time.perf_counter() - start:.1f}s')
 
 	def train_models(self):
-		data = util.fetch_data(2005, 2025, self.leagues)
+		data = util.fetch_data(self.start_year, self.end_year, self.leagues)
 		data = util.clean_data(data)
 		draw_factor = data['FTR'].value_counts(normalize=True)['D']
 		ELO = util.ELO(data, init_rating=1500, draw_factor=draw_factor, k_factor=32, home_advantage=50)
 		data = ELO.perform_simulations(data)
 
-		for league in self.leagues:
-			league_data = data[data['Div'] == league]
-			league_data = util.add_form_column(league_data, 'FTHG', 'FTAG', n=5, operation='Sum', regard_opponent=False, include_current=False)
-			league_data['Diff_goals_scored'] = league_data['FTHG_Sum_5'] - league_data['FTAG_Sum_5']
-			league_data = util.add_form_column(league_data, 'FTHG', 'FTAG', n=5, operation='Sum', regard_opponent=True, include_current=False)
-			league_data['Diff_goals_conceded'] = league_data['FTHG_Sum_5_opponent'] - league_data['FTAG_Sum_5_opponent']
-			league_data['Home Goal Difference last 5'] = league_data['FTHG_Sum_5'] - league_data['FTHG_Sum_5_opponent']
-			league_data['Away Goal Difference last 5'] = league_data['FTAG_Sum_5'] - league_data['FTAG_Sum_5_opponent']
-			league_data['Diff_goal_diff'] = league_data['Home Goal Difference last 5'] - league_data['Away Goal Difference last 5']
-			league_data = util.add_form_column(league_data, 'Home', 'Away', n=5, operation='Points', regard_opponent=False, include_current=False)
-			league_data['Diff_points'] = league_data['Home_Points_5'] - league_data['Away_Points_5']
-			league_data = util.add_form_column(league_data, 'Home ELO', 'Away ELO', n=5, operation='Change', regard_opponent=False, include_current=True)
-			league_data['Diff_change_in_ELO'] = league_data['Home ELO_Change_5'] - league_data['Away ELO_Change_5']
-			league_data = util.add_form_column(league_data, 'Home ELO', 'Away ELO', n=5, operation='Mean', regard_opponent=True, include_current=False)
-			league_data['Diff_opposition_mean_ELO'] = league_data['Home ELO_Mean_5_opponent'] - league_data['Away ELO_Mean_5_opponent']
-			league_data = util.add_form_column(league_data, 'HST', 'AST', n=5, operation='Sum', regard_opponent=False, include_current=False)
-			league_data['Diff_shots_on_target_attempted'] = league_data['HST_Sum_5'] - league_data['AST_Sum_5']
-			league_data = util.add_form_column(league_data, 'HST', 'AST', n=5, operation='Sum', regard_opponent=True, include_current=False)
-			league_data['Diff_shots_on_target_allowed'] = league_data['HST_Sum_5_opponent'] - league_data['AST_Sum_5_opponent']
-			league_data = util.add_form_column(league_data, 'HS', 'AS', n=5, operation='Sum', regard_opponent=False, include_current=False)
-			league_data['Diff_shots_attempted'] = league_data['HS_Sum_5'] - league_data['AS_Sum_5']
-			league_data = util.add_form_column(league_data, 'HS', 'AS', n=5, operation='Sum', regard_opponent=True, include_current=False)
-			league_data['Diff_shots_allowed'] = league_data['HS_Sum_5_opponent'] - league_data['AS_Sum_5_opponent']
-			league_data = util.add_form_column(league_data, 'HC', 'AC', n=5, operation='Sum', regard_opponent=False, include_current=False)
-			league_data['Diff_corners_awarded'] = league_data['HC_Sum_5'] - league_data['AC_Sum_5']
-			league_data = util.add_form_column(league_data, 'HC', 'AC', n=5, operation='Sum', regard_opponent=True, include_current=False)
-			league_data['Diff_corners_conceded'] = league_data['HC_Sum_5_opponent'] - league_data['AC_Sum_5_opponent']
-			league_data = util.add_form_column(league_data, 'HF', 'AF', n=5, operation='Sum', regard_opponent=False, include_current=False)
-			league_data['Diff_fouls_commited'] = league_data['HF_Sum_5'] - league_data['AF_Sum_5']
-			league_data = util.add_form_column(league_data, 'HF', 'AF', n=5, operation='Sum', regard_opponent=True, include_current=False)
-			league_data['Diff_fouls_suffered'] = league_data['HF_Sum_5_opponent'] - league_data['AF_Sum_5_opponent']
-			league_data = util.add_form_column(league_data, 'HY', 'AY', n=5, operation='Sum', regard_opponent=False, include_current=False)
-			league_data['Diff_yellow_cards'] = league_data['HY_Sum_5'] - league_data['AY_Sum_5']
-			league_data = util.add_form_column(league_data, 'HR', 'AR', n=5, operation='Sum', regard_opponent=False, include_current=False)
-			league_data['Diff_red_cards'] = league_data['HR_Sum_5'] - league_data['AR_Sum_5']
-			columns_to_remove = [
-				"FTR",
-				"HTHG",
-				"HTAG",
-				"HTR",
-				"HS",
-				"AS",
-				"HST",
-				"AST",
-				"HF",
-				"AF",
-				"HC",
-				"AC",
-				"HY",
-				"AY",
-				"HR",
-				"AR",
-				"Home ELO",
-				"Away ELO",
-				"FTHG_Sum_5",
-				"FTAG_Sum_5",
-				"FTHG_Sum_5_opponent",
-				"FTAG_Sum_5_opponent",
-				"Home Goal Difference last 5",
-				"Away Goal Difference last 5",
-				"Home_Points_5",
-				"Away_Points_5",
-				"Home ELO_Change_5",
-				"Away ELO_Change_5",
-				"Home ELO_Mean_5_opponent",
-				"Away ELO_Mean_5_opponent",
-				"HST_Sum_5",
-				"AST_Sum_5",
-				"HST_Sum_5_opponent",
-				"AST_Sum_5_opponent",
-				"HS_Sum_5",
-				"AS_Sum_5",
-				"HS_Sum_5_opponent",
-				"AS_Sum_5_opponent",
-				"HC_Sum_5",
-				"AC_Sum_5",
-				"HC_Sum_5_opponent",
-				"AC_Sum_5_opponent",
-				"HF_Sum_5",
-				"AF_Sum_5",
-				"HF_Sum_5_opponent",
-				"AF_Sum_5_opponent",
-				"HY_Sum_5",
-				"AY_Sum_5",
-				"HR_Sum_5",
-				"AR_Sum_5",
-			]
-			league_data.drop(columns=columns_to_remove, inplace=True)
+		self.feature_store.clear()
+		self.feature_store.write('matches', data)
+		with tempfile.TemporaryDirectory() as tmp_dir:
+			data_path = os.path.join(tmp_dir, 'data.joblib')
+			dump(data, data_path)
+			self.run_league_pool(train_league_model, data_path, self.feature_store.path, self.model_path, self.stats_path, self.n_jobs)
+		self.save_checkpoint(data, ELO, draw_factor)
+		self.export_compact_models()
+		self.write_current_form(data, ELO.ratings)
 
-			league_data["Outcome"] = league_data.apply(
-				lambda row: (row["FTHG"] - row["FTAG"]),
-				axis=1,
-			)
+	def update_models(self, warm_start_trees=0):
+		"""
+		Incremental version of train_models.
+		Only seasons from the feature store's latest season onward are fetched, and only matches after each league's watermark are processed.
+		ELO is advanced from the stored checkpoint, features are computed for the new rows alone, and the league models are refitted from the stored features.
+		With warm_start_trees > 0 the existing forests are kept and that many trees are added instead.
+		Falls back to train_models when the feature store is empty.
+		"""
+		state = self.feature_store.load_state()
+		if state is None:
+			self.train_models()
+			return
 
-			X = league_data.copy().drop(
-				columns=["Outcome", "FTHG", "FTAG", "Season", "Div", "Date", "HomeTeam", "AwayTeam"],
-			)
-			y = league_data["Outcome"]
-			rf = RandomForestRegressor(n_estimators=200, random_state=42)
-			X_train, X_test, y_train, y_test = train_test_split(
-				X, y, test_size=0.2, random_state=42)
-			rf.fit(X_train,y_train)
-			predictions = rf.predict(X_test)
-			print('Ordinary stats for model for', league)
-			categorized_preds = self.categorize_preds(predictions, 1, -1)
-			categorized_goal_diff = self.categorize_goal_diff(y_test)
+		start = time.perf_counter()
+		data = util.fetch_data(2000 + int(state['season'][:2]), self.end_year, self.leagues)
+		data = util.clean_data(data)
+		watermarks = data['Div'].map(state['watermarks']).fillna(pd.Timestamp.min)
+		data = data[data['Date'] > watermarks].reset_index(drop=True)
+		if data.empty:
+			print('No new matches since', max(state['watermarks'].values()))
+			return
 
-			report = classification_report(categorized_goal_diff, categorized_preds)
-			print(report)
-			filtered_predictions, filtered_targets = self.remove_uncertain(categorized_preds, categorized_goal_diff)
-			print('Filtered (-1,1) stats for model for', league)
-			report = classification_report(filtered_predictions, filtered_targets, output_dict=True)
-			print(report)
-			report_df = pd.DataFrame(report).transpose()
-			os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
-			report_df.to_csv(f'{self.stats_path}/{league}_report.csv', index=True)
+		ELO = util.ELO(data, init_rating=1500, draw_factor=state['draw_factor'], k_factor=32, home_advantage=50)
+		ELO.ratings.update(state['ratings'])
+		data = ELO.perform_simulations(data)
+		for league, new_matches in data.groupby('Div', sort=False):
+			history = self.feature_store.read('matches', league)
+			if not history.empty:
+				history = history.loc[form_history_index(history)]
+			window = pd.concat([history, new_matches], ignore_index=True)
+			features = build_league_features(window).iloc[len(history):]
+			self.feature_store.write('matches', new_matches, append=True)
+			self.feature_store.write('features', features, append=True)
+			print(f'Added {len(new_matches)} new matches for {league}')
+		self.save_checkpoint(data, ELO, state['draw_factor'], state['watermarks'])
+		print(f'Updated feature store in {time.perf_counter() - start:.1f}s')
 
-			bins = np.arange(-3, 3.25, 0.25)
-			bins = np.append(bins, [np.inf, -np.inf])
-			#labels = [f"{bins[i]} to {bins[i+1]}" for i in range(len(bins)-1)]
-			#categories = pd.cut(predictions, bins=np.sort(bins), labels=labels, include_lowest=True)
-			#frame = pd.DataFrame({'Values': predictions, 'Category': categories, 'Labels': categorized_goal_diff})
-			#distribution = frame.groupby('Category')['Labels'].value_counts().unstack(fill_value=0)
-			#distribution['Total'] = frame.groupby('Category')['Values'].count()
-			#distribution_pct = distribution.div(distribution['Total'], axis=0) * 100
+		self.run_league_pool(retrain_league_model, self.feature_store.path, self.model_path, self.stats_path, self.n_jobs, warm_start_trees)
+		self.export_compact_models()
+		self.write_current_form(self.feature_store.read('matches'), ELO.ratings)
 
-			# Calculate inverse fractions for each label
-			#for label in [-1, 0, 1]:
-			#	distribution[f'{label}_inv'] = distribution['Total'] / distribution[label].replace(0, np.nan)
+	def walk_forward(self, min_train_seasons=3):
+		"""
+		Walk-forward evaluation of the league models on the features in the feature store: for every season t after the first min_train_seasons,
+		a forest is fitted on the seasons before t and tested on t. All folds of all leagues run in one process pool.
+		Per-fold metrics are written to {stats_path}/{league}_walk_forward.csv. Returns them as one frame.
+		"""
+		os.makedirs(self.stats_path, exist_ok=True)
+		start = time.perf_counter()
+		results = []
+		with tempfile.TemporaryDirectory() as tmp_dir, ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+			futures = []
+			for league in self.leagues:
+				features = self.feature_store.read('features', league)
+				if features.empty:
+					print('No features for', league, '- run train_models first')
+					continue
+				season_codes, season_names = pd.factorize(features['Season'], sort=True)
+				matrix_path = os.path.join(tmp_dir, f'{league}.joblib')
+				dump({
+					'X': np.ascontiguousarray(features.drop(columns=non_feature_columns).to_numpy(dtype=np.float64)),
+					'y': features['Outcome'].to_numpy(dtype=np.float64),
+					'season': season_codes,
+					'season_names': list(season_names),
+				}, matrix_path)
+				futures += [executor.submit(walk_forward_fold, league, matrix_path, t, self.n_jobs) for t in range(min_train_seasons, len(season_names))]
+			for done, future in enumerate(as_completed(futures), start=1):
+				fold = future.result()
+				results.append(fold)
+				print(f'[{done}/{len(futures)}] {fold["league"]} {fold["test_season"]}: MAE {fold["mae"]:.3f}, Brier {fold["brier"]:.4f} in {fold["seconds"]:.1f}s')
 
-			# Combine counts and percentages
-			#result = pd.concat([distribution, distribution_pct.add_suffix('_%')], axis=1)
-			#print('Distribution of predictions for', league)
-			#print(result)
-			#result.to_csv(f'{self.stats_path}/{league}_stats.csv', index=True, na_rep='0')
-			os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-			file_path = f'{self.model_path}/{league}_model.joblib'
-			dump(rf, file_path)
-			print(f'Saved model for {league} to {file_path}')
+		results = pd.DataFrame(results)
+		if results.empty:
+			return results
+		results = results.sort_values(['league', 'test_season'], ignore_index=True)
+		for league, folds in results.groupby('league'):
+			folds.to_csv(f'{self.stats_path}/{league}_walk_forward.csv', index=False)
+		print(f'Ran {len(results)} walk-forward folds in {time.perf_counter() - start:.1f}s')
+		return results
 
-		#Load current form into file	    
-		df_tmp = []
+	def save_checkpoint(self, data, ELO, draw_factor, watermarks=None):
+		"""Stores the ELO ratings and the latest processed match date per league, so update_models can continue from here."""
+		watermarks = dict(watermarks or {})
+		watermarks.update(data.groupby('Div')['Date'].max().to_dict())
+		self.feature_store.save_state({
+			'watermarks': watermarks,
+			'season': data['Season'].max(),
+			'ratings': dict(ELO.ratings),
+			'draw_factor': draw_factor,
+		})
+
+	def export_compact_models(self):
+		"""Flattens every saved league model into a CompactForest at {model_path}/{league}_forest, which the API serves without sklearn."""
 		for league in self.leagues:
-			league_data = util.fetch_data(2024, 2025, [league])
-			teams = league_data['HomeTeam'].unique()
-			for team in teams:
-				#ELO, goals scored, goals conceded, goal difference, points, change in ELO, opposition mean ELO, shots on target attempted, shots on target allowed, shot attempted, shots allows, corner awarded, corners conceded, fouls commited, fouls suffered, yellow cards, red cards
-				elo = ELO.ratings[team]
-				last_five_matches = util.get_all_matches_of_team(data, team).tail(5)
-				goals_scored = 0
-				goals_conceded = 0
-				goal_difference = 0
-				points = 0
-				change_in_ELO = 0 #, ta ELO ved nåværende minus første kamp ELO
-				oppoisition_mean_ELO = 0 #Er først sum
-				shots_on_target_attemped = 0
-				shots_on_target_allowed = 0
-				shots_attempted = 0
-				shots_allowed = 0
-				corners_awarded = 0
-				corners_allowed = 0
-				fouls_commited = 0
-				fouls_suffered = 0
-				yellow_cards = 0
-				red_cards = 0
-				i = 0
-				for index, match in last_five_matches.iterrows():
-					i += 1
-					if team == match['HomeTeam']:
-						goals_scored += match['FTHG']
-						goals_conceded += match['FTAG']
-						goal_difference += match['FTHG'] - match['FTAG']
-						if match['FTR'] == 'H':
-							points += 3
-						elif match['FTR'] == 'D':
-							points += 1
-						if i == len(last_five_matches):
-							change_in_ELO = elo - match['Home ELO']
-						oppoisition_mean_ELO += match['Away ELO']
-						shots_on_target_attemped += match['HST']
-						shots_on_target_allowed += match['AST']
-						shots_attempted += match['HS']
-						shots_allowed += match['AS']
-						corners_awarded += match['HC']
-						corners_allowed += match['AC']
-						fouls_commited +=  match['HF']
-						fouls_suffered += match['AF']
-						yellow_cards += match['HY']
-						red_cards += match['HR']
-						
-					elif team == match['AwayTeam']:
-						goals_scored += match['FTAG']
-						goals_conceded += match['FTHG']
-						goal_difference += match['FTAG'] - match['FTHG']
-						if match['FTR'] == 'A':
-							points += 3
-						elif match['FTR'] == 'D':
-							points += 1
-						if i == len(last_five_matches):
-							change_in_ELO = elo - match['Away ELO']
-						oppoisition_mean_ELO += match['Home ELO']
-						shots_on_target_attemped += match['AST']
-						shots_on_target_allowed += match['HST']
-						shots_attempted += match['AS']
-						shots_allowed += match['HS']
-						corners_awarded += match['AC']
-						corners_allowed += match['HC']
-						fouls_commited +=  match['AF']
-						fouls_suffered += match['HF']
-						yellow_cards += match['AY']
-						red_cards += match['AR']
-				oppoisition_mean_ELO = oppoisition_mean_ELO / len(last_five_matches)
-				df_dict = {
-					'Div': league,
-					'Team': team,
-					'ELO': elo,
-					'Goals scored': goals_scored,
-					'Goals conceded': goals_conceded,
-					'Goals difference': goal_difference,
-					'Points': points,
-					'Change in ELO': change_in_ELO,
-					'Opposition mean ELO': oppoisition_mean_ELO,
-					'Shots on target attempted': shots_on_target_attemped,
-					'Shots on target allows': shots_on_target_allowed,
-					'Shots attemped': shots_attempted,
-					'Shots allowed': shots_allowed,
-					'Corners awarded': corners_awarded,
-					'Corners allowed': corners_allowed,
-					'Fouls commited': fouls_commited,
-					'Fouls suffered': fouls_suffered,
-					'Yellow cards': yellow_cards,
-					'Red cards': red_cards
-				}	
-				df_tmp.append(df_dict)
-		df_final = pd.DataFrame(df_tmp)
+			forest = CompactForest.from_sklearn(load(f'{self.model_path}/{league}_model.joblib'), quantize=self.quantize)
+			forest.save(f'{self.model_path}/{league}_forest')
+			print(f'Exported compact model for {league} ({forest.nbytes / 1e6:.1f} MB)')
+
+	def write_current_form(self, data, ratings):
+		df_final = build_current_form(data, ratings, self.leagues)
 		os.makedirs(os.path.dirname(self.current_data_path), exist_ok=True)
 		df_final.to_csv(self.current_data_path, index=False)
 
@@ -3,7 +3,7 @@ import os
 import numpy as np
 
 
-def fetch_data(start_year, end_year, leagues) -> pd.DataFrame:
+def fetch_data(start_year, end_year, leagues, extra_cols=()) -> pd.DataFrame:
     url_template = "https://www.football-data.co.uk/mmz4281/{season}/{league}.csv"
     cols = [
         "Div",
@@ -64,7 +64,7 @@ def fetch_data(start_year, end_year, leagues) -> pd.DataFrame:
                 )
                 continue
 
-            existing_cols = [col for col in cols if col in df.columns]
+            existing_cols = [col for col in cols + list(extra_cols) if col in df.columns]
             df = df[existing_cols]
             df["Season"] = str(season).zfill(4)
             df_tmp.append(df)
@@ -204,7 +204,7 @@ class ELO:  # Kan gjøre slik at home_advantage lages slik at den helles gir hom
         teams = list(set(home_teams) | set(away_teams))
         for team in teams:
 
-            r = data[data["HomeTeam"] == team].iloc[0]
+            r = data[(data["HomeTeam"] == team) | (data["AwayTeam"] == team)].iloc[0]
 
             if r["Div"] == "E0": #Dette må gjøres om til å tåle alle ligaer
                 self.ratings[team] = self.init_rating
@@ -315,6 +315,47 @@ def get_all_matches_of_team(data, team):
     c = data.copy()
     return c[(c["HomeTeam"] == team) | (c["AwayTeam"] == team)]
 
+team_match_columns = {
+    # Column name: (column when the team is at home, column when the team is away)
+    "Goals scored": ("FTHG", "FTAG"),
+    "Goals conceded": ("FTAG", "FTHG"),
+    "ELO before": ("Home ELO", "Away ELO"),
+    "Opposition ELO": ("Away ELO", "Home ELO"),
+    "Shots on target attempted": ("HST", "AST"),
+    "Shots on target allows": ("AST", "HST"),
+    "Shots attemped": ("HS", "AS"),
+    "Shots allowed": ("AS", "HS"),
+    "Corners awarded": ("HC", "AC"),
+    "Corners allowed": ("AC", "HC"),
+    "Fouls commited": ("HF", "AF"),
+    "Fouls suffered": ("AF", "HF"),
+    "Yellow cards": ("HY", "AY"),
+    "Red cards": ("HR", "AR"),
+}
+
+def get_team_match_table(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Long format of data with one row per team per match, seen from the team's side (see team_match_columns).
+    The index is the index of the match in data, and the rows keep the order of data, so each team's matches stay in chronological order.
+    """
+    home = pd.DataFrame({"Team": data["HomeTeam"], "Opponent": data["AwayTeam"], "Home": True})
+    away = pd.DataFrame({"Team": data["AwayTeam"], "Opponent": data["HomeTeam"], "Home": False})
+    for column, (home_column, away_column) in team_match_columns.items():
+        if home_column in data.columns and away_column in data.columns:
+            home[column] = data[home_column]
+            away[column] = data[away_column]
+    home["Points"] = np.select([data["FTR"] == "H", data["FTR"] == "D"], [3, 1], 0)
+    away["Points"] = np.select([data["FTR"] == "A", data["FTR"] == "D"], [3, 1], 0)
+    for column in ["Div", "Season", "Date"]:
+        home[column] = data[column]
+        away[column] = data[column]
+
+    # A team is never on both sides of a match, so ordering by position in data orders each team's matches
+    position = np.arange(len(data))
+    table = pd.concat([home, away])
+    order = np.argsort(np.concatenate([position, position]), kind="stable")
+    return table.iloc[order]
+
 def add_form_column(
     data: pd.DataFrame,
     home_column,
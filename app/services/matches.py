@@ -3,56 +3,110 @@ from app.utils.utils import NT_to_ClubELO_names_mapping
 from app.core.schemas import MatchListResponseModel, MatchDetailModel
 from app.core.repositories import TeamRatingsRepository, FixturesRepository
 from app.core.parsers import MatchParser
-from typing import Optional
+from app.core.match_index import MatchIndex, MatchQuery
+from app.services.predictions import PredictorService, predictor_service
+from app.core.metrics import stage_seconds
+from app.core.scheduler import upstream_priority, RequestClass
+from app.core.warm_cache import odds_payloads
+from app.core.bookmakers import OddsAggregator, odds_aggregator
+from app.config.config import settings
+from datetime import datetime
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class MatchesService:
     """Main service for handling match-related operations"""
-    def __init__(self):
+    def __init__(self, predictor: PredictorService = predictor_service, aggregator: OddsAggregator = odds_aggregator):
         self.norsk_tipping_api = NorskTippingAPI()
-        self.ratings_repo = TeamRatingsRepository.from_csv(
-            'app/files/elo_ratings.csv',
-            NT_to_ClubELO_names_mapping
-        )
-        self.fixtures_repo = FixturesRepository.from_csv('app/files/fixtures.csv', NT_to_ClubELO_names_mapping)
+        self.predictor = predictor
+        self.aggregator = aggregator
+        with stage_seconds.time(stage='load_csv'):
+            self.ratings_repo = TeamRatingsRepository.from_csv(
+                'app/files/elo_ratings.csv',
+                NT_to_ClubELO_names_mapping
+            )
+            self.fixtures_repo = FixturesRepository.from_csv('app/files/fixtures.csv', NT_to_ClubELO_names_mapping)
         self.match_parser = MatchParser(self.ratings_repo, self.fixtures_repo)
 
-    async def get_coming_matches(self) -> MatchListResponseModel:
+    async def refresh_events(self) -> List[Dict]:
+        """Fetches the coming events, reduced by compact_event, into the shared odds payload cache"""
+        with stage_seconds.time(stage='upstream_fetch'):
+            data = await self.norsk_tipping_api.get_coming_matches(keep=self.match_parser.compact_event)
+        events = data.get("eventList", []) if data else []
+        if events:
+            odds_payloads.put('events/FBL', events)
+        return events
+
+    async def _coming_events(self) -> List[Dict]:
+        events = odds_payloads.get('events/FBL', settings.ODDS_CACHE_TTL)
+        if events is None:
+            events = await self.refresh_events()
+        return events
+
+    def _match_index(self, events: List[Dict]) -> MatchIndex:
+        """The parsed and indexed feed, built once per events payload and cached next to it"""
+        def build(events: List[Dict]) -> MatchIndex:
+            with stage_seconds.time(stage='parse_matches'):
+                parsed_matches = self.match_parser.parse_matches(events)
+            with stage_seconds.time(stage='index_matches'):
+                return MatchIndex(parsed_matches)
+        return odds_payloads.derived('events/FBL', events, 'match_index', build)
+
+    async def get_coming_matches(self, query: Optional[MatchQuery] = None) -> MatchListResponseModel:
+        """Every coming match, or with a query only its page. Predictions are made for the returned matches only."""
         try:
-            data = await self.norsk_tipping_api.get_coming_matches()
-            if not data:
+            events = await self._coming_events()
+            if not events:
                 return MatchListResponseModel(eventList=[])
-                
-            matches = data.get("eventList", [])
-            parsed_matches = [
-                parsed_match for match in matches
-                if (parsed_match := self.match_parser.parse_match(match)) is not None
+            index = self._match_index(events)
+            next_cursor = None
+            if query:
+                with stage_seconds.time(stage='query_matches'):
+                    matches, next_cursor = index.query(query)
+            else:
+                matches = index.feed
+            with stage_seconds.time(stage='predict'):
+                predictions = self.predictor.predict_matches([(match.home_team, match.away_team) for match in matches])
+            # The indexed matches are shared by every request on this payload, so the response gets copies. Best prices change with every
+            # bookmaker refresh, so they are looked up per returned match rather than indexed.
+            matches = [
+                match.model_copy(update={
+                    'prediction': predictions[(match.home_team, match.away_team)],
+                    'best_prices': self.aggregator.best_prices(match.home_team, match.away_team, match.start_time, match.elo.probs),
+                })
+                for match in matches
             ]
-            
-            return MatchListResponseModel(eventList=parsed_matches)
+
+            return MatchListResponseModel(eventList=matches, next_cursor=next_cursor)
         except Exception as e:
-            print(f"Error getting coming matches: {e}")  # You might want to use proper logging here
+            logger.error("Error getting coming matches: %s", e)
             return MatchListResponseModel(eventList=[])
     
     async def get_detailed_match(self, NT_id: str) -> Optional[MatchDetailModel]:
         try:
-            data = await self.norsk_tipping_api.get_coming_matches()
-            if not data:
-                return None
-            matches = data.get("eventList", [])
+            matches = await self._coming_events()
             match = next((m for m in matches if m.get("eventId") == NT_id), None)
             if not match:
                 return None
-            markets_data = await self.norsk_tipping_api.get_market_for_match(NT_id)
-            if not markets_data:
-                return None
+            markets_data = odds_payloads.get(f'markets/{NT_id}', settings.ODDS_CACHE_TTL)
+            if markets_data is None:
+                kickoff = datetime.fromisoformat(match["startTime"]).timestamp() if match.get("startTime") else None
+                with stage_seconds.time(stage='upstream_fetch_markets'), upstream_priority(RequestClass.USER, kickoff=kickoff):
+                    markets_data = await self.norsk_tipping_api.get_market_for_match(NT_id)
+                if not markets_data:
+                    return None
+                odds_payloads.put(f'markets/{NT_id}', markets_data)
             markets = markets_data.get("markets", []) 
             
-            parsed_match = self.match_parser.parse_detailed_match(match, markets)
+            with stage_seconds.time(stage='parse_detailed_match'):
+                parsed_match = self.match_parser.parse_detailed_match(match, markets)
             return parsed_match
             
         except Exception as e:
-            print(f"Error getting market for match {NT_id}: {e}")
+            logger.error("Error getting market for match: %s", e, extra={'NT_id': NT_id})
             return None
 
     async def close(self):
@@ -0,0 +1,149 @@
+from app.core.schemas import HUBModel, PredictionModel
+from app.utils.utils import NT_to_football_data_names_mapping, goal_difference_probs, read_csv_columns, float_column
+from app.predictor.forest import CompactForest
+from app.core.metrics import cache_requests_total
+from app.config.config import settings
+from dataclasses import dataclass
+from glob import glob
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Model feature: current_data.csv column whose home minus away difference gives it
+snapshot_feature_columns = {
+    'ELO diff': 'ELO',
+    'Diff_goals_scored': 'Goals scored',
+    'Diff_goals_conceded': 'Goals conceded',
+    'Diff_goal_diff': 'Goals difference',
+    'Diff_points': 'Points',
+    'Diff_change_in_ELO': 'Change in ELO',
+    'Diff_opposition_mean_ELO': 'Opposition mean ELO',
+    'Diff_shots_on_target_attempted': 'Shots on target attempted',
+    'Diff_shots_on_target_allowed': 'Shots on target allows',
+    'Diff_shots_attempted': 'Shots attemped',
+    'Diff_shots_allowed': 'Shots allowed',
+    'Diff_corners_awarded': 'Corners awarded',
+    'Diff_corners_conceded': 'Corners allowed',
+    'Diff_fouls_commited': 'Fouls commited',
+    'Diff_fouls_suffered': 'Fouls suffered',
+    'Diff_yellow_cards': 'Yellow cards',
+    'Diff_red_cards': 'Red cards',
+}
+
+MatchKey = Tuple[str, str]
+
+@dataclass
+class FormSnapshot:
+    """current_data.csv as a row per team, the team's league and the feature columns as arrays"""
+    rows: Dict[str, int]
+    divisions: List[str]
+    columns: Dict[str, np.ndarray]
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'FormSnapshot':
+        columns = read_csv_columns(path, ['Team', 'Div', *snapshot_feature_columns.values()])
+        teams, divisions = columns.pop('Team'), columns.pop('Div')
+        return cls({team: i for i, team in enumerate(teams)}, divisions, {name: float_column(values) for name, values in columns.items()})
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+class PredictorService:
+    """Serves the trained league models for upcoming matches, using the current-form snapshot as features"""
+    default_goal_difference_std = 1.7
+
+    def __init__(self, model_path: str = 'app/files/models', current_data_path: str = settings.CURRENT_DATA_CSV_PATH, name_mapping: Dict[str, str] = NT_to_football_data_names_mapping):
+        self.model_path = model_path
+        self.current_data_path = current_data_path
+        self.name_mapping = name_mapping
+        self.models = {}
+        self.snapshot: Optional[FormSnapshot] = None
+        self.version: Optional[int] = None
+        self._cache: Dict[MatchKey, Optional[PredictionModel]] = {}
+
+    def _snapshot_version(self) -> Optional[int]:
+        # PredictorTrainer writes current_data.csv after the models, so its mtime versions both
+        try:
+            return os.stat(self.current_data_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> bool:
+        version = self._snapshot_version()
+        if version is None:
+            logger.warning("No current-form snapshot at %s, predictions disabled", self.current_data_path)
+            return False
+        self.snapshot = FormSnapshot.from_csv(self.current_data_path)
+        model_files = [
+            file_path for file_path in glob(f'{self.model_path}/*_model.joblib')
+            if not os.path.isdir(file_path.removesuffix('_model.joblib') + '_forest')
+        ]
+        self.models = {}
+        if model_files:
+            # Only leagues without a compact forest need joblib and scikit-learn
+            from joblib import load
+            self.models = {os.path.basename(file_path).removesuffix('_model.joblib'): load(file_path, mmap_mode='r') for file_path in model_files}
+        # Compact forests are preferred: they are evaluated with NumPy alone and memory-mapped
+        self.models.update({
+            os.path.basename(path).removesuffix('_forest'): CompactForest.load(path)
+            for path in glob(f'{self.model_path}/*_forest')
+        })
+        self.version = version
+        self._cache = {}
+        logger.info("Loaded %d league models and %d team snapshots", len(self.models), len(self.snapshot))
+        return True
+
+    def refresh(self):
+        if self._snapshot_version() != self.version:
+            self.load()
+
+    def predict_matches(self, matches: List[MatchKey]) -> Dict[MatchKey, Optional[PredictionModel]]:
+        """Predictions for (home_team, away_team) pairs with Norsk Tipping names. Matches the models cannot cover map to None."""
+        self.refresh()
+        missing = list(dict.fromkeys(match for match in matches if match not in self._cache))
+        cache_requests_total.inc(len(matches) - len(missing), cache='predictions', result='hit')
+        cache_requests_total.inc(len(missing), cache='predictions', result='miss')
+        if missing:
+            predictions = self._predict(missing) if self.snapshot is not None else {}
+            self._cache.update({match: predictions.get(match) for match in missing})
+        return {match: self._cache[match] for match in matches}
+
+    def _predict(self, matches: List[MatchKey]) -> Dict[MatchKey, PredictionModel]:
+        by_league: Dict[str, List[Tuple[MatchKey, int, int]]] = {}
+        for key in matches:
+            home = self.snapshot.rows.get(self.name_mapping.get(key[0], key[0]))
+            away = self.snapshot.rows.get(self.name_mapping.get(key[1], key[1]))
+            if home is not None and away is not None:
+                by_league.setdefault(self.snapshot.divisions[home], []).append((key, home, away))
+
+        predictions = {}
+        for league, group in by_league.items():
+            model = self.models.get(league)
+            if model is None:
+                continue
+            keys, home_rows, away_rows = zip(*group)
+            home_rows, away_rows = np.array(home_rows), np.array(away_rows)
+            features = {
+                feature: self.snapshot.columns[column][home_rows] - self.snapshot.columns[column][away_rows]
+                for feature, column in snapshot_feature_columns.items()
+            }
+            X = np.column_stack([features[name] for name in model.feature_names_in_])
+            if not isinstance(model, CompactForest):
+                # scikit-learn checks the feature names it was fitted with
+                import pandas as pd
+                X = pd.DataFrame(X, columns=list(model.feature_names_in_))
+            goal_difference = model.predict(X)
+
+            std = getattr(model, 'residual_std_', self.default_goal_difference_std)
+            home, draw, away = goal_difference_probs(goal_difference, std)
+            for key, gd, h, d, a in zip(keys, goal_difference, home, draw, away):
+                predictions[key] = PredictionModel(
+                    goal_difference=gd,
+                    probs=HUBModel(home=h, draw=d, away=a)
+                )
+        return predictions
+
+predictor_service = PredictorService()
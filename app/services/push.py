@@ -0,0 +1,218 @@
+from app.core.schemas import MatchSummaryModel
+from app.core.metrics import metrics, Counter, Gauge, stage_seconds
+from app.config.config import settings
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+push_messages_total = metrics.register(Counter('betmax_push_messages_total', 'WebSocket updates by result (queued, coalesced or dropped)'))
+push_connections = metrics.register(Gauge('betmax_push_connections', 'Open WebSocket subscriptions'))
+
+@dataclass
+class Subscription:
+    """What a client wants pushed. Empty tournaments and events mean every match; min_ev applies on top of them."""
+    tournaments: Set[str] = field(default_factory=set)
+    events: Set[str] = field(default_factory=set)
+    min_ev: Optional[float] = None
+
+    @classmethod
+    def from_message(cls, message: Dict) -> 'Subscription':
+        """Raises TypeError or ValueError for a message that is not a valid subscription"""
+        if not isinstance(message, dict):
+            raise TypeError('A subscription must be a JSON object')
+        names = {}
+        for key in ('tournaments', 'events'):
+            values = message.get(key) or []
+            if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                raise TypeError(f'{key} must be a list of strings')
+            names[key] = set(values)
+        min_ev = message.get('min_ev')
+        if isinstance(min_ev, bool) or not isinstance(min_ev, (int, float, type(None))):
+            raise TypeError('min_ev must be a number')
+        return cls(names['tournaments'], names['events'], None if min_ev is None else float(min_ev))
+
+    def accepts_ev(self, best_ev: float) -> bool:
+        return self.min_ev is None or best_ev >= self.min_ev
+
+class ConnectionQueue:
+    """
+    Bounded queue of serialized updates for one connection, keyed by event.
+    A newer update for an event that is still queued replaces it in place, since only the latest odds matter, and when the queue is full the
+    oldest update is dropped. A slow client therefore costs at most maxsize messages of memory and never blocks the publisher.
+    """
+    def __init__(self, maxsize: int = settings.PUSH_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._messages: 'OrderedDict[str, str]' = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def put(self, key: str, message: str):
+        if key in self._messages:
+            self._messages[key] = message
+            push_messages_total.inc(result='coalesced')
+            return
+        if len(self._messages) >= self.maxsize:
+            self._messages.popitem(last=False)
+            push_messages_total.inc(result='dropped')
+        self._messages[key] = message
+        push_messages_total.inc(result='queued')
+        self._ready.set()
+
+    async def get(self) -> str:
+        while not self._messages:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._messages.popitem(last=False)[1]
+
+class PushHub:
+    """
+    Fans match updates out to WebSocket subscribers. Subscriptions are indexed by event and tournament, so an update only visits the
+    connections that can want it, and each update is serialized once however many connections receive it.
+    """
+    def __init__(self):
+        self.subscriptions: Dict[ConnectionQueue, Subscription] = {}
+        self._by_event: Dict[str, Set[ConnectionQueue]] = {}
+        self._by_tournament: Dict[str, Set[ConnectionQueue]] = {}
+        self._everything: Set[ConnectionQueue] = set()
+        self.latest: Dict[str, MatchSummaryModel] = {}
+        # Called when a connection subscribes while there is no state to send it yet
+        self.on_cold_subscribe: Optional[Callable[[], None]] = None
+
+    def _unindex(self, queue: ConnectionQueue):
+        subscription = self.subscriptions.get(queue)
+        if subscription is None:
+            return
+        # Keys whose last subscriber leaves are dropped, or the indexes would grow with every event ever subscribed to
+        for index, keys in ((self._by_event, subscription.events), (self._by_tournament, subscription.tournaments)):
+            for key in keys:
+                queues = index[key]
+                queues.discard(queue)
+                if not queues:
+                    del index[key]
+        self._everything.discard(queue)
+
+    def subscribe(self, queue: ConnectionQueue, subscription: Subscription):
+        """Sets or replaces the subscription of a connection and queues the current state of every match it covers"""
+        self._unindex(queue)
+        self.subscriptions[queue] = subscription
+        for event in subscription.events:
+            self._by_event.setdefault(event, set()).add(queue)
+        for tournament in subscription.tournaments:
+            self._by_tournament.setdefault(tournament, set()).add(queue)
+        if not subscription.events and not subscription.tournaments:
+            self._everything.add(queue)
+        push_connections.set(len(self.subscriptions))
+        if not self.latest and self.on_cold_subscribe:
+            self.on_cold_subscribe()
+        for match in self.latest.values():
+            if self._matches(subscription, match):
+                queue.put(match.NT_id, self.serialize(match))
+
+    def unsubscribe(self, queue: ConnectionQueue):
+        self._unindex(queue)
+        self.subscriptions.pop(queue, None)
+        push_connections.set(len(self.subscriptions))
+        if not self.subscriptions:
+            # Nobody is watching, so the state would go stale before the next subscriber
+            self.latest.clear()
+
+    @staticmethod
+    def best_ev(match: MatchSummaryModel) -> float:
+        return max(match.expected_value.home, match.expected_value.draw, match.expected_value.away)
+
+    def _matches(self, subscription: Subscription, match: MatchSummaryModel) -> bool:
+        covered = (not subscription.events and not subscription.tournaments) or match.NT_id in subscription.events or match.tournament in subscription.tournaments
+        return covered and subscription.accepts_ev(self.best_ev(match))
+
+    @staticmethod
+    def serialize(match: MatchSummaryModel) -> str:
+        return '{"type":"match","data":' + match.model_dump_json() + '}'
+
+    def publish(self, changed: List[MatchSummaryModel], removed: List[str] = ()):
+        """Queues every changed match for the connections subscribed to it, and a removal message for matches no longer listed"""
+        with stage_seconds.time(stage='push_publish'):
+            for match in changed:
+                self.latest[match.NT_id] = match
+                queues = self._everything | self._by_event.get(match.NT_id, set()) | self._by_tournament.get(match.tournament, set())
+                best_ev = self.best_ev(match)
+                message = None
+                for queue in queues:
+                    if self.subscriptions[queue].accepts_ev(best_ev):
+                        message = message or self.serialize(match)
+                        queue.put(match.NT_id, message)
+            for NT_id in removed:
+                match = self.latest.pop(NT_id, None)
+                if match is None:
+                    continue
+                message = '{"type":"removed","NT_id":"' + NT_id + '"}'
+                for queue in self._everything | self._by_event.get(NT_id, set()) | self._by_tournament.get(match.tournament, set()):
+                    queue.put(NT_id, message)
+
+class OddsWatcher:
+    """
+    Polls the coming matches while anyone is subscribed and publishes the ones whose odds, probabilities or prediction changed.
+    refresh_now() skips the wait, for DataUpdater to call when new ratings or fixtures change the probabilities.
+    """
+    def __init__(self, hub: PushHub, fetch_matches: Callable[[], Awaitable[List[MatchSummaryModel]]], interval: float = settings.PUSH_INTERVAL):
+        self.hub = hub
+        self.fetch_matches = fetch_matches
+        self.interval = interval
+        self._versions: Dict[str, tuple] = {}
+        self._wake = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        hub.on_cold_subscribe = self.refresh_now
+
+    @staticmethod
+    def _version(match: MatchSummaryModel) -> tuple:
+        return (match.odds, match.elo.probs, match.prediction)
+
+    async def poll(self):
+        matches = await self.fetch_matches()
+        if not self.hub.latest:
+            # The hub dropped its state when the last subscriber left, so everything counts as changed
+            self._versions = {}
+        changed = []
+        versions = {}
+        for match in matches:
+            versions[match.NT_id] = self._version(match)
+            if self._versions.get(match.NT_id) != versions[match.NT_id]:
+                changed.append(match)
+        # An empty response is more likely an upstream failure than every match being gone
+        removed = [NT_id for NT_id in self._versions if NT_id not in versions] if matches else []
+        self._versions = versions if matches else self._versions
+        if changed or removed:
+            self.hub.publish(changed, removed)
+            logger.info("Pushed %d changed and %d removed matches", len(changed), len(removed), extra={'subscribers': len(self.hub.subscriptions)})
+
+    async def run(self):
+        while True:
+            if self.hub.subscriptions:
+                try:
+                    await self.poll()
+                except Exception as e:
+                    logger.error("Error polling matches for push: %s", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def refresh_now(self):
+        self._wake.set()
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+push_hub = PushHub()
@@ -0,0 +1,131 @@
+from app.core.schemas import StakeRequestModel, StakeResponseModel, StakeModel
+from app.core.repositories import FixturesRepository
+from app.core.markets import score_outcomes, find_settlement, find_market
+from app.core.metrics import stage_seconds
+from app.utils.utils import NT_to_ClubELO_names_mapping
+from app.config.config import settings
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Selections of three-way markets (1X2, double chance, three-way handicap) and of two-way markets, in settlement row order
+selections_by_arity = {3: ('home', 'draw', 'away'), 2: ('true', 'false')}
+_no_goals = np.zeros(1, dtype=int)
+
+def selection_index(market: str, selection: str) -> Optional[int]:
+    """Settlement row of the selection, or None for markets that cannot be settled. A selection the market does not have raises ValueError."""
+    settle = find_settlement(market)
+    if settle is None:
+        return None
+    selections = selections_by_arity[len(settle(_no_goals, _no_goals)[0])]
+    if selection not in selections:
+        raise ValueError(f"Selection '{selection}' is not one of {', '.join(selections)} for the market '{market}'")
+    return selections.index(selection)
+
+def _nonnegative_quadratic(mean: np.ndarray, penalty: np.ndarray, start: np.ndarray) -> np.ndarray:
+    """argmax of mean'f - f'penalty f / 2 over f >= 0"""
+    from scipy.optimize import minimize  # Only stake requests need SciPy, so it is kept out of the import of the app
+    result = minimize(
+        lambda f: (f @ penalty @ f / 2 - mean @ f, penalty @ f - mean),
+        start,
+        jac=True,
+        method='L-BFGS-B',
+        bounds=[(0.0, None)] * len(mean),
+    )
+    return result.x
+
+def kelly_fractions(mean: np.ndarray, second_moment: np.ndarray, kelly_fraction: float, max_exposure: float, tolerance: float = 1e-6) -> np.ndarray:
+    """
+    Bankroll fractions maximizing the second-order expansion of the expected log growth, E[R]'f - f'E[RR']f / 2, with the quadratic term
+    scaled by 1 / kelly_fraction. Stakes are non-negative and sum to at most max_exposure: when the unconstrained optimum stakes more,
+    the multiplier on the exposure is found by bisection, since total exposure only falls as it grows.
+    """
+    n = len(mean)
+    if n == 0 or not (mean > 0).any():
+        return np.zeros(n)
+    penalty = second_moment / kelly_fraction
+    fractions = _nonnegative_quadratic(mean, penalty, np.zeros(n))
+    if fractions.sum() <= max_exposure:
+        return fractions
+    low, high = 0.0, float(mean.max())
+    while high - low > tolerance:
+        multiplier = (low + high) / 2
+        fractions = _nonnegative_quadratic(mean - multiplier, penalty, fractions)
+        if fractions.sum() > max_exposure:
+            low = multiplier
+        else:
+            high = multiplier
+    fractions = _nonnegative_quadratic(mean - high, penalty, fractions)
+    return fractions * min(1.0, max_exposure / max(fractions.sum(), 1e-12))
+
+class StakingService:
+    """Sizes stakes on candidate bets with fractional Kelly, correlating bets on the same match through its score grid"""
+    def __init__(self, fixtures_repo: FixturesRepository = None):
+        if fixtures_repo is None:
+            with stage_seconds.time(stage='load_csv'):
+                fixtures_repo = FixturesRepository.from_csv(settings.FIXTURES_CSV_PATH, NT_to_ClubELO_names_mapping)
+        self.fixtures_repo = fixtures_repo
+
+    def _returns(self, request: StakeRequestModel) -> Tuple[List[List[int]], List[np.ndarray], List[np.ndarray], Dict[int, Tuple[float, float]]]:
+        """
+        Net return per unit staked on every outcome of the candidate's match, for the candidates that can be priced, grouped by match.
+        Also the win/push split of every priced candidate: the expected share of the stake paid at the odds and the share returned.
+        Raises ValueError when a candidate's selection does not belong to its market.
+        """
+        matches: Dict[Tuple[str, str], List[int]] = {}
+        selections = [selection_index(candidate.market, candidate.selection) for candidate in request.candidates]
+        for i, candidate in enumerate(request.candidates):
+            matches.setdefault((candidate.home_team, candidate.away_team), []).append(i)
+
+        priced, returns, probabilities, splits = [], [], [], {}
+        for (home_team, away_team), indices in matches.items():
+            grid = self.fixtures_repo.get_score_grid(home_team, away_team)
+            if grid is None:
+                continue
+            home, away, probability = score_outcomes(grid)
+            match_priced, match_returns = [], []
+            for i in indices:
+                candidate = request.candidates[i]
+                selection = selections[i]
+                # Lines the published scores cannot price would be settled on the made-up tail outcomes
+                if selection is None or candidate.odds <= 1 or find_market(candidate.market)(grid) is None:
+                    continue
+                won, returned = find_settlement(candidate.market)(home, away)
+                match_priced.append(i)
+                match_returns.append(won[selection] * candidate.odds + returned[selection] - 1)
+                splits[i] = (float(won[selection] @ probability), float(returned[selection] @ probability))
+            if match_priced:
+                priced.append(match_priced)
+                returns.append(np.array(match_returns))
+                probabilities.append(probability)
+        return priced, returns, probabilities, splits
+
+    def optimize(self, request: StakeRequestModel) -> StakeResponseModel:
+        stakes = [StakeModel(**candidate.model_dump()) for candidate in request.candidates]
+        with stage_seconds.time(stage='stake_moments'):
+            priced, returns, probabilities, splits = self._returns(request)
+            indices = [i for match_priced in priced for i in match_priced]
+            mean = np.concatenate([r @ p for r, p in zip(returns, probabilities)]) if indices else np.zeros(0)
+            # Matches are independent, so E[R_i R_j] = E[R_i] E[R_j] across matches; within a match it is summed over the shared outcomes
+            second_moment = np.outer(mean, mean)
+            start = 0
+            for r, p in zip(returns, probabilities):
+                end = start + len(r)
+                second_moment[start:end, start:end] = (r * p) @ r.T
+                start = end
+        with stage_seconds.time(stage='stake_solve'):
+            fractions = kelly_fractions(mean, second_moment, request.kelly_fraction, request.max_exposure)
+
+        for i, m, f in zip(indices, mean, fractions):
+            stakes[i].expected_value = m + 1
+            stakes[i].probability, stakes[i].push_probability = splits[i]
+            stakes[i].fraction = f
+            stakes[i].stake = round(f * request.bankroll, 2)
+        return StakeResponseModel(
+            bankroll=request.bankroll,
+            total_stake=sum(stake.stake for stake in stakes),
+            expected_growth=mean @ fractions - fractions @ second_moment @ fractions / 2,
+            stakes=stakes,
+        )
@@ -1,8 +1,17 @@
 from app.core.schemas import HUBModel
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import csv
 tournaments_of_interest = ['England - Premier League', 'Italia - Serie A', 'Frankrike -  Ligue 1', 'Spania - Primera Division', 'Tyskland - Bundesliga', 'Internasjonal klubb - UEFA Champions League', 'Internasjonal klubb - UEFA Europa League', 'Internasjonal klubb - UEFA Conference League']
 DRAW_FACTOR = 0.36 #0.36 i LaLiga
 HOME_ADVANTAGE = 65 #65 i LaLiga
 
+# (draw factor, home advantage) for the ELO formula per tournament, DRAW_FACTOR and HOME_ADVANTAGE for the rest.
+# Only LaLiga's values are measured so far; add a tournament here once its values are fitted on its own matches.
+elo_league_parameters = {
+	'Spania - Primera Division': (0.36, 65),
+}
+
 NT_to_ClubELO_names_mapping = {
 	'Blackburn Rovers': 'Blackburn',
 	'Plymouth Argyle': 'Plymouth',
@@ -52,17 +61,104 @@ NT_to_ClubELO_names_mapping = {
 	'PSV Eindhoven': 'PSV',
 }
 
-#Not in use
-def calculate_elo_probs(home_elo: float, away_elo: float):
-	elo_diff = home_elo + HOME_ADVANTAGE - away_elo
+NT_to_football_data_names_mapping = {
+	'Tottenham Hotspur': 'Tottenham',
+	'Wolverhampton Wanderers': 'Wolves',
+	'Liverpool FC': 'Liverpool',
+	'Brighton and Hove Albion': 'Brighton',
+	'Leicester City': 'Leicester',
+	'Ipswich Town': 'Ipswich',
+	'Manchester City': 'Man City',
+	'Manchester United': 'Man United',
+	'Newcastle United': 'Newcastle',
+	'West Ham United': 'West Ham',
+	'Nottingham Forest': "Nott'm Forest",
+	'Blackburn Rovers': 'Blackburn',
+	'Plymouth Argyle': 'Plymouth',
+	'Atalanta BC': 'Atalanta',
+	'Hellas Verona FC': 'Verona',
+	'AC Monza': 'Monza',
+	'Parma FC': 'Parma',
+	'FC St. Pauli': 'St Pauli',
+	'VfB Stuttgart': 'Stuttgart',
+	'VfL Wolfsburg': 'Wolfsburg',
+	'VfL Bochum': 'Bochum',
+	'Borussia Mönchengladbach': "M'gladbach",
+	'Borussia Dortmund': 'Dortmund',
+	'Bayer Leverkusen': 'Leverkusen',
+	'Bayern München': 'Bayern Munich',
+	'TSG Hoffenheim': 'Hoffenheim',
+	'Eintracht Frankfurt': 'Ein Frankfurt',
+	'Holstein Kiel': 'Holstein Kiel',
+	'1. FC Heidenheim': 'Heidenheim',
+	'FSV Mainz': 'Mainz',
+	'Atletico Madrid': 'Ath Madrid',
+	'Athletic Club Bilbao': 'Ath Bilbao',
+	'Celta Vigo': 'Celta',
+	'Real Valladolid': 'Valladolid',
+	'Real Betis': 'Betis',
+	'Real Sociedad': 'Sociedad',
+	'AS Monaco': 'Monaco',
+	'Paris Saint Germain': 'Paris SG',
+}
+
+# football-data.co.uk names to ClubELO names, through the Norsk Tipping names both are mapped from. Names the two sources share are left out.
+football_data_to_ClubELO_names_mapping = {
+	NT_to_football_data_names_mapping.get(team, team): club
+	for team, club in NT_to_ClubELO_names_mapping.items()
+	if NT_to_football_data_names_mapping.get(team, team) != club
+}
+
+def calculate_elo_probs_batch(home_elo, away_elo, draw_factor=DRAW_FACTOR, home_advantage=HOME_ADVANTAGE):
+	"""
+	HUB probabilities from the ELO formula for arrays of matches. draw_factor and home_advantage may be scalars or per-match arrays.
+	Returns three arrays: home, draw and away probabilities.
+	"""
+	elo_diff = np.asarray(home_elo, dtype=float) + home_advantage - np.asarray(away_elo, dtype=float)
 	prob_home_without_draws = 1 / (1 + 10 ** (-elo_diff / 400))
-	prob_away_without_draws = 1 / (1 + 10 ** (elo_diff / 400))
-	prob_draw = DRAW_FACTOR * (
-		1 - abs(prob_home_without_draws - prob_away_without_draws)
+	prob_away_without_draws = 1 - prob_home_without_draws
+	prob_draw = draw_factor * (
+		1 - np.abs(prob_home_without_draws - prob_away_without_draws)
 	)
 	prob_home = prob_home_without_draws - prob_draw / 2
 	prob_away = prob_away_without_draws - prob_draw / 2
-	return HUBModel(home=prob_home, draw=prob_draw, away=prob_away)
+	return prob_home, prob_draw, prob_away
+
+def ndtr(x) -> np.ndarray:
+	"""Standard normal CDF, elementwise"""
+	from scipy import special  # Imported on the first call, so SciPy stays out of the import of the app
+	return special.ndtr(np.asarray(x, dtype=float))
+
+def read_csv_columns(path: str, columns: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+	"""
+	The columns of a CSV file as lists of strings, all of them or only those in columns that the file has.
+	Parsing the snapshots with the csv module keeps pandas off the serving path.
+	"""
+	columns = None if columns is None else set(columns)
+	with open(path, newline='', encoding='utf-8') as f:
+		reader = csv.reader(f)
+		header = next(reader, [])
+		wanted = [(i, name) for i, name in enumerate(header) if columns is None or name in columns]
+		values = {name: [] for _, name in wanted}
+		for row in reader:
+			for i, name in wanted:
+				values[name].append(row[i] if i < len(row) else '')
+	return values
 
+def float_column(values: List[str]) -> np.ndarray:
+	"""Strings from read_csv_columns as floats, NaN where empty"""
+	return np.array([float(value) if value else np.nan for value in values])
 
+def goal_difference_probs(goal_difference, std):
+	"""
+	HUB probabilities for predicted goal differences, taking the actual goal difference as Normal(prediction, std) rounded to the nearest integer.
+	Returns three arrays: home, draw and away probabilities.
+	"""
+	goal_difference = np.asarray(goal_difference, dtype=float)
+	prob_away = ndtr((-0.5 - goal_difference) / std)
+	prob_home = 1 - ndtr((0.5 - goal_difference) / std)
+	return prob_home, 1 - prob_home - prob_away, prob_away
 
+def calculate_elo_probs(home_elo: float, away_elo: float):
+	prob_home, prob_draw, prob_away = calculate_elo_probs_batch(home_elo, away_elo)
+	return HUBModel(home=prob_home, draw=prob_draw, away=prob_away)
@@ -0,0 +1,49 @@
+"""
+Times the bookmaker aggregation against a local stub server: a refresh of every source, and best-price lookups. Correctness (matching across
+books, best prices against the books' own prices, timeouts) is checked by tests/test_bookmakers.py.
+
+Run with: python -m benchmarks.bookmakers [n_events]
+"""
+from app.config.config import settings
+from app.core.bookmakers import OddsAggregator, NorskTippingAdapter, PinnacleAdapter
+from app.core.schemas import HUBModel
+from benchmarks.stub_server import StubUpstream
+from aiohttp import web
+import asyncio
+import time
+import sys
+
+async def main(n_events):
+	runner = web.AppRunner(StubUpstream(n_events=n_events, latency_ms=20).app())
+	await runner.setup()
+	await web.TCPSite(runner, '127.0.0.1', 0).start()
+	host, port = runner.addresses[0][:2]
+	settings.NORSK_TIPPING_URL = f'http://{host}:{port}/nt'
+	settings.PINNACLE_URL = f'http://{host}:{port}/pinnacle'
+	aggregator = OddsAggregator([NorskTippingAdapter(timeout=2), PinnacleAdapter(timeout=2)])
+	try:
+		start = time.perf_counter()
+		counts = await aggregator.refresh()
+		print(f'Fetched {counts} in {(time.perf_counter() - start) * 1000:.0f} ms')
+		matched = sum(len(event.event_ids) == 2 for event in aggregator.events.values())
+		print(f'{len(aggregator.events)} events, {matched} quoted by both books')
+
+		lookups = [(key, 'HUB', 'home') for key in aggregator.events] * 1000
+		start = time.perf_counter()
+		for key in lookups:
+			aggregator.index.best_price(*key)
+		print(f'{(time.perf_counter() - start) / len(lookups) * 1e9:.0f} ns per best-price lookup')
+
+		probs = HUBModel(home=0.45, draw=0.27, away=0.28)
+		matches = [(event.home_team, event.away_team, event.start_time) for event in aggregator.events.values()] * 100
+		start = time.perf_counter()
+		for home_team, away_team, start_time in matches:
+			aggregator.best_prices(home_team, away_team, start_time, probs)
+		print(f'{(time.perf_counter() - start) / len(matches) * 1e6:.1f} us per served match (best HUB prices, expected values and overround)')
+		print(f'{len(aggregator.index.arbitrages())} arbitrage opportunities')
+	finally:
+		await aggregator.close()
+		await runner.cleanup()
+
+if __name__ == '__main__':
+	asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 60))
@@ -0,0 +1,100 @@
+"""
+Checks the evaluation and calibration pipeline on seeded synthetic leagues whose archived predictions are overconfident: the predicted
+score grids exaggerate the strength differences that the results are drawn from. The scores must agree with per-match loops, calibration
+fitted on the early seasons must improve the later ones, and FixturesRepository must serve the calibrated probabilities of a fixtures file
+with a calibration file next to it, at the same lookup cost. Also times the evaluation.
+
+Run with: python -m benchmarks.calibration [n_leagues] [n_seasons]
+"""
+from app.core.calibration import load_calibration
+from app.core.repositories import FixturesRepository
+from app.predictor.backtest import clubelo_fixtures_grids
+from app.predictor.evaluation import (
+	market_outcomes, market_probs, evaluate, reliability_curves, fit_calibration, calibrated_fixtures,
+	brier_scores, log_losses, ranked_probability_scores,
+)
+from benchmarks.stub_server import score_grid, fixture_row
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import tempfile
+import time
+import sys
+
+def synthetic_history(n_leagues, n_seasons, n_teams=20, overconfidence=1.8, seed=7):
+	"""Results drawn from team strengths, and predictions in the ClubELO fixtures format from overconfident strengths"""
+	rng = np.random.default_rng(seed)
+	matches, fixtures = [], []
+	for season_index in range(n_seasons):
+		year = 2010 + season_index
+		for league in range(n_leagues):
+			strength = rng.normal(0, 0.3, n_teams)
+			for i, (home, away) in enumerate(rng.permutation([(h, a) for h in range(n_teams) for a in range(n_teams) if h != a])):
+				kickoff = datetime(year, 8, 1) + timedelta(days=int(i // (n_teams // 2)) * 7)
+				home_goals = int(rng.poisson(np.exp(0.35 + strength[home] - strength[away])))
+				away_goals = int(rng.poisson(np.exp(0.1 + strength[away] - strength[home])))
+				difference = overconfidence * (strength[home] - strength[away])
+				home_name, away_name = f'L{league} Team {home}', f'L{league} Team {away}'
+				fixtures.append(fixture_row(home_name, away_name, score_grid(np.exp(0.35 + difference), np.exp(0.1 - difference)), kickoff))
+				matches.append({
+					'Div': f'L{league}', 'Date': kickoff, 'HomeTeam': home_name, 'AwayTeam': away_name, 'FTHG': home_goals, 'FTAG': away_goals,
+					'FTR': 'H' if home_goals > away_goals else 'D' if home_goals == away_goals else 'A', 'Season': f'{year % 100:02d}{(year + 1) % 100:02d}',
+				})
+	return pd.DataFrame(matches), pd.DataFrame(fixtures)
+
+def check_scores(probs, outcome):
+	"""The vectorized scores against per-match loops"""
+	for p, o, brier, log_loss, rps in zip(probs[:500], outcome[:500], brier_scores(probs, outcome), log_losses(probs, outcome), ranked_probability_scores(probs, outcome)):
+		assert np.isclose(brier, sum((p[k] - (k == o)) ** 2 for k in range(len(p))))
+		assert np.isclose(log_loss, -np.log(p[o]))
+		assert np.isclose(rps, sum((sum(p[:k + 1]) - (o <= k)) ** 2 for k in range(len(p) - 1)) / (len(p) - 1))
+
+def main(n_leagues, n_seasons):
+	data, fixtures = synthetic_history(n_leagues, n_seasons)
+	outcomes = market_outcomes(data)
+	leagues = data['Div'].to_numpy()
+	probs = market_probs(*clubelo_fixtures_grids(data, fixtures))
+	for market, predicted in probs.items():
+		check_scores(predicted, outcomes[market])
+	print(f'{len(data)} matches in {n_leagues} leagues over {n_seasons} seasons, scores checked against per-match loops')
+
+	start = time.perf_counter()
+	scores = evaluate(probs, outcomes, leagues)
+	curves = reliability_curves(probs, outcomes, leagues)
+	print(f'Scored {len(data)} matches in {len(scores)} league and market groups, {len(curves)} reliability bins, in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+	evaluated = (data['Season'] >= data['Season'].sort_values().unique()[n_seasons // 2]).to_numpy()
+	later = lambda values: {market: values[market][evaluated] for market in values}
+	raw = evaluate(later(probs), later(outcomes), leagues[evaluated]).set_index(['league', 'market'])
+	for method in ['isotonic', 'platt']:
+		calibration = fit_calibration(probs['hub'][~evaluated], outcomes['hub'][~evaluated], method)
+		calibrated = market_probs(*clubelo_fixtures_grids(data, calibrated_fixtures(fixtures, calibration)))
+		scored = evaluate(later(calibrated), later(outcomes), leagues[evaluated]).set_index(['league', 'market'])
+		print(f'{method:<9} on later seasons, HUB Brier {raw.loc[("all", "hub"), "brier"]:.4f} -> {scored.loc[("all", "hub"), "brier"]:.4f}, '
+			f'log-loss {raw.loc[("all", "hub"), "log_loss"]:.4f} -> {scored.loc[("all", "hub"), "log_loss"]:.4f}, '
+			f'RPS {raw.loc[("all", "hub"), "rps"]:.4f} -> {scored.loc[("all", "hub"), "rps"]:.4f}')
+		assert scored.loc[('all', 'hub'), 'brier'] < raw.loc[('all', 'hub'), 'brier'], 'calibration should fix the overconfidence'
+		assert np.allclose(calibrated['hub'].sum(axis=1), 1), 'calibrated HUB probabilities should sum to one'
+
+	with tempfile.TemporaryDirectory() as directory:
+		fixtures_path, calibration_path = f'{directory}/fixtures.csv', f'{directory}/calibration.json'
+		latest = fixtures.drop_duplicates(['Home', 'Away'], keep='last')
+		latest.to_csv(fixtures_path, index=False)
+		calibration.save(calibration_path)
+		repos = {'raw': FixturesRepository.from_csv(fixtures_path, {}, None), 'calibrated': FixturesRepository.from_csv(fixtures_path, {}, calibration_path)}
+		pairs = list(zip(latest['Home'], latest['Away']))[:2000]
+		raw_hub = np.array([list(repos['raw'].get_match_probabilities(home, away).model_dump().values()) for home, away in pairs])
+		served = np.array([list(repos['calibrated'].get_match_probabilities(home, away).model_dump().values()) for home, away in pairs])
+		# The grids are float32, and Platt maps stretch the rounding of near-zero probabilities
+		assert np.allclose(served, load_calibration(calibration_path).apply(raw_hub), atol=1e-4), 'lookups should serve the calibrated probabilities'
+		grid = repos['calibrated'].get_score_grid(*pairs[0])
+		assert np.isclose(grid.total_over(2.5).true + grid.total_over(2.5).false, 1, atol=1e-5)
+		print(f'FixturesRepository serves the calibrated HUB probabilities, checked on {len(pairs)} fixtures')
+		for name, repo in repos.items():
+			start = time.perf_counter()
+			for home, away in pairs:
+				repo.get_match_probabilities(home, away)
+			print(f'  {name:<10} lookup {(time.perf_counter() - start) / len(pairs) * 1e6:.1f} us')
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 4, int(sys.argv[2]) if len(sys.argv) > 2 else 6)
@@ -0,0 +1,67 @@
+"""
+Compares a RandomForestRegressor with its CompactForest export: prediction parity, file size, load time, memory and batch latency.
+Run with: python -m benchmarks.compact_forest [n_rows] [n_trees]
+"""
+from app.predictor.forest import CompactForest
+from sklearn.ensemble import RandomForestRegressor
+from joblib import dump, load
+import numpy as np
+import pandas as pd
+import tempfile
+import tracemalloc
+import time
+import sys
+import os
+
+def timed(fn, repeat=1):
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = fn()
+		times.append(time.perf_counter() - start)
+	return result, float(np.median(times))
+
+def peak_memory(fn):
+	tracemalloc.start()
+	result = fn()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return result, peak
+
+def directory_size(path):
+	return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def main():
+	n_rows, n_trees = (int(arg) for arg in (sys.argv[1:] or [7000, 200]))
+	rng = np.random.default_rng(42)
+	X = pd.DataFrame(rng.normal(0, 5, (n_rows, 17)).round(1), columns=[f'Diff_{i}' for i in range(17)])
+	y = np.round(0.3 * X['Diff_0'] - 0.2 * X['Diff_1'] + rng.normal(0, 1.7, n_rows))
+	rf = RandomForestRegressor(n_estimators=n_trees, random_state=42, n_jobs=-1).fit(X, y)
+	batch = X.sample(40, random_state=1)
+	full = X.sample(2000, random_state=2)
+	expected = rf.predict(full)
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		joblib_path = f'{tmp_dir}/model.joblib'
+		dump(rf, joblib_path)
+		print(f'{n_rows} rows, {n_trees} trees')
+		print(f'{"format":<18}{"size MB":>10}{"load ms":>10}{"load peak MB":>14}{"predict 40 ms":>15}{"max abs err":>14}')
+		_, load_time = timed(lambda: load(joblib_path), repeat=3)
+		_, load_peak = peak_memory(lambda: load(joblib_path))
+		_, predict_time = timed(lambda: rf.predict(batch), repeat=50)
+		print(f'{"sklearn joblib":<18}{os.path.getsize(joblib_path) / 1e6:>10.1f}{load_time * 1000:>10.1f}{load_peak / 1e6:>14.1f}{predict_time * 1000:>15.2f}{0:>14.1e}')
+
+		for quantize in [False, True]:
+			path = f'{tmp_dir}/forest_{quantize}'
+			CompactForest.from_sklearn(rf, quantize=quantize).save(path)
+			forest, load_time = timed(lambda: CompactForest.load(path), repeat=3)
+			_, load_peak = peak_memory(lambda: CompactForest.load(path))
+			_, predict_time = timed(lambda: forest.predict(batch), repeat=50)
+			error = np.abs(forest.predict(full) - expected).max()
+			# Split decisions must match exactly, so only float32 leaf values may introduce error
+			assert error <= (1e-5 if quantize else 1e-12), error
+			name = 'compact float32' if quantize else 'compact float64'
+			print(f'{name:<18}{directory_size(path) / 1e6:>10.1f}{load_time * 1000:>10.1f}{load_peak / 1e6:>14.1f}{predict_time * 1000:>15.2f}{error:>14.1e}')
+
+if __name__ == '__main__':
+	main()
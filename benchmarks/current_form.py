@@ -0,0 +1,129 @@
+"""
+Times the current-form snapshot: build_current_form against the per-team iterrows loop it replaced.
+Run with: python -m benchmarks.current_form [n_leagues] [n_seasons] [n_teams]
+"""
+from app.predictor.util import util
+from app.predictor.training import build_current_form
+from benchmarks.synthetic import generate_matches
+import pandas as pd
+import time
+import sys
+
+def current_form_loop(data, ratings, leagues):
+	"""Reference implementation: the per-team iterrows accumulator build_current_form replaced."""
+	df_tmp = []
+	for league in leagues:
+		league_data = data[data['Div'] == league]
+		teams = league_data[league_data['Season'] == league_data['Season'].max()]['HomeTeam'].unique()
+		for team in teams:
+			#ELO, goals scored, goals conceded, goal difference, points, change in ELO, opposition mean ELO, shots on target attempted, shots on target allowed, shot attempted, shots allows, corner awarded, corners conceded, fouls commited, fouls suffered, yellow cards, red cards
+			elo = ratings[team]
+			last_five_matches = util.get_all_matches_of_team(data, team).tail(5)
+			goals_scored = 0
+			goals_conceded = 0
+			goal_difference = 0
+			points = 0
+			change_in_ELO = 0 #, ta ELO ved nåværende minus første kamp ELO
+			oppoisition_mean_ELO = 0 #Er først sum
+			shots_on_target_attemped = 0
+			shots_on_target_allowed = 0
+			shots_attempted = 0
+			shots_allowed = 0
+			corners_awarded = 0
+			corners_allowed = 0
+			fouls_commited = 0
+			fouls_suffered = 0
+			yellow_cards = 0
+			red_cards = 0
+			i = 0
+			for index, match in last_five_matches.iterrows():
+				i += 1
+				if team == match['HomeTeam']:
+					goals_scored += match['FTHG']
+					goals_conceded += match['FTAG']
+					goal_difference += match['FTHG'] - match['FTAG']
+					if match['FTR'] == 'H':
+						points += 3
+					elif match['FTR'] == 'D':
+						points += 1
+					if i == len(last_five_matches):
+						change_in_ELO = elo - match['Home ELO']
+					oppoisition_mean_ELO += match['Away ELO']
+					shots_on_target_attemped += match['HST']
+					shots_on_target_allowed += match['AST']
+					shots_attempted += match['HS']
+					shots_allowed += match['AS']
+					corners_awarded += match['HC']
+					corners_allowed += match['AC']
+					fouls_commited +=  match['HF']
+					fouls_suffered += match['AF']
+					yellow_cards += match['HY']
+					red_cards += match['HR']
+					
+				elif team == match['AwayTeam']:
+					goals_scored += match['FTAG']
+					goals_conceded += match['FTHG']
+					goal_difference += match['FTAG'] - match['FTHG']
+					if match['FTR'] == 'A':
+						points += 3
+					elif match['FTR'] == 'D':
+						points += 1
+					if i == len(last_five_matches):
+						change_in_ELO = elo - match['Away ELO']
+					oppoisition_mean_ELO += match['Home ELO']
+					shots_on_target_attemped += match['AST']
+					shots_on_target_allowed += match['HST']
+					shots_attempted += match['AS']
+					shots_allowed += match['HS']
+					corners_awarded += match['AC']
+					corners_allowed += match['HC']
+					fouls_commited +=  match['AF']
+					fouls_suffered += match['HF']
+					yellow_cards += match['AY']
+					red_cards += match['AR']
+			oppoisition_mean_ELO = oppoisition_mean_ELO / len(last_five_matches)
+			df_dict = {
+				'Div': league,
+				'Team': team,
+				'ELO': elo,
+				'Goals scored': goals_scored,
+				'Goals conceded': goals_conceded,
+				'Goals difference': goal_difference,
+				'Points': points,
+				'Change in ELO': change_in_ELO,
+				'Opposition mean ELO': oppoisition_mean_ELO,
+				'Shots on target attempted': shots_on_target_attemped,
+				'Shots on target allows': shots_on_target_allowed,
+				'Shots attemped': shots_attempted,
+				'Shots allowed': shots_allowed,
+				'Corners awarded': corners_awarded,
+				'Corners allowed': corners_allowed,
+				'Fouls commited': fouls_commited,
+				'Fouls suffered': fouls_suffered,
+				'Yellow cards': yellow_cards,
+				'Red cards': red_cards
+			}	
+			df_tmp.append(df_dict)
+	return pd.DataFrame(df_tmp)
+
+def main():
+	n_leagues, n_seasons, n_teams = (int(arg) for arg in (sys.argv[1:] or [4, 10, 20]))
+	data = util.clean_data(generate_matches(n_leagues, n_seasons, n_teams))
+	leagues = list(data['Div'].unique())
+	ELO = util.ELO(data, init_rating=1500, draw_factor=0.25, k_factor=32, home_advantage=50)
+	data = ELO.perform_simulations(data)
+	print(f'{len(data)} matches, {n_leagues} leagues, {n_seasons} seasons, {n_teams} teams')
+
+	start = time.perf_counter()
+	expected = current_form_loop(data, ELO.ratings, leagues)
+	loop_time = time.perf_counter() - start
+	start = time.perf_counter()
+	snapshot = build_current_form(data, ELO.ratings, leagues)
+	vectorized_time = time.perf_counter() - start
+
+	pd.testing.assert_frame_equal(snapshot, expected, check_dtype=False)
+	print(f'iterrows loop:   {loop_time * 1000:.1f} ms')
+	print(f'grouped tail(5): {vectorized_time * 1000:.1f} ms ({loop_time / vectorized_time:.0f}x)')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,145 @@
+"""
+Backfills a rating history from a local ClubELO stand-in serving seeded random-walk histories, and checks it. Club histories fetched at
+several concurrency levels must give the stored periods exactly, single and batch as-of lookups must agree with a linear scan, a daily
+rankings backfill must be exact on the fetched days, and a saved history must load back the same. Also times the lookups.
+
+Run with: python -m benchmarks.elo_history [n_clubs] [years]
+"""
+from app.config.config import settings
+from app.core.external_services import ClubELOAPI
+from app.core.elo_history import RatingHistory, backfill_club_histories, backfill_daily_rankings
+from app.core.scheduler import upstream_scheduler, TokenBucket
+from datetime import date, timedelta
+from aiohttp import web
+import numpy as np
+import pandas as pd
+import tempfile
+import asyncio
+import time
+import sys
+
+class SyntheticHistories:
+	"""Seeded ClubELO histories: each club's rating changes every few days, with From and To dates like the API's"""
+	def __init__(self, n_clubs, years, seed=42):
+		rng = np.random.default_rng(seed)
+		self.end = date(2024, 6, 30)
+		self.start = self.end - timedelta(days=365 * years)
+		self.periods = {}
+		for i in range(n_clubs):
+			# Clubs enter the history at different times
+			first = self.start + timedelta(days=int(rng.integers(0, 365 * years // 2)))
+			gaps = rng.integers(3, 11, size=(self.end - first).days // 3)
+			starts = np.datetime64(first) + np.concatenate([[0], np.cumsum(gaps)]).astype('timedelta64[D]')
+			starts = starts[starts <= np.datetime64(self.end)]
+			ratings = (rng.normal(1600, 150) + np.cumsum(rng.normal(0, 8, len(starts)))).round(2)
+			self.periods[f'Club {i}'] = (starts, ratings)
+
+	def history_csv(self, club):
+		starts, ratings = self.periods[club]
+		ends = np.append(starts[1:] - np.timedelta64(1, 'D'), np.datetime64(self.end))
+		return pd.DataFrame({'Rank': None, 'Club': club, 'Country': 'ENG', 'Level': 1, 'Elo': ratings, 'From': starts, 'To': ends}).to_csv(index=False)
+
+	def ranking_csv(self, day):
+		rows = []
+		for club, (starts, ratings) in self.periods.items():
+			j = np.searchsorted(starts, np.datetime64(day), side='right') - 1
+			if j >= 0:
+				ends = np.append(starts[1:] - np.timedelta64(1, 'D'), np.datetime64(self.end))
+				rows.append({'Rank': None, 'Club': club, 'Country': 'ENG', 'Level': 1, 'Elo': ratings[j], 'From': starts[j], 'To': ends[j]})
+		return pd.DataFrame(rows).to_csv(index=False)
+
+	def rating_as_of(self, club, day):
+		"""Linear scan, the reference for the lookups"""
+		if club not in self.periods:
+			return np.nan
+		rating = np.nan
+		for start, value in zip(*self.periods[club]):
+			if start > day:
+				break
+			rating = value
+		return rating
+
+	def app(self, latency_ms):
+		async def handler(request):
+			await asyncio.sleep(latency_ms / 1000)
+			name = request.match_info['name']
+			if name in self.periods:
+				return web.Response(text=self.history_csv(name), content_type='text/csv')
+			try:
+				return web.Response(text=self.ranking_csv(date.fromisoformat(name)), content_type='text/csv')
+			except ValueError:
+				# ClubELO answers unknown names with an empty body
+				return web.Response(text='', content_type='text/csv')
+		app = web.Application()
+		app.router.add_get('/clubelo/{name}', handler)
+		return app
+
+def random_queries(synthetic, n, rng):
+	clubs = list(synthetic.periods) + ['Unknown FC']
+	teams = [clubs[int(i)] for i in rng.integers(0, len(clubs), n)]
+	# From before the first period to after the last one
+	days = np.datetime64(synthetic.start - timedelta(days=30)) + rng.integers(0, (synthetic.end - synthetic.start).days + 60, n).astype('timedelta64[D]')
+	return teams, days
+
+def same(a, b):
+	return np.allclose(np.asarray(a, dtype=float), np.asarray(b, dtype=float), equal_nan=True, rtol=0, atol=1e-3)
+
+async def main(n_clubs, years):
+	synthetic = SyntheticHistories(n_clubs, years)
+	runner = web.AppRunner(synthetic.app(latency_ms=30))
+	await runner.setup()
+	await web.TCPSite(runner, '127.0.0.1', 8917).start()
+	settings.CLUBELO_URL = 'http://127.0.0.1:8917/clubelo'
+	upstream_scheduler.buckets['clubelo'] = TokenBucket(1000.0, 100)
+	api = ClubELOAPI()
+	try:
+		clubs = list(synthetic.periods) + ['Unknown FC']
+		for concurrency in [1, 8, 32]:
+			start = time.perf_counter()
+			history, failed = await backfill_club_histories(api, clubs, concurrency)
+			print(f'Club histories, concurrency {concurrency:>2}: {len(history.days)} periods of {len(history.teams)} clubs in {time.perf_counter() - start:.2f} s')
+		assert failed == ['Unknown FC'], 'unknown clubs should be reported, not raise'
+		for club, (starts, ratings) in synthetic.periods.items():
+			days, stored = history.history(club)
+			assert (days == starts).all() and same(stored, ratings), club
+
+		rng = np.random.default_rng(0)
+		teams, days = random_queries(synthetic, 5000, rng)
+		expected = [synthetic.rating_as_of(team, day) for team, day in zip(teams, days)]
+		assert same([history.rating_as_of(team, day) for team, day in zip(teams, days)], expected), 'single lookups'
+		assert same(history.ratings_as_of(teams, days), expected), 'batch lookups'
+		print(f'Checked {len(teams)} single and batch as-of lookups against a linear scan')
+
+		window = [synthetic.end - timedelta(days=59), synthetic.end]
+		start = time.perf_counter()
+		daily, _ = await backfill_daily_rankings(api, *window, step_days=1, concurrency=8)
+		fetched = np.arange(np.datetime64(window[0]), np.datetime64(window[1]) + 1)
+		teams, days = [club for club in synthetic.periods for _ in fetched], np.tile(fetched, len(synthetic.periods))
+		assert same(daily.ratings_as_of(teams, days), history.ratings_as_of(teams, days)), 'daily rankings should be exact on the fetched days'
+		print(f'Daily rankings for 60 days: {len(daily.days)} periods in {time.perf_counter() - start:.2f} s, exact on the fetched days')
+
+		with tempfile.TemporaryDirectory() as directory:
+			history.merge(daily).save(directory)
+			loaded = RatingHistory.load(directory)
+		assert loaded.teams == history.teams and (loaded.days == history.days).all() and (loaded.ratings == history.ratings).all(), \
+			'merging a subset of the periods and saving should not change the history'
+
+		teams, days = random_queries(synthetic, 100000, rng)
+		start = time.perf_counter()
+		for team, day in zip(teams[:20000], days[:20000]):
+			history.rating_as_of(team, day)
+		single_us = (time.perf_counter() - start) / 20000 * 1e6
+		start = time.perf_counter()
+		history.ratings_as_of(teams, days)
+		batch_ns = (time.perf_counter() - start) / len(teams) * 1e9
+		frame = pd.DataFrame({'Club': [club for club, (starts, _) in synthetic.periods.items() for _ in starts]})
+		frame['From'] = np.concatenate([starts for starts, _ in synthetic.periods.values()])
+		frame['Elo'] = np.concatenate([ratings for _, ratings in synthetic.periods.values()])
+		print(f'Single lookup {single_us:.1f} us, batch of {len(teams)} {batch_ns:.0f} ns per lookup')
+		print(f'Memory: {history.nbytes / 1e6:.2f} MB, against {frame.memory_usage(deep=True).sum() / 1e6:.2f} MB as a DataFrame')
+	finally:
+		await api.close()
+		await runner.cleanup()
+
+if __name__ == '__main__':
+	asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300, int(sys.argv[2]) if len(sys.argv) > 2 else 10))
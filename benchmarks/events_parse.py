@@ -0,0 +1,112 @@
+"""
+Compares parsing a large Norsk Tipping events/FBL payload in full with json.loads against the streaming NorskTippingAPI.stream_events path.
+Reports time and tracemalloc peak for both.
+
+Run with: python -m benchmarks.events_parse [recorded events.json] [--events 20000]
+Without a recorded payload, the synthetic stub events are padded with worldwide filler events and the extra fields the real feed carries.
+"""
+from app.core.external_services import NorskTippingAPI
+from app.core.parsers import MatchParser
+from benchmarks.stub_server import SyntheticUpstream
+from unittest import mock
+import numpy as np
+import argparse
+import asyncio
+import tracemalloc
+import json
+import time
+
+class ChunkedReader:
+	"""Minimal stand-in for aiohttp's StreamReader, handing out the body in network-sized chunks."""
+	def __init__(self, body: bytes, chunk_size=64 * 1024):
+		self.body = body
+		self.chunk_size = chunk_size
+		self.position = 0
+
+	async def read(self, n=-1):
+		n = self.chunk_size if n is None or n < 0 else min(n, self.chunk_size)
+		chunk = self.body[self.position:self.position + n]
+		self.position += len(chunk)
+		return chunk
+
+class FakeResponse:
+	def __init__(self, body):
+		self.status = 200
+		self.content = ChunkedReader(body)
+
+	def raise_for_status(self):
+		pass
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *exc):
+		return False
+
+def synthetic_payload(n_events, seed=42) -> bytes:
+	rng = np.random.default_rng(seed)
+	events = SyntheticUpstream(n_events=60, seed=seed).events
+	filler = []
+	for i in range(n_events - len(events)):
+		filler.append({
+			'eventId': str(2000000 + i),
+			'homeParticipant': f'Home {i}',
+			'awayParticipant': f'Away {i}',
+			'startTime': '2025-03-01T15:00:00+01:00',
+			'tournament': {'name': f'Land {i % 300} - Liga {i % 4}', 'id': i % 300, 'sportId': 'FBL'},
+			'mainMarket': {
+				'marketName': 'HUB',
+				'marketId': str(i),
+				'selections': [{'selectionName': name, 'selectionOdds': float(rng.uniform(1.2, 9)), 'selectionId': f'{i}-{name}', 'status': 'OPEN'} for name in 'HUB'],
+			},
+			'liveStatus': {'isLive': False, 'score': None},
+			'numberOfMarkets': int(rng.integers(20, 200)),
+			'broadcast': [{'channel': 'TV', 'country': 'NO'}],
+			'participants': [{'name': f'Home {i}', 'shortName': f'H{i}'}, {'name': f'Away {i}', 'shortName': f'A{i}'}],
+		})
+	return json.dumps({'eventList': events + filler}).encode()
+
+def measure(fn):
+	start = time.perf_counter()
+	result = fn()
+	seconds = time.perf_counter() - start
+	tracemalloc.start()
+	fn()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return result, seconds, peak
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('recorded', nargs='?', default=None)
+	parser.add_argument('--events', type=int, default=20000)
+	args = parser.parse_args()
+	if args.recorded:
+		with open(args.recorded, 'rb') as f:
+			body = f.read()
+	else:
+		body = synthetic_payload(args.events)
+	match_parser = MatchParser.__new__(MatchParser)
+
+	def full():
+		events = json.loads(body).get('eventList', [])
+		return [event for event in events if match_parser.compact_event(event) is not None]
+
+	async def stream():
+		api = NorskTippingAPI()
+		try:
+			with mock.patch.object(api.session, 'get', lambda *args, **kwargs: FakeResponse(body)):
+				return (await api.stream_events('events/FBL', match_parser.compact_event))['eventList']
+		finally:
+			await api.close()
+
+	print(f'Payload: {len(body) / 1e6:.1f} MB')
+	kept_full, full_time, full_peak = measure(full)
+	kept_stream, stream_time, stream_peak = measure(lambda: asyncio.run(stream()))
+	assert [event['eventId'] for event in kept_full] == [event['eventId'] for event in kept_stream]
+	print(f'{"json.loads + filter":<22}{full_time * 1000:>10.1f} ms{full_peak / 1e6:>10.1f} MB peak')
+	print(f'{"streaming":<22}{stream_time * 1000:>10.1f} ms{stream_peak / 1e6:>10.1f} MB peak')
+	print(f'{len(kept_stream)} events kept')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,77 @@
+"""
+Compares the compact fixtures layout of FixturesRepository (interned team names, sorted int32 pair keys, float32 arrays) with the
+float64 DataFrame indexed by (Home, Away) it replaced: memory held per snapshot, load time and the latency of a HUB lookup,
+and checks that both give the same probabilities.
+
+Run with: python -m benchmarks.fixtures_layout [n_fixtures]
+"""
+from app.core.repositories import FixturesRepository
+from benchmarks.stub_server import SyntheticUpstream
+import pandas as pd
+import numpy as np
+import tempfile
+import io
+import time
+import sys
+import os
+
+home_columns = ['GD=1', 'GD=2', 'GD=3', 'GD=4', 'GD=5', 'GD>5']
+away_columns = ['GD=-1', 'GD=-2', 'GD=-3', 'GD=-4', 'GD=-5', 'GD<-5']
+
+def dataframe_hub(fixtures: pd.DataFrame, home: str, away: str):
+	row = fixtures.loc[home, away]
+	return sum(row[col] for col in home_columns), row['GD=0'], sum(row[col] for col in away_columns)
+
+def per_lookup_ns(lookup, pairs, repeat=5) -> float:
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.perf_counter()
+		for home, away in pairs:
+			lookup(home, away)
+		best = min(best, time.perf_counter() - start)
+	return best / len(pairs) * 1e9
+
+def main(n_fixtures):
+	stub = SyntheticUpstream(n_fixtures)
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'fixtures.csv')
+		pd.read_csv(io.StringIO(stub.fixtures_csv)).drop_duplicates(['Home', 'Away']).to_csv(path, index=False)
+
+		start = time.perf_counter()
+		fixtures = pd.read_csv(path, index_col=['Home', 'Away'])
+		dataframe_load = time.perf_counter() - start
+		start = time.perf_counter()
+		repo = FixturesRepository.from_csv(path, {})
+		compact_load = time.perf_counter() - start
+		start = time.perf_counter()
+		FixturesRepository.from_csv(path, {})
+		cached_load = time.perf_counter() - start
+
+	grids = repo.score_grids
+	dataframe_bytes = fixtures.memory_usage(deep=True).sum()
+	compact_bytes = grids.nbytes
+	# The repository used to hold the DataFrame next to float64 grids found through a dict of name tuples
+	arrays = [grids.grid, grids.gd_cdf, grids.total_cdf, grids.home_cdf, grids.away_cdf, grids.odd, grids.mass]
+	positions = {key: i for i, key in enumerate(fixtures.index)}
+	previous_bytes = dataframe_bytes + 2 * sum(array.nbytes for array in arrays) + sys.getsizeof(positions) + sum(sys.getsizeof(key) for key in positions)
+	print(f'{len(fixtures)} fixtures, {len(grids.teams)} teams')
+	print(f'DataFrame alone:     {dataframe_bytes / 1024:6.0f} KiB, load {dataframe_load * 1000:.1f} ms')
+	print(f'Previous repository: {previous_bytes / 1024:6.0f} KiB')
+	print(f'Compact:             {compact_bytes / 1024:6.0f} KiB, load {compact_load * 1000:.1f} ms, unchanged file {cached_load * 1e6:.0f} us '
+		f'({previous_bytes / compact_bytes:.1f}x smaller than before, {dataframe_bytes / compact_bytes:.1f}x than the DataFrame)')
+
+	pairs = list(fixtures.index)
+	for home, away in pairs:
+		expected = dataframe_hub(fixtures, home, away)
+		hub = repo.get_match_probabilities(home, away)
+		assert np.allclose([hub.home, hub.draw, hub.away], expected, atol=1e-5), (home, away)
+	assert repo.get_match_probabilities('Nobody', pairs[0][1]).home == 0
+	print(f'Checked {len(pairs)} HUB lookups against the DataFrame')
+
+	pairs = pairs * max(1, 20000 // len(pairs))
+	print(f'DataFrame lookup: {per_lookup_ns(lambda home, away: dataframe_hub(fixtures, home, away), pairs[:2000]):8.0f} ns')
+	print(f'Compact lookup:   {per_lookup_ns(repo.get_match_probabilities, pairs):8.0f} ns')
+	print(f'Compact position: {per_lookup_ns(repo.score_grids.position, pairs):8.0f} ns')
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
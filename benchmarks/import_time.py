@@ -0,0 +1,62 @@
+"""
+Measures the cold import of the serving app the way a new worker pays it. `python -X importtime -c "import app.main"` runs in fresh
+interpreters, and the report lists the total and the slowest top-level packages. It fails when a library that the serving path should only
+load lazily is imported (pandas, SciPy, scikit-learn, joblib, pyarrow), or when the median total is over the budget.
+
+Run with: python -m benchmarks.import_time [--module app.main] [--runs 5] [--budget-ms 1500]
+"""
+from typing import Dict, List, Tuple
+import statistics
+import argparse
+import subprocess
+import sys
+
+heavy_packages = ['pandas', 'scipy', 'sklearn', 'joblib', 'pyarrow']
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+	"""(module, self µs, cumulative µs) for every module the import loaded, from a fresh interpreter"""
+	stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True).stderr
+	times = []
+	for line in stderr.splitlines():
+		if not line.startswith('import time:') or 'self [us]' in line:
+			continue
+		self_us, cumulative_us, name = line.removeprefix('import time:').split('|')
+		times.append((name.strip(), int(self_us), int(cumulative_us)))
+	return times
+
+def by_package(times: List[Tuple[str, int, int]]) -> Dict[str, int]:
+	"""Self time summed per top-level package"""
+	packages = {}
+	for name, self_us, _ in times:
+		package = name.split('.')[0]
+		packages[package] = packages.get(package, 0) + self_us
+	return packages
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--module', default='app.main')
+	parser.add_argument('--runs', type=int, default=5)
+	parser.add_argument('--budget-ms', type=float, default=1500.0, help='Largest acceptable median import time')
+	parser.add_argument('--top', type=int, default=10)
+	args = parser.parse_args()
+
+	runs = [import_times(args.module) for _ in range(args.runs)]
+	totals = [max(cumulative for _, _, cumulative in times) / 1000 for times in runs]
+	median = statistics.median(totals)
+	print(f'import {args.module}: median {median:.0f} ms over {args.runs} runs (min {min(totals):.0f}, max {max(totals):.0f})')
+	packages = by_package(runs[totals.index(sorted(totals)[len(totals) // 2])])
+	for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+		print(f'  {package:<24} {self_us / 1000:8.1f} ms')
+
+	loaded = sorted({name.split('.')[0] for name, _, _ in runs[0]} & set(heavy_packages))
+	failed = False
+	if loaded:
+		print(f'Imported by the serving path, should be lazy: {", ".join(loaded)}')
+		failed = True
+	if median > args.budget_ms:
+		print(f'Over the budget of {args.budget_ms:.0f} ms')
+		failed = True
+	sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+	main()
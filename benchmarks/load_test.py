@@ -0,0 +1,58 @@
+"""
+Load generator for the API. Each endpoint gets a fixed number of requests at each concurrency level, and the script reports throughput, error count and p50/p95/p99 latency.
+Start the API against the stub upstreams first (see benchmarks/stub_server.py).
+
+Run with: python -m benchmarks.load_test --base-url http://localhost:8000 --concurrency 1 8 32 --requests 200
+"""
+import numpy as np
+import argparse
+import aiohttp
+import asyncio
+import time
+
+async def run_level(session, url_for, concurrency, n_requests):
+	latencies, errors = [], 0
+	counter = iter(range(n_requests))
+
+	async def worker():
+		nonlocal errors
+		for i in counter:
+			start = time.perf_counter()
+			try:
+				async with session.get(url_for(i)) as response:
+					await response.read()
+					if response.status >= 400:
+						errors += 1
+			except aiohttp.ClientError:
+				errors += 1
+			latencies.append(time.perf_counter() - start)
+
+	start = time.perf_counter()
+	await asyncio.gather(*(worker() for _ in range(concurrency)))
+	elapsed = time.perf_counter() - start
+	p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+	return {'rps': n_requests / elapsed, 'errors': errors, 'p50': p50, 'p95': p95, 'p99': p99}
+
+async def main(args):
+	timeout = aiohttp.ClientTimeout(total=args.timeout)
+	connector = aiohttp.TCPConnector(limit=max(args.concurrency))
+	async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+		async with session.get(f'{args.base_url}/matches') as response:
+			ids = [match['NT_id'] for match in (await response.json()).get('eventList', [])]
+		endpoints = {'/matches': lambda i: f'{args.base_url}/matches'}
+		if ids:
+			endpoints['/matches/{NT_id}'] = lambda i: f'{args.base_url}/matches/{ids[i % len(ids)]}'
+
+		print(f'{"endpoint":<20}{"conc":>6}{"req/s":>10}{"errors":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+		for name, url_for in endpoints.items():
+			for concurrency in args.concurrency:
+				result = await run_level(session, url_for, concurrency, args.requests)
+				print(f'{name:<20}{concurrency:>6}{result["rps"]:>10.1f}{result["errors"]:>8}{result["p50"]:>10.1f}{result["p95"]:>10.1f}{result["p99"]:>10.1f}')
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--base-url', default='http://localhost:8000')
+	parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+	parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and concurrency level')
+	parser.add_argument('--timeout', type=float, default=30)
+	asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,115 @@
+"""
+Checks the /matches query indexes against brute-force filtering over random synthetic matches. Every page sequence must add up to the
+filtered and sorted feed, including the cursors. Also times a page query against filtering and sorting the whole feed. The index is
+built once per events payload, so the first request after a refresh also pays for the build, reported with the page.
+
+Run with: python -m benchmarks.match_index [n_matches]
+"""
+from app.core.match_index import MatchIndex, MatchQuery, best_expected_value, decode_cursor
+from app.core.schemas import MatchSummaryModel, HUBModel, ELOModel
+from app.config.config import settings
+from app.utils.utils import tournaments_of_interest
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import time
+import sys
+
+def synthetic_matches(n, seed=42):
+	rng = np.random.default_rng(seed)
+	now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+	matches = []
+	for i in range(n):
+		probs = rng.dirichlet([4, 2.5, 3])
+		odds = np.round(1 / (probs * rng.uniform(0.9, 1.15, 3)), 2)
+		matches.append(MatchSummaryModel(
+			NT_id=str(1000000 + i),
+			home_team=f'Team {2 * i}',
+			away_team=f'Team {2 * i + 1}',
+			# Whole hours, so many matches share a kickoff and the NT_id tie-break matters
+			start_time=now + timedelta(hours=int(rng.integers(1, 24 * 14))),
+			tournament=tournaments_of_interest[int(rng.integers(len(tournaments_of_interest)))],
+			odds=HUBModel(home=odds[0], draw=odds[1], away=odds[2]),
+			elo=ELOModel(home_elo=1700, away_elo=1700, probs=HUBModel(home=probs[0], draw=probs[1], away=probs[2])),
+			expected_value=HUBModel(home=odds[0] * probs[0], draw=odds[1] * probs[1], away=odds[2] * probs[2]),
+		))
+	return matches
+
+def brute_force(matches, query):
+	kept = [
+		match for match in matches
+		if (not query.tournaments or match.tournament in query.tournaments)
+		and (query.start_from is None or match.start_time >= query.start_from)
+		and (query.start_to is None or match.start_time <= query.start_to)
+		and (not query.filters_outcomes or query.accepts_outcomes(match))
+	]
+	if query.sort == 'ev':
+		return sorted(kept, key=lambda match: (-best_expected_value(match), match.NT_id))
+	return sorted(kept, key=lambda match: (match.start_time, match.NT_id))
+
+def random_query(rng, matches, limit):
+	start = min(match.start_time for match in matches)
+	return MatchQuery(
+		tournaments=tuple(rng.choice(tournaments_of_interest, int(rng.integers(0, 3)), replace=False)),
+		start_from=start + timedelta(hours=int(rng.integers(0, 24 * 7))) if rng.random() < 0.5 else None,
+		start_to=start + timedelta(hours=int(rng.integers(24 * 7, 24 * 14))) if rng.random() < 0.5 else None,
+		min_odds=float(rng.uniform(1.2, 2.5)) if rng.random() < 0.3 else None,
+		max_odds=float(rng.uniform(3, 8)) if rng.random() < 0.3 else None,
+		min_ev=float(rng.uniform(0.95, 1.1)) if rng.random() < 0.3 else None,
+		sort=['start_time', 'ev'][int(rng.integers(2))],
+		limit=limit,
+	)
+
+def all_pages(index, query):
+	matches, cursor, pages = [], None, 0
+	while True:
+		page, next_cursor = index.query(MatchQuery(**{**query.__dict__, 'cursor': cursor}))
+		matches += page
+		pages += 1
+		if next_cursor is None:
+			return matches, pages
+		cursor = decode_cursor(next_cursor, query.sort)
+
+def main(n_matches):
+	matches = synthetic_matches(n_matches)
+	builds = []
+	for _ in range(5):
+		start = time.perf_counter()
+		index = MatchIndex(matches)
+		builds.append(time.perf_counter() - start)
+	build_us = min(builds) * 1e6
+	print(f'Indexed {n_matches} matches in {build_us / 1000:.1f} ms, once per events payload (at most every {settings.ODDS_CACHE_TTL:g} s)')
+
+	rng = np.random.default_rng(0)
+	checked_pages = 0
+	for _ in range(200):
+		query = random_query(rng, matches, int(rng.integers(1, 60)))
+		expected = [match.NT_id for match in brute_force(matches, query)]
+		paged, pages = all_pages(index, query)
+		assert [match.NT_id for match in paged] == expected, query
+		unpaged, _ = index.query(MatchQuery(**{**query.__dict__, 'limit': None}))
+		assert [match.NT_id for match in unpaged] == expected, query
+		checked_pages += pages
+	print(f'Checked 200 random queries in {checked_pages} pages against brute force')
+
+	for query in [
+		MatchQuery(limit=20),
+		MatchQuery(tournaments=(tournaments_of_interest[0],), limit=20),
+		MatchQuery(sort='ev', limit=20),
+		MatchQuery(min_ev=1.05, sort='ev', limit=20),
+	]:
+		repeat = 200
+		start = time.perf_counter()
+		for _ in range(repeat):
+			index.query(query)
+		page_us = (time.perf_counter() - start) / repeat * 1e6
+		start = time.perf_counter()
+		for _ in range(20):
+			brute_force(matches, query)[:query.limit]
+		full_us = (time.perf_counter() - start) / 20 * 1e6
+		print(
+			f'{str({key: value for key, value in query.__dict__.items() if value not in (None, ())}):<90} page {page_us:8.0f} us, '
+			f'first after a refresh {build_us + page_us:8.0f} us, whole feed {full_us:8.0f} us'
+		)
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
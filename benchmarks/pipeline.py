@@ -0,0 +1,134 @@
+"""
+Benchmark suite for the predictor training pipeline on seeded synthetic data, so nothing is fetched from football-data.co.uk.
+Every stage is timed, then run again under tracemalloc for its peak memory, and the results are written as JSON.
+
+Run with: python -m benchmarks.pipeline --leagues 2 --seasons 3 --teams 20 [--compare benchmarks/results/<old>.json]
+"""
+from app.predictor.util import util
+from app.predictor import training
+from app.predictor.training import PredictorTrainer, build_league_features, build_current_form, fit_league_model
+from benchmarks.synthetic import generate_matches
+from datetime import datetime, timezone
+from unittest import mock
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import json
+import time
+import os
+
+def git_version():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def measure(fn, memory=True):
+	start = time.perf_counter()
+	result = fn()
+	seconds = time.perf_counter() - start
+	peak_mb = None
+	if memory:
+		tracemalloc.start()
+		fn()
+		peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+		tracemalloc.stop()
+	return result, {'seconds': round(seconds, 4), 'peak_mb': None if peak_mb is None else round(peak_mb, 2)}
+
+def run_stages(args, tmp_dir):
+	"""Runs the pipeline stage by stage. Each stage gets fresh copies of its inputs, since several of them modify the frame they are given."""
+	stages = {}
+	generate = lambda: generate_matches(args.leagues, args.seasons, args.teams, seed=args.seed)
+	raw, stages['generate'] = measure(generate, args.memory)
+	data, stages['clean_data'] = measure(lambda: util.clean_data(raw), args.memory)
+
+	def simulate():
+		ELO = util.ELO(data.copy(), init_rating=1500, draw_factor=0.25, k_factor=32, home_advantage=50)
+		return ELO, ELO.perform_simulations(data.copy())
+	(ELO, simulated), stages['elo_perform_simulations'] = measure(simulate, args.memory)
+
+	league = simulated['Div'].iloc[0]
+	league_data = simulated[simulated['Div'] == league]
+	_, stages['add_form_column'] = measure(
+		lambda: util.add_form_column(league_data.copy(), 'FTHG', 'FTAG', n=5, operation='Sum', regard_opponent=False, include_current=False),
+		args.memory,
+	)
+	features, stages['build_league_features'] = measure(lambda: build_league_features(league_data.copy()), args.memory)
+	_, stages['fit_league_model'] = measure(
+		lambda: fit_league_model(league, features, tmp_dir, tmp_dir, n_jobs=args.n_jobs),
+		args.memory,
+	)
+	_, stages['build_current_form'] = measure(
+		lambda: build_current_form(simulated, ELO.ratings, list(simulated['Div'].unique())),
+		args.memory,
+	)
+
+	# End to end, with fetch_data serving the synthetic frame and every output kept in the temp dir
+	trainer = PredictorTrainer(n_jobs=args.n_jobs)
+	trainer.leagues = list(raw['Div'].unique())
+	trainer.model_path = f'{tmp_dir}/models'
+	trainer.stats_path = f'{tmp_dir}/stats'
+	trainer.current_data_path = f'{tmp_dir}/current_data.csv'
+	trainer.feature_store = training.FeatureStore(f'{tmp_dir}/feature_store')
+	with mock.patch.object(util, 'fetch_data', lambda *_: raw.copy()):
+		# Worker processes are not traced by tracemalloc, so only the time is meaningful here
+		_, stages['train_models'] = measure(trainer.train_models, memory=False)
+	return stages
+
+def compare(results, previous_path, tolerance):
+	with open(previous_path) as f:
+		previous = json.load(f)
+	print(f'\nCompared with {previous.get("version")} ({previous_path}):')
+	regressions = 0
+	for name, stage in results['stages'].items():
+		old = previous['stages'].get(name)
+		if not old:
+			continue
+		ratio = stage['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+		flag = 'REGRESSION' if ratio > tolerance else ''
+		regressions += bool(flag)
+		print(f'{name:<26}{old["seconds"]:>10.3f}s -> {stage["seconds"]:>8.3f}s {ratio:>6.2f}x {flag}')
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--leagues', type=int, default=2)
+	parser.add_argument('--seasons', type=int, default=3)
+	parser.add_argument('--teams', type=int, default=20)
+	parser.add_argument('--seed', type=int, default=42)
+	parser.add_argument('--n-jobs', type=int, default=1)
+	parser.add_argument('--no-memory', dest='memory', action='store_false', help='Skip the tracemalloc pass')
+	parser.add_argument('--output', default=None, help='Result file, defaults to benchmarks/results/<version>-<timestamp>.json')
+	parser.add_argument('--compare', default=None, help='Earlier result file to compare stage times with')
+	parser.add_argument('--tolerance', type=float, default=1.2, help='Slowdown ratio reported as a regression')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		stages = run_stages(args, tmp_dir)
+
+	version = git_version()
+	timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+	results = {
+		'version': version,
+		'timestamp': timestamp,
+		'python': platform.python_version(),
+		'config': {'leagues': args.leagues, 'seasons': args.seasons, 'teams': args.teams, 'seed': args.seed, 'n_jobs': args.n_jobs},
+		'stages': stages,
+	}
+	for name, stage in stages.items():
+		peak = '' if stage['peak_mb'] is None else f'{stage["peak_mb"]:>10.1f} MB'
+		print(f'{name:<26}{stage["seconds"]:>10.3f}s{peak}')
+
+	output = args.output or f'benchmarks/results/{version or "unknown"}-{timestamp}.json'
+	os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+	with open(output, 'w') as f:
+		json.dump(results, f, indent=2)
+	print(f'Saved results to {output}')
+
+	if args.compare and compare(results, args.compare, args.tolerance):
+		raise SystemExit(1)
+
+if __name__ == '__main__':
+	main()
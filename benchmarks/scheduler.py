@@ -0,0 +1,70 @@
+"""
+Runs a burst of prefetch and user-facing market requests through the upstream scheduler against a local stub server, with a tight
+token bucket, and checks the scheduling: user requests are admitted ahead of prefetch ones queued before them, sooner kickoffs go first
+within a class, the bucket holds the request rate, and requests whose deadline passes in the queue are never sent.
+
+Run with: python -m benchmarks.scheduler [rate] [n_prefetch]
+"""
+from app.config.config import settings
+from app.core.external_services import NorskTippingAPI
+from app.core.scheduler import upstream_scheduler, upstream_priority, upstream_queue_wait_seconds, RequestClass, TokenBucket, DeadlineExceeded
+from app.core.metrics import upstream_requests_total
+from benchmarks.stub_server import StubUpstream
+from aiohttp import web
+import numpy as np
+import asyncio
+import time
+import sys
+
+async def main(rate, n_prefetch):
+	stub = StubUpstream(latency_ms=5)
+	runner = web.AppRunner(stub.app())
+	await runner.setup()
+	await web.TCPSite(runner, '127.0.0.1', 8913).start()
+	settings.NORSK_TIPPING_URL = 'http://127.0.0.1:8913/nt'
+	upstream_scheduler.buckets['norsk_tipping'] = TokenBucket(rate, 1)
+	api = NorskTippingAPI()
+	event_ids = [event['eventId'] for event in stub.events['eventList']]
+	admitted = []
+
+	async def request(name, request_class, kickoff=None, deadline=30.0):
+		start = time.perf_counter()
+		with upstream_priority(request_class, kickoff=kickoff, deadline=deadline):
+			try:
+				await api.get_market_for_match(event_ids[len(admitted) % len(event_ids)])
+			except DeadlineExceeded:
+				return name, None
+		admitted.append(name)
+		return name, time.perf_counter() - start
+
+	try:
+		start = time.perf_counter()
+		prefetch = [asyncio.create_task(request(f'prefetch{i}', RequestClass.PREFETCH)) for i in range(n_prefetch)]
+		expiring = [asyncio.create_task(request(f'expiring{i}', RequestClass.PREFETCH, deadline=0.2)) for i in range(5)]
+		await asyncio.sleep(0.05)
+		# At most one more request can be in flight when the user requests arrive
+		admitted_before = len(admitted) + 1
+		# Later kickoffs submitted first, so only the kickoff order can put them the other way round
+		user = [asyncio.create_task(request(f'user{i}', RequestClass.USER, kickoff=1000.0 - i)) for i in range(5)]
+		results = dict(await asyncio.gather(*prefetch, *expiring, *user))
+		elapsed = time.perf_counter() - start
+
+		user_positions = [admitted.index(f'user{i}') for i in range(5)]
+		print(f'{len(admitted)} requests in {elapsed:.2f} s ({len(admitted) / elapsed:.1f}/s at a limit of {rate}/s), user requests admitted at positions {user_positions}')
+		assert max(user_positions) < admitted_before + 5, 'user requests should be admitted ahead of every queued prefetch request'
+		assert user_positions == sorted(user_positions, reverse=True), 'sooner kickoffs should be admitted first'
+		assert len(admitted) / elapsed <= rate * 1.1, 'the token bucket should hold the request rate'
+		assert all(results[f'expiring{i}'] is None for i in range(5)) and not any(name.startswith('expiring') for name in admitted), \
+			'requests past their deadline should be dropped unsent'
+		print(f'Dropped {int(upstream_requests_total.series[(("source", "norsk_tipping"), ("status", "deadline_exceeded"))])} requests at their deadline')
+
+		for request_class in ['user', 'prefetch']:
+			waits = np.array([wait for name, wait in results.items() if name.startswith(request_class)]) * 1000
+			print(f'{request_class:>8}: wait p50 {np.percentile(waits, 50):.0f} ms, p95 {np.percentile(waits, 95):.0f} ms')
+		print(upstream_queue_wait_seconds.render().splitlines()[-1])
+	finally:
+		await api.close()
+		await runner.cleanup()
+
+if __name__ == '__main__':
+	asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 20.0, int(sys.argv[2]) if len(sys.argv) > 2 else 30))
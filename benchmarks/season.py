@@ -0,0 +1,91 @@
+"""
+Checks and times the season simulator. Position probabilities of a small league are checked against exact enumeration of every result,
+the ELO goal difference distributions against util.ELO.expect_result, and results against the number of workers. Then a 20-team league
+halfway through a synthetic season is simulated at growing season counts and batch sizes, reporting run time and peak memory.
+
+Run with: python -m benchmarks.season [max_seasons]
+"""
+from app.predictor.season import Season, simulate, simulate_batch, elo_gd_pmf, outright_odds, season_from_results, goal_differences, FixtureProbabilities
+from app.predictor.util import util
+from app.core.repositories import TeamRatingsRepository
+from benchmarks.synthetic import generate_matches
+import numpy as np
+import pandas as pd
+import itertools
+import tracemalloc
+import time
+import sys
+
+def exact_positions(season: Season) -> np.ndarray:
+	"""(teams, positions) probabilities by enumerating every combination of goal differences. Teams level on points and goal difference share their positions equally."""
+	n_teams = len(season.teams)
+	exact = np.zeros((n_teams, n_teams))
+	pmf = season.gd_pmf / season.gd_pmf.sum(axis=1, keepdims=True)
+	for outcome in itertools.product(range(len(goal_differences)), repeat=len(season.home)):
+		probability = np.prod([pmf[j, k] for j, k in enumerate(outcome)])
+		points, goal_difference = season.points.astype(float).copy(), season.goal_difference.astype(float).copy()
+		for j, k in enumerate(outcome):
+			gd = goal_differences[k]
+			points[season.home[j]] += 3 if gd > 0 else gd == 0
+			points[season.away[j]] += 3 if gd < 0 else gd == 0
+			goal_difference[season.home[j]] += gd
+			goal_difference[season.away[j]] -= gd
+		key = points * 1000 + goal_difference
+		for team in range(n_teams):
+			above = (key > key[team]).sum()
+			level = (key == key[team]).sum()
+			exact[team, above:above + level] += probability / level
+	return exact
+
+def check_exact(rng):
+	season = Season(['A', 'B', 'C', 'D'], np.array([6.0, 6.0, 4.0, 1.0]), np.array([3.0, 2.0, 0.0, -5.0]), np.array([0, 2, 1]), np.array([1, 3, 3]), rng.dirichlet(np.ones(13), 3))
+	exact = exact_positions(season)
+	n_seasons = 400_000
+	simulated = simulate(season, n_seasons, batch_size=50_000, n_workers=1).loc[season.teams, [1, 2, 3, 4]].to_numpy()
+	error = np.abs(simulated - exact) / np.sqrt(np.maximum(exact * (1 - exact), 1e-12) / n_seasons)
+	print(f'Small league against exact enumeration: largest error {np.abs(simulated - exact).max():.4f}, {error.max():.1f} standard errors')
+	assert error.max() < 5, 'the simulated position probabilities should match the exact ones'
+
+def check_elo():
+	home_elo, away_elo = np.array([1500.0, 1800.0, 1650.0]), np.array([1700.0, 1500.0, 1650.0])
+	frame = pd.DataFrame({'HomeTeam': ['X'], 'AwayTeam': ['Y'], 'Div': ['E0']})
+	elo = util.ELO(frame, draw_factor=0.3, home_advantage=60)
+	pmf = elo_gd_pmf(home_elo, away_elo, draw_factor=0.3, home_advantage=60)
+	for i in range(len(home_elo)):
+		home, draw, away = elo.expect_result(home_elo[i] + 60, away_elo[i])
+		assert np.allclose([pmf[i, 7:].sum(), pmf[i, 6], pmf[i, :6].sum()], [home, draw, away]), i
+	print('ELO goal difference distributions keep the HUB probabilities of util.ELO.expect_result')
+
+def halfway_season():
+	matches = generate_matches(n_leagues=1, n_seasons=1, n_teams=20, seed=3).sort_values('Date')
+	played = matches.iloc[:len(matches) // 2]
+	ratings = TeamRatingsRepository({team: float(1500 + 40 * i) for i, team in enumerate(sorted(set(matches['HomeTeam'])))}, {})
+	return season_from_results(played, FixtureProbabilities(ratings), teams=sorted(set(matches['HomeTeam'])))
+
+def main(max_seasons):
+	check_exact(np.random.default_rng(1))
+	check_elo()
+	season = halfway_season()
+	one = simulate(season, 40_000, batch_size=10_000, n_workers=1, seed=5)
+	two = simulate(season, 40_000, batch_size=10_000, n_workers=2, seed=5)
+	assert one.equals(two), 'the result should not depend on the number of workers'
+	print('Same result with one and two workers')
+
+	print(f'20 teams, {len(season.home)} remaining fixtures')
+	n_seasons = 10_000
+	while n_seasons <= max_seasons:
+		start = time.perf_counter()
+		positions = simulate(season, n_seasons, batch_size=10_000, n_workers=1)
+		elapsed = time.perf_counter() - start
+		print(f'  {n_seasons:>9} seasons: {elapsed:6.2f} s, {n_seasons / elapsed / 1000:6.0f}k seasons/s on one core')
+		n_seasons *= 10
+	for batch_size in [1_000, 10_000, 100_000]:
+		tracemalloc.start()
+		simulate_batch(season, batch_size, 0)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		print(f'  batch of {batch_size:>7}: peak {peak / 1e6:7.1f} MB')
+	print(positions[['expected_points', 'mean_position']].join(outright_odds(positions)).round(3).head(6).to_string())
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
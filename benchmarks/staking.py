@@ -0,0 +1,68 @@
+"""
+Times the fractional-Kelly stake optimizer on synthetic fixtures with several markets per match, and checks its expected log growth
+against a Monte Carlo estimate from scores sampled on the same grids.
+Run with: python -m benchmarks.staking [n_matches] [n_markets_per_match]
+"""
+from app.core.repositories import FixturesRepository
+from app.core.markets import score_outcomes, find_settlement
+from app.core.schemas import StakeRequestModel, StakeCandidateModel
+from app.services.staking import StakingService
+from benchmarks.stub_server import SyntheticUpstream
+import numpy as np
+import pandas as pd
+import time
+import sys
+import io
+
+markets = [
+	('HUB', ['home', 'draw', 'away']),
+	('Totalt antall mål - Over/Under 2.5', ['true', 'false']),
+	('Begge lag scorer', ['true', 'false']),
+	('Asiatisk handikap -0.25', ['true', 'false']),
+	('Asiatisk over/under 2.75', ['true', 'false']),
+	('Handikap 3-veis 0:1', ['home', 'draw', 'away']),
+]
+
+def main():
+	n_matches, n_markets = (int(arg) for arg in (sys.argv[1:] or [60, 5]))
+	rng = np.random.default_rng(42)
+	stub = SyntheticUpstream(n_matches)
+	fixtures = pd.read_csv(io.StringIO(stub.fixtures_csv), index_col=['Home', 'Away'])
+	fixtures = fixtures[~fixtures.index.duplicated()]
+	repo = FixturesRepository.from_dataframe(fixtures, {})
+
+	# Every selection priced off the grid with a noisy margin, so some of them have positive expected value
+	candidates = []
+	for home, away in fixtures.index:
+		for market, selections in markets[:n_markets]:
+			probs = repo.get_market_probabilities(home, away, market).model_dump()
+			for selection in selections:
+				odds = round(float(1 / max(probs[selection], 0.01) * rng.normal(0.97, 0.06)), 2)
+				candidates.append(StakeCandidateModel(home_team=home, away_team=away, market=market, selection=selection, odds=odds))
+	request = StakeRequestModel(bankroll=1000, kelly_fraction=0.25, candidates=candidates)
+
+	service = StakingService(repo)
+	service.optimize(request)
+	start = time.perf_counter()
+	response = service.optimize(request)
+	seconds = time.perf_counter() - start
+
+	# Expected log growth of the chosen stakes, from matches sampled independently and every bet on a match settled on the same score
+	fractions = np.array([stake.fraction for stake in response.stakes])
+	n_samples = 20000
+	growth_returns = np.zeros(n_samples)
+	for (home, away), group in pd.DataFrame([c.model_dump() for c in candidates]).groupby(['home_team', 'away_team'], sort=False):
+		goals_home, goals_away, probability = score_outcomes(repo.get_score_grid(home, away))
+		outcome = rng.choice(len(probability), n_samples, p=probability)
+		for i, candidate in group.iterrows():
+			won, returned = find_settlement(candidate['market'])(goals_home[outcome], goals_away[outcome])
+			selection = {'home': 0, 'draw': 1, 'away': 2, 'true': 0, 'false': 1}[candidate['selection']]
+			growth_returns += fractions[i] * (won[selection] * candidate['odds'] + returned[selection] - 1)
+	simulated_growth = np.log1p(growth_returns).mean()
+
+	print(f'{len(candidates)} candidates on {len(fixtures)} matches solved in {seconds * 1000:.1f} ms')
+	print(f'{sum(stake.stake > 0 for stake in response.stakes)} stakes, {response.total_stake:.2f} of {response.bankroll:.0f} staked')
+	print(f'Expected log growth: {response.expected_growth:.6f} (quadratic), {simulated_growth:.6f} (simulated)')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,199 @@
+"""
+Local stand-in for the Norsk Tipping and ClubELO APIs, for load tests that must not hit the real upstreams.
+Serves recorded payloads from --recorded, or synthetic ones covering the tournaments the API cares about, with configurable latency and error injection.
+
+Run with: python -m benchmarks.stub_server --port 8900 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+Then point the API at it:
+	NORSK_TIPPING_URL=http://localhost:8900/nt CLUBELO_URL=http://localhost:8900/clubelo PINNACLE_URL=http://localhost:8900/pinnacle python run.py
+
+Recorded payloads (all optional, synthetic ones fill the gaps):
+	events.json, markets/<eventId>.json, ratings.csv, fixtures.csv
+"""
+from app.utils.utils import tournaments_of_interest, NT_to_ClubELO_names_mapping
+from datetime import datetime, timedelta, timezone
+from aiohttp import web
+import numpy as np
+import pandas as pd
+import argparse
+import asyncio
+import json
+import os
+
+MAX_GOALS = 10
+
+def score_grid(home_rate, away_rate):
+	goals = np.arange(MAX_GOALS + 1)
+	factorial = np.cumprod(np.concatenate([[1], goals[1:]]))
+	home = np.exp(-home_rate) * home_rate ** goals / factorial
+	away = np.exp(-away_rate) * away_rate ** goals / factorial
+	grid = np.outer(home, away)
+	return grid / grid.sum()
+
+def fixture_row(home, away, grid, kickoff):
+	"""One row in the ClubELO Fixtures format: goal difference buckets and exact scores up to six goals in total."""
+	row = {'Date': kickoff.date().isoformat(), 'Country': 'ENG', 'Home': home, 'Away': away}
+	goal_difference = np.subtract.outer(np.arange(MAX_GOALS + 1), np.arange(MAX_GOALS + 1))
+	row['GD<-5'] = grid[goal_difference < -5].sum()
+	for gd in range(-5, 6):
+		row[f'GD={gd}'] = grid[goal_difference == gd].sum()
+	row['GD>5'] = grid[goal_difference > 5].sum()
+	for total in range(7):
+		for home_goals in range(total + 1):
+			row[f'R:{home_goals}-{total - home_goals}'] = grid[home_goals, total - home_goals]
+	return row
+
+def odds(probabilities, margin=1.06):
+	return [round(float(1 / (p * margin)), 2) for p in probabilities]
+
+class SyntheticUpstream:
+	"""Seeded synthetic events, markets, ratings and fixtures that refer to the same teams."""
+	def __init__(self, n_events=60, seed=42):
+		rng = np.random.default_rng(seed)
+		# One Norsk Tipping name per ClubELO club
+		teams = list({club: team for team, club in NT_to_ClubELO_names_mapping.items()}.values())
+		ratings = {team: float(rng.normal(1750, 120)) for team in teams}
+		now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+		self.events, self.markets, fixtures = [], {}, []
+		self.pinnacle_fixtures, self.pinnacle_odds = [], []
+		for i in range(n_events):
+			home, away = rng.choice(teams, 2, replace=False)
+			kickoff = now + timedelta(hours=int(rng.integers(2, 24 * 7)))
+			strength = (ratings[home] - ratings[away] + 65) / 400
+			grid = score_grid(np.exp(0.3 + strength / 2), np.exp(0.1 - strength / 2))
+			fixture = fixture_row(NT_to_ClubELO_names_mapping[home], NT_to_ClubELO_names_mapping[away], grid, kickoff)
+			fixtures.append(fixture)
+			hub = [np.tril(grid, -1).sum(), np.trace(grid), np.triu(grid, 1).sum()]
+			event_id = str(1000000 + i)
+			selections = [{'selectionName': name, 'selectionOdds': o} for name, o in zip(['H', 'U', 'B'], odds(hub))]
+			self.events.append({
+				'eventId': event_id,
+				'homeParticipant': home,
+				'awayParticipant': away,
+				'startTime': kickoff.isoformat(),
+				'tournament': {'name': tournaments_of_interest[int(rng.integers(len(tournaments_of_interest)))]},
+				'mainMarket': {'marketName': 'HUB', 'selections': selections},
+			})
+			totals = np.add.outer(np.arange(MAX_GOALS + 1), np.arange(MAX_GOALS + 1))
+			markets = [{'marketName': 'HUB', 'selections': selections}]
+			for line in [0.5, 1.5, 2.5, 3.5, 4.5, 5.5]:
+				over = grid[totals > line].sum()
+				markets.append({
+					'marketName': f'Totalt antall mål - Over/Under {line}',
+					'selections': [{'selectionName': name, 'selectionOdds': o} for name, o in zip(['Over', 'Under'], odds([over, 1 - over]))],
+				})
+			both = grid[1:, 1:].sum()
+			markets.append({
+				'marketName': 'Begge lag scorer',
+				'selections': [{'selectionName': name, 'selectionOdds': o} for name, o in zip(['Ja', 'Nei'], odds([both, 1 - both]))],
+			})
+			self.markets[event_id] = {'markets': markets}
+
+			# Pinnacle quotes the same match under the ClubELO names, with a lower and noisier margin
+			margin = lambda: float(rng.uniform(1.0, 1.04))
+			moneyline = dict(zip(['home', 'draw', 'away'], odds(hub, margin())))
+			over = grid[totals > 2.5].sum()
+			totals_odds = odds([over, 1 - over], margin())
+			home_no_draw = hub[0] / (hub[0] + hub[2])
+			spread_odds = odds([home_no_draw, 1 - home_no_draw], margin())
+			self.pinnacle_fixtures.append({
+				'id': 2000000 + i,
+				'home': NT_to_ClubELO_names_mapping[home],
+				'away': NT_to_ClubELO_names_mapping[away],
+				'starts': kickoff.strftime('%Y-%m-%dT%H:%M:%SZ'),
+			})
+			self.pinnacle_odds.append({'id': 2000000 + i, 'periods': [{
+				'number': 0,
+				'moneyline': moneyline,
+				'totals': [{'points': 2.5, 'over': totals_odds[0], 'under': totals_odds[1]}],
+				'spreads': [{'hdp': 0.0, 'home': spread_odds[0], 'away': spread_odds[1]}],
+			}]})
+		self.fixtures_csv = pd.DataFrame(fixtures).to_csv(index=False)
+		self.ratings_csv = pd.DataFrame({
+			'Rank': range(1, len(teams) + 1),
+			'Club': [NT_to_ClubELO_names_mapping[team] for team in teams],
+			'Country': 'ENG',
+			'Level': 1,
+			'Elo': [ratings[team] for team in teams],
+			'From': now.date().isoformat(),
+			'To': now.date().isoformat(),
+		}).drop_duplicates('Club').to_csv(index=False)
+
+class StubUpstream:
+	def __init__(self, recorded=None, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, n_events=60, seed=42):
+		self.latency_ms = latency_ms
+		self.jitter_ms = jitter_ms
+		self.error_rate = error_rate
+		self.rng = np.random.default_rng(seed)
+		self.recorded = recorded
+		self.synthetic = SyntheticUpstream(n_events, seed)
+		self.events = self._recorded_json('events.json') or {'eventList': self.synthetic.events}
+		self.ratings_csv = self._recorded_text('ratings.csv') or self.synthetic.ratings_csv
+		self.fixtures_csv = self._recorded_text('fixtures.csv') or self.synthetic.fixtures_csv
+
+	def _recorded_text(self, name):
+		if self.recorded and os.path.exists(os.path.join(self.recorded, name)):
+			with open(os.path.join(self.recorded, name), encoding='utf-8') as f:
+				return f.read()
+		return None
+
+	def _recorded_json(self, name):
+		text = self._recorded_text(name)
+		return json.loads(text) if text else None
+
+	@web.middleware
+	async def inject(self, request, handler):
+		delay = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+		if delay > 0:
+			await asyncio.sleep(delay / 1000)
+		if self.rng.random() < self.error_rate:
+			raise web.HTTPServiceUnavailable(text='Injected error')
+		return await handler(request)
+
+	async def events_handler(self, request):
+		return web.json_response(self.events)
+
+	async def markets_handler(self, request):
+		event_id = request.match_info['event_id']
+		markets = self._recorded_json(f'markets/{event_id}.json') or self.synthetic.markets.get(event_id)
+		if markets is None:
+			raise web.HTTPNotFound()
+		return web.json_response(markets)
+
+	async def pinnacle_fixtures_handler(self, request):
+		return web.json_response({'sportId': 29, 'league': [{'id': 1, 'events': self.synthetic.pinnacle_fixtures}]})
+
+	async def pinnacle_odds_handler(self, request):
+		return web.json_response({'sportId': 29, 'leagues': [{'id': 1, 'events': self.synthetic.pinnacle_odds}]})
+
+	async def fixtures_handler(self, request):
+		return web.Response(text=self.fixtures_csv, content_type='text/csv')
+
+	async def ratings_handler(self, request):
+		return web.Response(text=self.ratings_csv, content_type='text/csv')
+
+	def app(self) -> web.Application:
+		app = web.Application(middlewares=[self.inject])
+		app.router.add_get('/nt/events/FBL', self.events_handler)
+		app.router.add_get('/nt/markets/{event_id}', self.markets_handler)
+		app.router.add_get('/pinnacle/v1/fixtures', self.pinnacle_fixtures_handler)
+		app.router.add_get('/pinnacle/v1/odds', self.pinnacle_odds_handler)
+		app.router.add_get('/clubelo/Fixtures', self.fixtures_handler)
+		app.router.add_get('/clubelo/{date}', self.ratings_handler)
+		return app
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8900)
+	parser.add_argument('--recorded', default=None, help='Directory with recorded payloads')
+	parser.add_argument('--events', type=int, default=60, help='Number of synthetic events')
+	parser.add_argument('--latency-ms', type=float, default=0.0)
+	parser.add_argument('--jitter-ms', type=float, default=0.0)
+	parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+	parser.add_argument('--seed', type=int, default=42)
+	args = parser.parse_args()
+	stub = StubUpstream(args.recorded, args.latency_ms, args.jitter_ms, args.error_rate, args.events, args.seed)
+	web.run_app(stub.app(), host=args.host, port=args.port)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,97 @@
+"""
+Simulates a restart against a local stub server and checks the warm cache. After a save, a restarted process restores the parsed snapshots
+and the odds payloads and serves /matches without calling upstream, with the same result as before. Snapshots whose file changed since the
+save, and payloads older than WARM_ODDS_MAX_AGE, are not restored. Also prints the snapshot load time cold (CSV) and warm (cache).
+
+Run with: python -m benchmarks.warm_start [n_events]
+"""
+from app.config.config import settings
+from app.core import repositories
+from app.core.metrics import upstream_requests_total
+from app.core.warm_cache import WarmCache, odds_payloads
+from app.background.data_updater import DataUpdater, key_columns_first
+from app.services.matches import MatchesService
+from benchmarks.stub_server import StubUpstream
+from aiohttp import web
+import tempfile
+import asyncio
+import time
+import sys
+import os
+
+def upstream_calls() -> float:
+	return sum(value for labels, value in upstream_requests_total.series.items() if ('source', 'norsk_tipping') in labels)
+
+def restart():
+	"""Drops everything a new process would not have"""
+	repositories.ratings_snapshots.clear()
+	repositories.fixtures_snapshots.clear()
+	odds_payloads.entries.clear()
+
+async def serve_matches():
+	service = MatchesService()
+	try:
+		return [match.model_dump() for match in (await service.get_coming_matches()).eventList]
+	finally:
+		await service.close()
+
+async def main(n_events):
+	stub = StubUpstream(n_events=n_events, latency_ms=20)
+	runner = web.AppRunner(stub.app())
+	await runner.setup()
+	await web.TCPSite(runner, '127.0.0.1', 8916).start()
+	settings.NORSK_TIPPING_URL = 'http://127.0.0.1:8916/nt'
+	previous_directory = os.getcwd()
+	with tempfile.TemporaryDirectory() as directory:
+		os.chdir(directory)
+		try:
+			os.makedirs('app/files')
+			with open('app/files/elo_ratings.csv', 'w') as f:
+				f.write(key_columns_first(stub.ratings_csv, ['Club']))
+			with open('app/files/fixtures.csv', 'w') as f:
+				f.write(key_columns_first(stub.fixtures_csv, ['Home', 'Away']))
+			warm_cache = WarmCache('cache')
+
+			calls = upstream_calls()
+			start = time.perf_counter()
+			cold = await serve_matches()
+			print(f'Cold:    {len(cold)} matches in {(time.perf_counter() - start) * 1000:.0f} ms, {upstream_calls() - calls:.0f} upstream calls')
+			warm_cache.save()
+
+			restart()
+			start = time.perf_counter()
+			counts = warm_cache.restore()
+			restore_ms = (time.perf_counter() - start) * 1000
+			calls = upstream_calls()
+			start = time.perf_counter()
+			warm = await serve_matches()
+			print(f'Warm:    {len(warm)} matches in {(time.perf_counter() - start) * 1000:.0f} ms, {upstream_calls() - calls:.0f} upstream calls, restored {counts} in {restore_ms:.1f} ms')
+			assert counts == {'ratings': 1, 'fixtures': 1, 'payloads': 1} and upstream_calls() == calls, 'a warm restart should not call upstream'
+			assert warm == cold, 'the restored state should give the same matches'
+
+			# A snapshot rewritten since the save is parsed again, and old payloads are fetched again
+			restart()
+			os.utime('app/files/fixtures.csv')
+			settings.WARM_ODDS_MAX_AGE, max_age = 0.0, settings.WARM_ODDS_MAX_AGE
+			try:
+				counts = warm_cache.restore()
+			finally:
+				settings.WARM_ODDS_MAX_AGE = max_age
+			print(f'Changed fixtures file and expired payloads: restored {counts}')
+			assert counts == {'ratings': 1, 'fixtures': 0, 'payloads': 0}
+
+			updater = DataUpdater()
+			print(f'Fresh snapshot files: next download in {updater.seconds_until_stale():.0f} s instead of at boot')
+			assert updater.seconds_until_stale() > 0
+
+			for name, load in [('CSV', lambda: repositories.FixturesRepository.from_csv('app/files/fixtures.csv', {})), ('warm cache', lambda: warm_cache.restore())]:
+				restart()
+				start = time.perf_counter()
+				load()
+				print(f'Fixtures from {name}: {(time.perf_counter() - start) * 1000:.1f} ms')
+		finally:
+			os.chdir(previous_directory)
+			await runner.cleanup()
+
+if __name__ == '__main__':
+	asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
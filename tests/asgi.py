@@ -0,0 +1,29 @@
+from app.api.routes import router
+from fastapi import FastAPI
+from typing import Optional, Tuple
+import asyncio
+import json
+
+def request(method: str, path: str, body: Optional[dict] = None, query_string: str = '') -> Tuple[int, object]:
+	"""Sends one HTTP request to the routes through ASGI messages and returns the status and the decoded JSON body"""
+	async def run():
+		app = FastAPI()
+		app.include_router(router)
+		content = b'' if body is None else json.dumps(body).encode()
+		scope = {
+			'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+			'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(), 'root_path': '',
+			'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(content)).encode())],
+			'server': ('testserver', 80), 'client': ('testclient', 50000),
+		}
+		messages = [{'type': 'http.request', 'body': content, 'more_body': False}]
+		sent = []
+		async def receive():
+			return messages.pop(0) if messages else {'type': 'http.disconnect'}
+		async def send(message):
+			sent.append(message)
+		await app(scope, receive, send)
+		status = next(message['status'] for message in sent if message['type'] == 'http.response.start')
+		payload = b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+		return status, json.loads(payload) if payload else None
+	return asyncio.run(run())
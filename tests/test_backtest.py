@@ -0,0 +1,84 @@
+from app.core.markets import gd_columns
+from app.predictor.backtest import backtest, parameter_grid, run_grid, clubelo_fixtures_probs
+from app.utils.utils import football_data_to_ClubELO_names_mapping
+from tests.test_markets import poisson_columns
+import numpy as np
+import pandas as pd
+import pytest
+
+# Best expected values: home 1.1 (won), draw 1.05 (lost), away 1.2 (won), then a match below the threshold, one without
+# probabilities and one without odds
+probs = np.array([
+	[0.5, 0.3, 0.2],
+	[0.4, 0.3, 0.3],
+	[0.3, 0.3, 0.4],
+	[0.5, 0.25, 0.25],
+	[np.nan, np.nan, np.nan],
+	[0.6, 0.2, 0.2],
+])
+odds = np.array([
+	[2.2, 3.0, 5.0],
+	[2.0, 3.5, 3.0],
+	[3.0, 3.0, 3.0],
+	[1.8, 3.6, 4.0],
+	[2.0, 3.0, 4.0],
+	[0.0, 0.0, 0.0],
+])
+outcome = np.array([0, 2, 2, 0, 1, 0])
+season = np.array([0, 0, 1, 1, 1, 1])
+
+def test_flat_staking():
+	result = backtest(probs, odds, outcome, season, threshold=1.02, staking='flat', stake=0.01)
+	assert result['bets'] == 3
+	assert result['hit_rate'] == pytest.approx(2 / 3)
+	assert result['mean_odds'] == pytest.approx((2.2 + 3.5 + 3.0) / 3)
+	assert result['staked'] == pytest.approx(0.03)
+	# +0.012, -0.01, +0.02
+	assert result['profit'] == pytest.approx(0.022)
+	assert result['roi'] == pytest.approx(0.022 / 0.03)
+	assert result['final_bankroll'] == pytest.approx(1.022)
+	assert result['max_drawdown'] == pytest.approx(0.01 / 1.012)
+	# Season 0: 0.002 profit on 0.02 staked, season 1: 0.02 on 0.01
+	assert result['worst_season_roi'] == pytest.approx(0.1)
+
+def test_kelly_staking():
+	# Quarter Kelly stakes: 0.25 * 0.1 / 1.2, 0.25 * 0.05 / 2.5 and 0.25 * 0.2 / 2
+	result = backtest(probs, odds, outcome, season, threshold=1.02, staking='kelly', kelly_fraction=0.25, max_stake=0.05)
+	assert result['bets'] == 3
+	assert result['staked'] == pytest.approx(0.025 / 1.2 + 0.005 + 0.025)
+	assert result['profit'] == pytest.approx(0.025 - 0.005 + 0.05)
+	assert result['roi'] == pytest.approx(0.07 / (0.025 / 1.2 + 0.03))
+	capped = backtest(probs, odds, outcome, season, threshold=1.02, staking='kelly', kelly_fraction=0.25, max_stake=0.02)
+	assert capped['staked'] == pytest.approx(0.045)
+	assert capped['profit'] == pytest.approx(0.024 - 0.005 + 0.04)
+
+def test_max_odds_and_threshold():
+	# The draw at 3.5 is out, and nothing else on that match clears the threshold
+	assert backtest(probs, odds, outcome, season, threshold=1.02, max_odds=3.2)['bets'] == 2
+	result = backtest(probs, odds, outcome, season, threshold=1.5)
+	assert result['bets'] == 0
+	assert np.isnan(result['roi'])
+	assert result['final_bankroll'] == 1.0
+
+def test_run_grid_matches_backtest():
+	grid = parameter_grid([1.02, 1.08], ['flat', 'kelly'], [0.25, 0.5], [np.inf])
+	assert len(grid) == 6
+	results = run_grid(probs, odds, outcome, season, grid, n_workers=2)
+	for row, parameters in zip(results.to_dict('records'), grid):
+		expected = backtest(probs, odds, outcome, season, **parameters)
+		assert {key: row[key] for key in expected} == pytest.approx(expected, nan_ok=True)
+
+def test_clubelo_fixtures_are_joined_on_date_and_clubelo_names():
+	columns = poisson_columns([(1.5, 1.0), (1.0, 1.4)])
+	fixtures = pd.DataFrame({'Date': ['2024-08-17', '2024-08-18'], 'Home': ['Forest', 'Arsenal'], 'Away': ['Bayern', 'Forest'], **{column: columns[column] for column in gd_columns}})
+	data = pd.DataFrame({
+		'Date': ['2024-08-17', '2024-08-18', '2024-08-19'],
+		'HomeTeam': ["Nott'm Forest", 'Arsenal', 'Arsenal'],
+		'AwayTeam': ['Bayern Munich', "Nott'm Forest", 'Chelsea'],
+	})
+	result = clubelo_fixtures_probs(data, fixtures, football_data_to_ClubELO_names_mapping)
+	gd = np.column_stack([columns[column] for column in gd_columns])
+	expected = np.column_stack([gd[:, 7:].sum(axis=1), gd[:, 6], gd[:, :6].sum(axis=1)])
+	assert result[:2] == pytest.approx(expected, abs=1e-6)
+	assert np.isnan(result[2]).all()
+	assert np.isnan(clubelo_fixtures_probs(data, fixtures)[:2]).all()
@@ -0,0 +1,100 @@
+from app.config.config import settings
+from app.core.bookmakers import OddsAggregator, NorskTippingAdapter, PinnacleAdapter, PinnacleAPI
+from app.core.schemas import HUBModel
+from app.core.scheduler import upstream_scheduler
+from benchmarks.stub_server import StubUpstream
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from aiohttp import web
+import asyncio
+import pytest
+import time
+
+@asynccontextmanager
+async def serve(stub: StubUpstream):
+	"""Serves the stub on an ephemeral port and yields its base URL"""
+	runner = web.AppRunner(stub.app())
+	await runner.setup()
+	site = web.TCPSite(runner, '127.0.0.1', 0)
+	await site.start()
+	try:
+		host, port = runner.addresses[0][:2]
+		yield f'http://{host}:{port}'
+	finally:
+		await runner.cleanup()
+
+class SlowAdapter(PinnacleAdapter):
+	source = 'slow_pinnacle'
+
+def refreshed(monkeypatch, n_events=40, slow_timeout=None):
+	"""Refreshes an aggregator over stub Norsk Tipping and Pinnacle servers, plus a slow Pinnacle when slow_timeout is set"""
+	async def run():
+		async with serve(StubUpstream(n_events=n_events, latency_ms=20)) as fast, serve(StubUpstream(n_events=n_events, latency_ms=2000)) as slow:
+			monkeypatch.setattr(settings, 'NORSK_TIPPING_URL', f'{fast}/nt')
+			monkeypatch.setattr(settings, 'PINNACLE_URL', f'{fast}/pinnacle')
+			# The stubs are local, so the per-host rate limits would only slow the tests down
+			monkeypatch.setattr(upstream_scheduler, 'rate_limits', {})
+			monkeypatch.setattr(upstream_scheduler, 'default_limit', (1000.0, 1000))
+			monkeypatch.setattr(upstream_scheduler, 'buckets', {})
+			adapters = [NorskTippingAdapter(timeout=2), PinnacleAdapter(timeout=2)]
+			if slow_timeout is not None:
+				adapters.append(SlowAdapter(PinnacleAPI(f'{slow}/pinnacle'), timeout=slow_timeout))
+			aggregator = OddsAggregator(adapters)
+			try:
+				start = time.perf_counter()
+				counts = await aggregator.refresh()
+				elapsed = time.perf_counter() - start
+				books = {}
+				for adapter in adapters[:2]:
+					for event in await adapter.fetch_events():
+						books.setdefault(aggregator.event_key(event), []).append(event)
+				return aggregator, counts, elapsed, books
+			finally:
+				await aggregator.close()
+	return asyncio.run(run())
+
+def test_slow_source_times_out_without_holding_back_the_others(monkeypatch):
+	aggregator, counts, elapsed, _ = refreshed(monkeypatch, slow_timeout=0.5)
+	assert counts['slow_pinnacle'] is None
+	assert counts['norsk_tipping'] == counts['pinnacle'] == 40
+	assert elapsed < 1.5
+	assert not any('slow_pinnacle' in quotes for quotes in aggregator.index.prices.values())
+
+def test_events_match_across_books(monkeypatch):
+	aggregator, counts, _, _ = refreshed(monkeypatch)
+	matched = [event for event in aggregator.events.values() if len(event.event_ids) == 2]
+	assert len(matched) == counts['norsk_tipping']
+
+def test_best_prices_are_the_maximum_over_the_books(monkeypatch):
+	aggregator, _, _, books = refreshed(monkeypatch)
+	checked = 0
+	for key, events in books.items():
+		for market in {market for event in events for market in event.markets}:
+			for selection in {selection for event in events for selection in event.markets.get(market, {})}:
+				quotes = {event.source: event.markets.get(market, {}).get(selection, 0) for event in events}
+				odds, source = aggregator.index.best_price(key, market, selection)
+				assert odds == max(quotes.values())
+				assert quotes[source] == odds
+				checked += 1
+	assert checked > 0
+
+def test_served_best_prices(monkeypatch):
+	aggregator, _, _, books = refreshed(monkeypatch)
+	probs = HUBModel(home=0.5, draw=0.3, away=0.2)
+	for key, events in books.items():
+		nt = next(event for event in events if event.source == 'norsk_tipping')
+		best = aggregator.best_prices(nt.home_team, nt.away_team, nt.start_time, probs)
+		assert best is not None
+		for selection in ('home', 'draw', 'away'):
+			odds = getattr(best.odds, selection)
+			assert odds == max(event.markets['HUB'][selection] for event in events)
+			assert getattr(best.expected_value, selection) == odds * getattr(probs, selection)
+		assert best.overround == pytest.approx(sum(1 / getattr(best.odds, selection) for selection in ('home', 'draw', 'away')))
+	assert aggregator.best_prices('Nobody', 'Nobody Else', nt.start_time, probs) is None
+
+def test_kickoffs_match_on_their_utc_date():
+	aggregator = OddsAggregator([])
+	oslo = datetime(2025, 3, 1, 0, 30, tzinfo=timezone(timedelta(hours=1)))
+	utc = datetime(2025, 2, 28, 23, 30, tzinfo=timezone.utc)
+	assert aggregator.match_key('Arsenal', 'Chelsea', oslo) == aggregator.match_key('Arsenal', 'Chelsea', utc)
+	assert aggregator.match_key('Arsenal', 'Chelsea', oslo)[2] == date(2025, 2, 28)
@@ -0,0 +1,60 @@
+from app.core.calibration import CalibrationMap, HUBCalibration, load_calibration
+from app.core.markets import ScoreGrids
+from app.core.repositories import FixturesRepository, fixtures_version
+from tests.test_markets import poisson_columns
+import numpy as np
+import pandas as pd
+import pytest
+import os
+
+rates = [(1.5, 1.1), (2.2, 0.7), (0.9, 1.6), (1.2, 1.2)]
+
+@pytest.fixture
+def calibration():
+	return HUBCalibration({
+		'home': CalibrationMap('isotonic', x=[0.0, 0.3, 0.6, 1.0], y=[0.05, 0.28, 0.62, 0.95]),
+		'draw': CalibrationMap('platt', a=0.8, b=-0.1),
+		'away': CalibrationMap('isotonic', x=[0.0, 0.5, 1.0], y=[0.0, 0.45, 1.0]),
+	})
+
+def hub(grids: ScoreGrids) -> np.ndarray:
+	return np.array([[probs.home, probs.draw, probs.away] for probs in (grids.get(f'H{i}', f'A{i}').hub() for i in range(len(rates)))])
+
+def grids(columns) -> ScoreGrids:
+	return ScoreGrids.from_columns([f'H{i}' for i in range(len(rates))], [f'A{i}' for i in range(len(rates))], columns)
+
+def test_calibrated_columns_give_the_calibrated_hub(calibration):
+	columns = poisson_columns(rates)
+	raw = hub(grids(columns))
+	calibrated = calibration.calibrate_columns(columns)
+	assert hub(grids(calibrated)) == pytest.approx(calibration.apply(raw), abs=1e-5)
+	# Exact scores are rescaled with their part of the GD columns, so the shape within home wins, draws and away wins is unchanged
+	for same_part, gd_column in [(['R:1-0', 'R:3-1'], 'GD>5'), (['R:0-0', 'R:2-2'], 'GD=0'), (['R:0-1', 'R:1-4'], 'GD<-5')]:
+		scale = calibrated[gd_column] / columns[gd_column]
+		for column in same_part:
+			assert calibrated[column] == pytest.approx(columns[column] * scale)
+
+def test_rows_sum_to_one_and_rows_without_probabilities_pass_through(calibration):
+	probs = np.array([[0.5, 0.3, 0.2], [0.1, 0.2, 0.7], [0.0, 0.0, 0.0], [np.nan, np.nan, np.nan]])
+	calibrated = calibration.apply(probs)
+	assert calibrated[:2].sum(axis=1) == pytest.approx([1, 1])
+	assert (calibrated[2] == 0).all()
+	assert np.isnan(calibrated[3]).all()
+	empty = {column: np.zeros(1) for column in poisson_columns(rates[:1])}
+	assert all((values == 0).all() for values in calibration.calibrate_columns(empty).values())
+
+def test_saved_calibration_round_trips_and_replaces_the_fixtures_snapshot(calibration, tmp_path):
+	fixtures_path, calibration_path = str(tmp_path / 'fixtures.csv'), str(tmp_path / 'calibration.json')
+	columns = poisson_columns(rates)
+	pd.DataFrame({'Home': [f'H{i}' for i in range(len(rates))], 'Away': [f'A{i}' for i in range(len(rates))], **columns}).to_csv(fixtures_path, index=False)
+	raw = FixturesRepository.from_csv(fixtures_path, {}, calibration_path)
+	assert fixtures_version(fixtures_path, calibration_path)[1] == 0
+
+	calibration.save(calibration_path)
+	assert load_calibration(calibration_path) == calibration
+	os.utime(calibration_path, ns=(1, 1))
+	assert fixtures_version(fixtures_path, calibration_path)[1] == 1
+	calibrated = FixturesRepository.from_csv(fixtures_path, {}, calibration_path)
+	assert calibrated.score_grids is not raw.score_grids
+	assert hub(calibrated.score_grids) == pytest.approx(calibration.apply(hub(raw.score_grids)), abs=1e-5)
+	assert load_calibration(str(tmp_path / 'missing.json')) is None
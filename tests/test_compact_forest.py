@@ -0,0 +1,68 @@
+from app.predictor.forest import CompactForest
+from sklearn.ensemble import RandomForestRegressor
+import numpy as np
+import pytest
+import os
+
+def fitted_forest(missing_in_training=False, n_rows=1500, seed=42):
+	rng = np.random.default_rng(seed)
+	# Rounded like the form features, so many inputs sit exactly on split thresholds
+	X = rng.normal(0, 5, (n_rows, 6)).round(1)
+	y = np.round(0.3 * X[:, 0] - 0.2 * X[:, 1] + rng.normal(0, 1.7, n_rows))
+	if missing_in_training:
+		X[rng.random(X.shape) < 0.1] = np.nan
+	return RandomForestRegressor(n_estimators=30, max_depth=12, random_state=seed).fit(X, y), X
+
+def with_missing(X, seed=1):
+	X = X.copy()
+	X[np.random.default_rng(seed).random(X.shape) < 0.2] = np.nan
+	return X
+
+@pytest.mark.parametrize('quantize, tolerance', [(False, 1e-12), (True, 1e-5)])
+def test_predict_matches_sklearn(quantize, tolerance):
+	rf, X = fitted_forest()
+	forest = CompactForest.from_sklearn(rf, quantize=quantize)
+	# Split decisions must match exactly, so only float32 leaf values may introduce error
+	assert np.abs(forest.predict(X) - rf.predict(X)).max() <= tolerance
+
+def test_quantized_thresholds_round_down_to_float32():
+	rf, _ = fitted_forest()
+	exact = CompactForest.from_sklearn(rf)
+	forest = CompactForest.from_sklearn(rf, quantize=True)
+	assert forest.threshold.dtype == np.float32 and forest.value.dtype == np.float32
+	assert (forest.threshold.astype(np.float64) <= exact.threshold).all()
+	# No float32 lies strictly between the rounded threshold and the original, so every float32 input splits the same way
+	assert (np.nextafter(forest.threshold, np.float32(np.inf)).astype(np.float64) > exact.threshold).all()
+
+@pytest.mark.parametrize('missing_in_training', [False, True])
+@pytest.mark.parametrize('quantize', [False, True])
+def test_missing_values_follow_sklearn(missing_in_training, quantize):
+	rf, X = fitted_forest(missing_in_training)
+	X = with_missing(X)
+	forest = CompactForest.from_sklearn(rf, quantize=quantize)
+	assert np.abs(forest.predict(X) - rf.predict(X)).max() <= (1e-5 if quantize else 1e-12)
+
+def test_save_load_round_trip(tmp_path):
+	rf, X = fitted_forest()
+	rf.residual_std_ = 1.7
+	forest = CompactForest.from_sklearn(rf, quantize=True)
+	forest.save(tmp_path / 'forest')
+	loaded = CompactForest.load(tmp_path / 'forest')
+	for name in CompactForest.array_names:
+		assert np.array_equal(getattr(loaded, name), getattr(forest, name))
+		assert getattr(loaded, name).dtype == getattr(forest, name).dtype
+	assert loaded.max_depth == forest.max_depth
+	assert list(loaded.feature_names_in_) == list(forest.feature_names_in_)
+	assert loaded.residual_std_ == 1.7
+	assert loaded.nbytes == forest.nbytes
+	assert np.array_equal(loaded.predict(with_missing(X)), forest.predict(with_missing(X)))
+
+def test_exports_without_missing_directions_reject_nan(tmp_path):
+	rf, X = fitted_forest()
+	CompactForest.from_sklearn(rf).save(tmp_path / 'forest')
+	os.remove(tmp_path / 'forest' / 'missing_left.npy')
+	loaded = CompactForest.load(tmp_path / 'forest')
+	assert loaded.missing_left is None
+	assert np.abs(loaded.predict(X) - rf.predict(X)).max() <= 1e-12
+	with pytest.raises(ValueError):
+		loaded.predict(with_missing(X))
@@ -0,0 +1,58 @@
+from app.core.elo_history import RatingHistory
+from app.predictor.backtest import clubelo_history_probs
+from app.utils.utils import football_data_to_ClubELO_names_mapping
+import numpy as np
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def history():
+	return RatingHistory.from_periods(
+		['Arsenal', 'Forest', 'Arsenal', 'Arsenal', 'Forest', 'Arsenal'],
+		['2024-08-01', '2024-08-01', '2024-08-10', '2024-08-20', '2024-09-01', '2024-08-10'],
+		[1900, 1600, 1910, 1920, 1620, 1915],
+	)
+
+def test_same_day_periods_keep_the_last(history):
+	days, ratings = history.history('Arsenal')
+	assert list(days.astype(str)) == ['2024-08-01', '2024-08-10', '2024-08-20']
+	assert list(ratings) == [1900, 1915, 1920]
+
+def test_rating_as_of_a_date(history):
+	assert history.rating_as_of('Arsenal', '2024-08-01') == 1900
+	assert history.rating_as_of('Arsenal', '2024-08-19') == 1915
+	assert history.rating_as_of('Arsenal', '2025-01-01') == 1920
+	assert np.isnan(history.rating_as_of('Arsenal', '2024-07-31'))
+	assert np.isnan(history.rating_as_of('Chelsea', '2024-08-10'))
+
+def test_batched_lookups_agree_with_single_ones(history):
+	teams = ['Arsenal', 'Forest', 'Chelsea', 'Forest', 'Arsenal', 'Forest']
+	dates = np.array(['2024-07-31', '2024-07-31', '2024-08-10', '2024-08-31', '2024-08-10', '2024-09-01'], dtype='datetime64[D]')
+	batched = history.ratings_as_of(teams, dates)
+	single = np.array([history.rating_as_of(team, day) for team, day in zip(teams, dates)])
+	np.testing.assert_array_equal(batched, single)
+	assert list(np.isnan(batched)) == [True, True, True, False, False, False]
+
+def test_merge_keeps_the_other_history_on_the_same_day(history):
+	other = RatingHistory.from_periods(['Arsenal', 'Chelsea'], ['2024-08-10', '2024-08-05'], [1800, 1850])
+	merged = history.merge(other)
+	assert merged.rating_as_of('Arsenal', '2024-08-10') == 1800
+	assert merged.rating_as_of('Arsenal', '2024-08-20') == 1920
+	assert merged.rating_as_of('Chelsea', '2024-08-06') == 1850
+	assert merged.rating_as_of('Forest', '2024-09-01') == 1620
+
+def test_save_load_round_trip(history, tmp_path):
+	history.save(str(tmp_path))
+	loaded = RatingHistory.load(str(tmp_path))
+	assert loaded.teams == history.teams
+	for name in RatingHistory.array_names + ['keys']:
+		np.testing.assert_array_equal(getattr(loaded, name), getattr(history, name))
+	dates = np.array(['2024-08-15'] * 3, dtype='datetime64[D]')
+	np.testing.assert_array_equal(loaded.ratings_as_of(['Arsenal', 'Forest', 'Chelsea'], dates), history.ratings_as_of(['Arsenal', 'Forest', 'Chelsea'], dates))
+
+def test_backtest_finds_clubelo_ratings_under_football_data_names(history):
+	data = pd.DataFrame({'Date': ['2024-08-15'], 'HomeTeam': ["Nott'm Forest"], 'AwayTeam': ['Arsenal']})
+	assert np.isnan(clubelo_history_probs(data, history)).all()
+	probs = clubelo_history_probs(data, history, football_data_to_ClubELO_names_mapping)
+	assert not np.isnan(probs).any()
+	assert probs.sum() == pytest.approx(1)
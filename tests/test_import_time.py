@@ -0,0 +1,14 @@
+from benchmarks.import_time import heavy_packages
+from pathlib import Path
+import subprocess
+import json
+import sys
+
+def test_serving_path_does_not_import_heavy_packages():
+	"""Importing app.main in a fresh interpreter must leave the heavy libraries to the code that needs them"""
+	output = subprocess.run(
+		[sys.executable, '-c', 'import app.main, json, sys; print(json.dumps(sorted(sys.modules)))'],
+		capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parents[1],
+	).stdout
+	loaded = {name.split('.')[0] for name in json.loads(output.splitlines()[-1])}
+	assert not loaded & set(heavy_packages), f'imported by app.main: {sorted(loaded & set(heavy_packages))}'
@@ -0,0 +1,36 @@
+from app.core.log import DroppingQueueHandler, JSONFormatter
+import logging
+import queue
+import json
+
+def queued_entry(log) -> dict:
+	"""Logs through DroppingQueueHandler and formats the queued record as the writer thread does"""
+	log_queue = queue.Queue()
+	logger = logging.getLogger('tests.log')
+	logger.handlers, logger.propagate = [DroppingQueueHandler(log_queue)], False
+	logger.setLevel(logging.INFO)
+	try:
+		log(logger)
+	finally:
+		logger.handlers = []
+	return json.loads(JSONFormatter().format(log_queue.get_nowait()))
+
+def test_exception_is_a_structured_field():
+	def log(logger):
+		try:
+			raise ValueError('bad odds')
+		except ValueError:
+			logger.exception("Could not parse %s", 'event 1', extra={'NT_id': '1'})
+	entry = queued_entry(log)
+	assert entry['message'] == 'Could not parse event 1'
+	assert entry['NT_id'] == '1'
+	assert entry['exception'].startswith('Traceback') and 'ValueError: bad odds' in entry['exception']
+
+def test_stack_info_is_a_structured_field():
+	entry = queued_entry(lambda logger: logger.warning("Slow %s", 'stage', stack_info=True))
+	assert entry['message'] == 'Slow stage'
+	assert entry['stack'].startswith('Stack (most recent call last)')
+
+def test_plain_record():
+	entry = queued_entry(lambda logger: logger.info("Restored %d payloads", 3))
+	assert entry['message'] == 'Restored 3 payloads' and 'exception' not in entry
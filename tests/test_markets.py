@@ -0,0 +1,109 @@
+from app.core.markets import ScoreGrids, score_columns, gd_columns
+from app.core.repositories import FixturesRepository
+from app.core.schemas import StakeRequestModel, StakeCandidateModel
+from app.services.staking import StakingService
+from math import exp, factorial
+import numpy as np
+import pytest
+
+def poisson_columns(rates):
+	"""
+	Probability columns for fixtures with independent Poisson goals, one (home rate, away rate) per fixture. As in ClubELO's files, the exact
+	scores stop at six goals and the GD columns cover every score.
+	"""
+	def score(h, a):
+		return np.array([exp(-x - y) * x ** h / factorial(h) * y ** a / factorial(a) for x, y in rates])
+	columns = {f'R:{h}-{a}': score(h, a) for h, a in score_columns}
+	gd = {column: np.zeros(len(rates)) for column in gd_columns}
+	for h in range(25):
+		for a in range(25):
+			gd['GD<-5' if h - a < -5 else 'GD>5' if h - a > 5 else f'GD={h - a}'] += score(h, a)
+	return {**columns, **gd}
+
+@pytest.fixture(scope='module')
+def grids():
+	return ScoreGrids.from_columns(['A', 'B', 'C'], ['B', 'C', 'A'], poisson_columns([(1.5, 1.1), (2.0, 0.8), (1.2, 1.2)]))
+
+def test_fixtures_are_found_by_their_key(grids):
+	assert [grids.position(home, away) for home, away in [('A', 'B'), ('B', 'C'), ('C', 'A')]] == [0, 1, 2]
+	assert grids.position('B', 'A') is None
+	assert grids.position('C', 'B') is None
+	assert grids.position('A', 'Z') is None
+
+def test_totals_above_the_published_scores_have_no_price(grids):
+	grid = grids.get('A', 'B')
+	over = grid.total_over(6.5)
+	assert over.false == pytest.approx(grid.total_cdf(6))
+	assert over.true == pytest.approx(1 - grid.total_cdf(6))
+	assert grid.total_over(7.5) is None
+	assert grid.asian_total(6.5) is not None
+	assert grid.asian_total(6.75) is None
+	assert grid.asian_total(7) is None
+	repo = FixturesRepository(grids, {})
+	assert repo.get_market_probabilities('A', 'B', 'Totalt antall mål - Over/Under 7.5') is None
+
+def test_stakes_are_not_sized_on_unpriced_lines(grids):
+	candidates = [StakeCandidateModel(home_team='A', away_team='B', market='Totalt antall mål - Over/Under 7.5', selection='true', odds=1000)]
+	stake, = StakingService(FixturesRepository(grids, {})).optimize(StakeRequestModel(bankroll=1000, kelly_fraction=0.25, candidates=candidates)).stakes
+	assert stake.probability is None
+	assert stake.stake == 0
+
+def reference_markets(columns, i):
+	"""Market probabilities of fixture i straight from the float64 columns"""
+	scores = {(h, a): columns[f'R:{h}-{a}'][i] for h, a in score_columns}
+	gd = np.array([columns[column][i] for column in gd_columns])
+	return {
+		'hub': [gd[7:].sum(), gd[6], gd[:6].sum()],
+		# Scores above six goals are all over
+		'over_2.5': 1 - sum(p for (h, a), p in scores.items() if h + a <= 2),
+		'under_2.5': sum(p for (h, a), p in scores.items() if h + a <= 2),
+		'btts': sum(p for (h, a), p in scores.items() if h > 0 and a > 0),
+		'odd': sum(p for (h, a), p in scores.items() if (h + a) % 2 == 1),
+		'home_over_1.5': sum(p for (h, a), p in scores.items() if h > 1),
+		'correct_2-1': scores[(2, 1)],
+		'handicap_0:1': [gd[8:].sum(), gd[7], gd[:7].sum()],
+	}
+
+def compact_markets(grid):
+	hub, handicap = grid.hub(), grid.european_handicap(1)
+	return {
+		'hub': [hub.home, hub.draw, hub.away],
+		'over_2.5': grid.total_over(2.5).true,
+		'under_2.5': grid.total_over(2.5).false,
+		'btts': grid.both_teams_to_score().true,
+		'odd': grid.odd_even().true,
+		'home_over_1.5': grid.team_total_over('home', 1.5).true,
+		'correct_2-1': grid.correct_score(2, 1),
+		'handicap_0:1': [handicap.home, handicap.draw, handicap.away],
+	}
+
+@pytest.fixture(scope='module')
+def league():
+	"""Every pairing of 30 teams in shuffled order, so the int32 keys span many teams and the rows are not in key order"""
+	rng = np.random.default_rng(11)
+	pairs = [(f'Team {h}', f'Team {a}') for h in range(30) for a in range(30) if h != a]
+	pairs = [pairs[i] for i in rng.permutation(len(pairs))]
+	rates = [tuple(rate) for rate in rng.uniform(0.5, 2.5, (len(pairs), 2))]
+	columns = poisson_columns(rates)
+	return pairs, columns, ScoreGrids.from_columns([h for h, _ in pairs], [a for _, a in pairs], columns)
+
+def test_compact_layout_prices_markets_like_the_float64_columns(league):
+	pairs, columns, grids = league
+	for i, (home, away) in enumerate(pairs):
+		assert grids.position(home, away) == i
+		compact, reference = compact_markets(grids.get(home, away)), reference_markets(columns, i)
+		for market in reference:
+			assert np.ravel(compact[market]) == pytest.approx(np.ravel(reference[market]), abs=1e-6), market
+	assert grids.position('Team 1', 'Team 1') is None
+	assert grids.position('Team 29', 'Team 30') is None
+
+def test_save_load_round_trip(league, tmp_path):
+	pairs, _, grids = league
+	grids.save(str(tmp_path))
+	loaded = ScoreGrids.load(str(tmp_path))
+	assert loaded.teams == grids.teams
+	for name in ScoreGrids.array_names:
+		np.testing.assert_array_equal(getattr(loaded, name), getattr(grids, name))
+		assert getattr(loaded, name).dtype == getattr(grids, name).dtype
+	for home, away in pairs[:50]:
+		assert compact_markets(loaded.get(home, away)) == compact_markets(grids.get(home, away))
@@ -0,0 +1,63 @@
+from app.core.match_index import MatchIndex, MatchQuery, decode_cursor, encode_cursor
+from app.utils.utils import tournaments_of_interest
+from benchmarks.match_index import synthetic_matches, brute_force
+from tests.asgi import request
+import pytest
+
+@pytest.fixture(scope='module')
+def matches():
+	return synthetic_matches(300, seed=7)
+
+@pytest.fixture(scope='module')
+def index(matches):
+	return MatchIndex(matches)
+
+def all_pages(index, query):
+	"""Every page of the query, following the cursors"""
+	pages, cursor = [], None
+	while True:
+		page, next_cursor = index.query(MatchQuery(**{**vars(query), 'cursor': cursor}))
+		pages.append(page)
+		if next_cursor is None:
+			return pages
+		cursor = decode_cursor(next_cursor, query.sort)
+
+@pytest.mark.parametrize('sort', ['start_time', 'ev'])
+@pytest.mark.parametrize('filters', [
+	{},
+	{'tournaments': tuple(tournaments_of_interest[:2])},
+	{'tournaments': ('England - Premier League',)},
+	{'min_ev': 1.02},
+	{'min_odds': 2.0, 'max_odds': 4.0},
+	{'tournaments': tuple(tournaments_of_interest[2:5]), 'min_ev': 0.98, 'min_odds': 1.5},
+])
+@pytest.mark.parametrize('limit', [1, 7, 50])
+def test_pages_add_up_to_the_filtered_and_sorted_feed(matches, index, sort, filters, limit):
+	query = MatchQuery(sort=sort, limit=limit, **filters)
+	pages = all_pages(index, query)
+	ids = [match.NT_id for page in pages for match in page]
+	assert ids == [match.NT_id for match in brute_force(matches, query)]
+	assert len(ids) == len(set(ids))
+	assert all(len(page) == limit for page in pages[:-1])
+	assert len(pages[-1]) <= limit
+
+def test_kickoff_window(matches, index):
+	start_times = sorted(match.start_time for match in matches)
+	query = MatchQuery(start_from=start_times[40], start_to=start_times[200], sort='ev', limit=25, min_ev=0.95)
+	ids = [match.NT_id for page in all_pages(index, query) for match in page]
+	assert ids == [match.NT_id for match in brute_force(matches, query)]
+
+def test_without_a_limit_there_is_one_page(matches, index):
+	page, cursor = index.query(MatchQuery(sort='ev'))
+	assert cursor is None
+	assert page == brute_force(matches, MatchQuery(sort='ev'))
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'bm90IGpzb24=', encode_cursor('ev', (-1.1, '1000001')), encode_cursor('start_time', (1.0, '1'))[:-4]])
+def test_bad_cursors_get_a_400(cursor):
+	status, body = request('GET', '/matches', query_string=f'sort=start_time&limit=10&cursor={cursor}')
+	assert status == 400
+	assert 'cursor' in body['detail']
+
+def test_cursor_from_the_other_sort_is_rejected():
+	with pytest.raises(ValueError, match='sort=start_time'):
+		decode_cursor(encode_cursor('start_time', (1.0, '1')), 'ev')
@@ -0,0 +1,58 @@
+from app.core.metrics import SamplingProfiler, Histogram, Counter, Gauge, labels_key
+import threading
+import time
+
+def busy_worker(stop: threading.Event):
+	while not stop.is_set():
+		sum(i * i for i in range(1000))
+
+def test_profiler_samples_worker_threads():
+	"""Sync endpoints run in worker threads, not on the event loop, and must show up in the profile"""
+	stop = threading.Event()
+	worker = threading.Thread(target=busy_worker, args=(stop,), name='AnyIO worker thread')
+	profiler = SamplingProfiler(interval=0.001)
+	worker.start()
+	profiler.start()
+	time.sleep(0.2)
+	profiler.stop()
+	stop.set()
+	worker.join()
+	stacks = profiler.collapsed().splitlines()
+	assert any(stack.startswith('AnyIO worker thread;') and 'busy_worker (test_metrics.py:' in stack for stack in stacks)
+	# The profiler's own thread is left out
+	assert not any('_run (metrics.py' in stack for stack in stacks)
+
+def test_concurrent_updates_and_renders():
+	"""Sync endpoints update metrics from worker threads while the event loop adds label sets and /metrics renders"""
+	histogram, counter, gauge = Histogram('h', 'h'), Counter('c', 'c'), Gauge('g', 'g')
+	n_threads, n_updates = 4, 5000
+	errors = []
+
+	def update(thread):
+		for i in range(n_updates):
+			histogram.observe(0.001, stage='shared')
+			histogram.observe(0.001, stage=f'{thread}-{i}')
+			counter.inc(status='shared')
+			gauge.set(i, host=f'{thread}-{i}')
+
+	def render(stop):
+		while not stop.is_set():
+			try:
+				histogram.render(), counter.render(), gauge.render()
+			except RuntimeError as e:
+				errors.append(e)
+
+	stop = threading.Event()
+	renderer = threading.Thread(target=render, args=(stop,))
+	renderer.start()
+	threads = [threading.Thread(target=update, args=(thread,)) for thread in range(n_threads)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	stop.set()
+	renderer.join()
+	assert not errors
+	assert counter.series[labels_key({'status': 'shared'})] == n_threads * n_updates
+	assert sum(histogram.series[labels_key({'stage': 'shared'})][0]) == n_threads * n_updates
+	assert len(gauge.series) == n_threads * n_updates
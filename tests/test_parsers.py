@@ -0,0 +1,44 @@
+from app.core import parsers
+from app.core.markets import ScoreGrids
+from app.core.parsers import MatchParser
+from app.core.repositories import TeamRatingsRepository, FixturesRepository
+from app.utils.utils import calculate_elo_probs_batch, DRAW_FACTOR, HOME_ADVANTAGE
+from tests.test_markets import poisson_columns
+import pytest
+
+@pytest.fixture
+def parser():
+	ratings = TeamRatingsRepository(elo_ratings={'Arsenal': 1900, 'Chelsea': 1800, 'Roma': 1750, 'Lazio': 1700}, name_mapping={'Arsenal FC': 'Arsenal'})
+	fixtures = FixturesRepository(ScoreGrids.from_columns(['Arsenal'], ['Chelsea'], poisson_columns([(1.6, 1.0)])), {'Arsenal FC': 'Arsenal'})
+	return MatchParser(ratings, fixtures)
+
+def match(home, away, tournament='England - Premier League'):
+	return {'homeParticipant': home, 'awayParticipant': away, 'tournament': {'name': tournament}}
+
+def test_published_fixtures_use_clubelo_probabilities(parser):
+	(probs, source), = parser.get_probabilities([match('Arsenal FC', 'Chelsea')])
+	assert source == 'clubelo_fixtures'
+	assert probs == parser.fixtures_repo.get_match_probabilities('Arsenal', 'Chelsea')
+
+def test_unpublished_fixtures_fall_back_to_the_batched_elo_formula(parser, monkeypatch):
+	monkeypatch.setitem(parsers.elo_league_parameters, 'Italia - Serie A', (0.3, 50))
+	matches = [
+		match('Chelsea', 'Arsenal FC'),
+		match('Arsenal FC', 'Chelsea'),
+		match('Roma', 'Lazio', 'Italia - Serie A'),
+		match('Lazio', 'Unrated FC', 'Italia - Serie A'),
+		match('Chelsea', 'Roma', 'Internasjonal klubb - UEFA Champions League'),
+	]
+	results = parser.get_probabilities(matches)
+	assert [source for _, source in results] == ['elo_formula', 'clubelo_fixtures', 'elo_formula', 'elo_formula', 'elo_formula']
+	expected = {
+		0: calculate_elo_probs_batch(1800, 1900, DRAW_FACTOR, HOME_ADVANTAGE),
+		2: calculate_elo_probs_batch(1750, 1700, 0.3, 50),
+		4: calculate_elo_probs_batch(1800, 1750, DRAW_FACTOR, HOME_ADVANTAGE),
+	}
+	for i, (home, draw, away) in expected.items():
+		probs = results[i][0]
+		assert [probs.home, probs.draw, probs.away] == pytest.approx([home, draw, away])
+		assert probs.home + probs.draw + probs.away == pytest.approx(1)
+	# A team ClubELO has no rating for gets no probabilities, rather than the default rating
+	assert results[3] == (None, 'elo_formula')
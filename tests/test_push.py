@@ -0,0 +1,66 @@
+from app.api.routes import router
+from app.services.push import ConnectionQueue, PushHub, Subscription, push_hub
+from fastapi import FastAPI
+import asyncio
+import pytest
+import json
+
+@pytest.mark.parametrize('message', [
+	[1, 2],
+	'tournaments',
+	{'min_ev': 'abc'},
+	{'min_ev': True},
+	{'tournaments': 'England - Premier League'},
+	{'events': [1, 2]},
+])
+def test_invalid_subscriptions_raise(message):
+	with pytest.raises((TypeError, ValueError)):
+		Subscription.from_message(message)
+
+def test_valid_subscription():
+	subscription = Subscription.from_message({'tournaments': ['England - Premier League'], 'events': ['1'], 'min_ev': 1})
+	assert subscription == Subscription({'England - Premier League'}, {'1'}, 1.0)
+	assert Subscription.from_message({}) == Subscription()
+
+def test_unsubscribe_drops_empty_index_keys():
+	async def run():
+		hub = PushHub()
+		first, second = ConnectionQueue(), ConnectionQueue()
+		hub.subscribe(first, Subscription({'A'}, {'1', '2'}))
+		hub.subscribe(second, Subscription({'A'}, {'2'}))
+		hub.subscribe(first, Subscription({'B'}, {'3'}))
+		assert hub._by_event == {'2': {second}, '3': {first}}
+		assert hub._by_tournament == {'A': {second}, 'B': {first}}
+		hub.unsubscribe(first)
+		hub.unsubscribe(second)
+		assert hub._by_event == {} and hub._by_tournament == {} and not hub._everything
+	asyncio.run(run())
+
+def test_invalid_subscription_gets_an_error_frame_and_keeps_the_connection():
+	"""Drives the /ws/matches endpoint through ASGI messages"""
+	async def run():
+		app = FastAPI()
+		app.include_router(router)
+		incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+		scope = {
+			'type': 'websocket', 'path': '/ws/matches', 'raw_path': b'/ws/matches', 'query_string': b'', 'headers': [],
+			'scheme': 'ws', 'server': ('testserver', 80), 'client': ('testclient', 50000), 'root_path': '', 'subprotocols': [],
+		}
+		connection = asyncio.create_task(app(scope, incoming.get, outgoing.put))
+		await incoming.put({'type': 'websocket.connect'})
+		assert (await asyncio.wait_for(outgoing.get(), 5))['type'] == 'websocket.accept'
+		for text in ['not json', '[1, 2]', '{"min_ev": "abc"}']:
+			await incoming.put({'type': 'websocket.receive', 'text': text})
+			frame = await asyncio.wait_for(outgoing.get(), 5)
+			assert frame['type'] == 'websocket.send'
+			assert json.loads(frame['text'])['type'] == 'error'
+		await incoming.put({'type': 'websocket.receive', 'text': '{"tournaments": ["England - Premier League"], "min_ev": 1.05}'})
+		for _ in range(100):
+			if push_hub.subscriptions:
+				break
+			await asyncio.sleep(0.01)
+		assert list(push_hub.subscriptions.values()) == [Subscription({'England - Premier League'}, set(), 1.05)]
+		await incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+		await asyncio.wait_for(connection, 5)
+		assert not push_hub.subscriptions and not push_hub._by_tournament
+	asyncio.run(run())
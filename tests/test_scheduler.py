@@ -0,0 +1,74 @@
+from app.background.data_updater import DataUpdater
+from app.config.config import settings
+from app.core.metrics import upstream_requests_total
+from app.core.scheduler import UpstreamScheduler, DeadlineExceeded, RequestClass, request_priority, upstream_priority, upstream_scheduler
+from benchmarks.stub_server import StubUpstream
+from aiohttp import web
+import aiohttp
+import asyncio
+import pytest
+
+def deadlines_exceeded(host: str) -> float:
+	return upstream_requests_total.series.get((('source', host), ('status', 'deadline_exceeded')), 0)
+
+def test_fetch_timeouts_pass_through():
+	"""A timeout raised by the HTTP client before the deadline is the upstream's, not a missed deadline"""
+	async def fetch():
+		raise aiohttp.ServerTimeoutError('Timeout on reading data from socket')
+	async def run():
+		before = deadlines_exceeded('test_fetch_timeout')
+		with upstream_priority(RequestClass.USER, deadline=5):
+			with pytest.raises(aiohttp.ServerTimeoutError) as raised:
+				await UpstreamScheduler({}).submit('test_fetch_timeout', fetch)
+		assert not isinstance(raised.value, DeadlineExceeded)
+		assert deadlines_exceeded('test_fetch_timeout') == before
+	asyncio.run(run())
+
+def test_slow_fetch_exceeds_its_deadline():
+	async def fetch():
+		await asyncio.sleep(5)
+	async def run():
+		before = deadlines_exceeded('test_slow_fetch')
+		with upstream_priority(RequestClass.USER, deadline=0.1):
+			with pytest.raises(DeadlineExceeded):
+				await UpstreamScheduler({}).submit('test_slow_fetch', fetch)
+		assert deadlines_exceeded('test_slow_fetch') == before + 1
+	asyncio.run(run())
+
+def test_queued_request_exceeds_its_deadline():
+	async def fetch():
+		return 'sent'
+	async def run():
+		scheduler = UpstreamScheduler({'test_queued': (0.5, 1)})
+		assert await scheduler.submit('test_queued', fetch) == 'sent'
+		# The bucket is empty for two seconds, so this one passes its deadline in the queue
+		with upstream_priority(RequestClass.USER, deadline=0.1):
+			with pytest.raises(DeadlineExceeded):
+				await scheduler.submit('test_queued', fetch)
+	asyncio.run(run())
+
+def test_snapshot_downloads_go_through_the_scheduler(monkeypatch, tmp_path):
+	submitted = []
+	submit = upstream_scheduler.submit
+	async def recording_submit(host, fetch):
+		submitted.append((host, request_priority.get()))
+		return await submit(host, fetch)
+	async def run():
+		runner = web.AppRunner(StubUpstream(n_events=10).app())
+		await runner.setup()
+		await web.TCPSite(runner, '127.0.0.1', 0).start()
+		host, port = runner.addresses[0][:2]
+		try:
+			monkeypatch.setattr(settings, 'CLUBELO_URL', f'http://{host}:{port}/clubelo')
+			monkeypatch.setattr(settings, 'ELO_CSV_PATH', str(tmp_path / 'elo_ratings.csv'))
+			monkeypatch.setattr(settings, 'FIXTURES_CSV_PATH', str(tmp_path / 'fixtures.csv'))
+			monkeypatch.setattr(upstream_scheduler, 'submit', recording_submit)
+			updater = DataUpdater()
+			assert await updater.download_elo_csv() and await updater.download_fixtures_csv()
+		finally:
+			await runner.cleanup()
+	asyncio.run(run())
+	assert [host for host, _ in submitted] == ['clubelo', 'clubelo']
+	assert all(priority.request_class == RequestClass.REFRESH and priority.deadline == settings.DOWNLOAD_DEADLINE for _, priority in submitted)
+	assert (tmp_path / 'elo_ratings.csv').read_text().startswith('Club,')
+	assert (tmp_path / 'fixtures.csv').read_text().startswith('Home,Away,')
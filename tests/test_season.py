@@ -0,0 +1,58 @@
+from app.core.markets import MAX_GD
+from app.core.repositories import TeamRatingsRepository
+from app.predictor.season import Season, FixtureProbabilities, simulate_batch, simulate, elo_gd_pmf
+from app.utils.utils import calculate_elo_probs_batch, football_data_to_ClubELO_names_mapping
+import numpy as np
+import pytest
+
+def round_robin(n_teams, seed=0) -> Season:
+	"""Every pairing still to play once, with random goal difference distributions and an empty table"""
+	rng = np.random.default_rng(seed)
+	fixtures = np.array([(h, a) for h in range(n_teams) for a in range(n_teams) if h < a])
+	gd_pmf = rng.dirichlet(np.ones(2 * MAX_GD + 1), len(fixtures))
+	return Season([f'Team {i}' for i in range(n_teams)], np.zeros(n_teams), np.zeros(n_teams), fixtures[:, 0], fixtures[:, 1], gd_pmf)
+
+def test_every_team_finishes_in_one_position_per_season():
+	n_seasons = 500
+	counts, points = simulate_batch(round_robin(6), n_seasons, seed=1)
+	assert counts.shape == (6, 6)
+	assert (counts.sum(axis=1) == n_seasons).all()
+	assert (counts.sum(axis=0) == n_seasons).all()
+	# Each fixture hands out 2 or 3 points
+	assert 2 * 15 * n_seasons <= points.sum() <= 3 * 15 * n_seasons
+
+def test_ties_break_on_goal_difference_then_at_random():
+	# No fixtures left: D leads on points, A and C are level on points and goal difference, B trails them on goal difference
+	season = Season(['A', 'B', 'C', 'D'], np.array([10.0, 10, 10, 12]), np.array([5.0, 3, 5, -2]), np.zeros(0, int), np.zeros(0, int), np.zeros((0, 2 * MAX_GD + 1)))
+	counts, _ = simulate_batch(season, 2000, seed=2)
+	assert counts[3, 0] == 2000
+	assert counts[1, 3] == 2000
+	assert counts[0, 1] + counts[0, 2] == counts[2, 1] + counts[2, 2] == 2000
+	assert 800 < counts[0, 1] < 1200
+
+def test_results_do_not_depend_on_the_number_of_workers():
+	season = round_robin(5)
+	one = simulate(season, n_seasons=3000, batch_size=1000, n_workers=1, seed=3)
+	two = simulate(season, n_seasons=3000, batch_size=1000, n_workers=2, seed=3)
+	assert one.equals(two)
+	assert not one.equals(simulate(season, n_seasons=3000, batch_size=1000, n_workers=1, seed=4))
+
+def test_elo_gd_pmf_keeps_the_formula_probabilities():
+	home_elo, away_elo = np.array([1500.0, 1900, 1600, 1700]), np.array([1500.0, 1600, 1900, 1700])
+	pmf = elo_gd_pmf(home_elo, away_elo, 0.3, 50)
+	home, draw, away = calculate_elo_probs_batch(home_elo, away_elo, 0.3, 50)
+	assert pmf[:, MAX_GD + 1:].sum(axis=1) == pytest.approx(home)
+	assert pmf[:, MAX_GD] == pytest.approx(draw)
+	assert pmf[:, :MAX_GD].sum(axis=1) == pytest.approx(away)
+	assert (pmf >= 0).all()
+
+def test_football_data_names_find_clubelo_ratings_and_fixtures(tmp_path):
+	ratings = TeamRatingsRepository(elo_ratings={'Forest': 1800.0, 'Atletico': 1900.0}, name_mapping=football_data_to_ClubELO_names_mapping)
+	assert list(ratings.get_elo_ratings(["Nott'm Forest", 'Ath Madrid'])) == [1800.0, 1900.0]
+	path = tmp_path / 'fixtures.csv'
+	path.write_text('Home,Away,GD=0\nForest,Atletico,1\n')
+	to_football_data = {club: team for team, club in football_data_to_ClubELO_names_mapping.items()}
+	fixtures = FixtureProbabilities.read_fixtures(str(path), to_football_data)
+	assert list(fixtures) == [("Nott'm Forest", 'Ath Madrid')]
+	pmf = FixtureProbabilities(ratings, fixtures).gd_pmf(["Nott'm Forest"], ['Ath Madrid'])
+	assert pmf[0, MAX_GD] == 1
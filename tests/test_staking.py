@@ -0,0 +1,72 @@
+from app.core.repositories import FixturesRepository
+from app.core.schemas import StakeRequestModel, StakeCandidateModel
+from app.services.staking import StakingService, selection_index
+from app.api import routes
+from tests.asgi import request
+from benchmarks.stub_server import SyntheticUpstream
+import pandas as pd
+import pytest
+import io
+
+@pytest.fixture(scope='module')
+def match():
+	fixtures = pd.read_csv(io.StringIO(SyntheticUpstream(4).fixtures_csv), index_col=['Home', 'Away'])
+	fixtures = fixtures[~fixtures.index.duplicated()]
+	return FixturesRepository.from_dataframe(fixtures, {}), *fixtures.index[0]
+
+def stakes(match, market, selections, odds=2.5):
+	repo, home, away = match
+	candidates = [StakeCandidateModel(home_team=home, away_team=away, market=market, selection=selection, odds=odds) for selection in selections]
+	return StakingService(repo).optimize(StakeRequestModel(bankroll=1000, kelly_fraction=0.25, candidates=candidates)).stakes, repo.get_match_probabilities(home, away)
+
+def test_whole_line_asian_handicap_splits_win_push_and_loss(match):
+	(home, away), probs = stakes(match, 'Asiatisk handikap 0', ['true', 'false'])
+	# Draw no bet: the home side wins on a home win, and both sides are returned on a draw
+	assert home.probability == pytest.approx(probs.home, abs=1e-6)
+	assert home.push_probability == away.push_probability == pytest.approx(probs.draw, abs=1e-6)
+	assert away.probability == pytest.approx(probs.away, abs=1e-6)
+	for stake in (home, away):
+		assert 0 <= stake.probability <= 1
+		assert stake.expected_value == pytest.approx(stake.probability * stake.odds + stake.push_probability)
+
+def test_markets_without_pushes_have_no_push_probability(match):
+	(home, draw, away), probs = stakes(match, 'HUB', ['home', 'draw', 'away'])
+	assert [home.probability, draw.probability, away.probability] == pytest.approx([probs.home, probs.draw, probs.away], abs=1e-6)
+	assert home.push_probability == draw.push_probability == away.push_probability == 0
+
+def candidate(match, market='HUB', selection='home'):
+	_, home, away = match
+	return {'home_team': home, 'away_team': away, 'market': market, 'selection': selection, 'odds': 2.5}
+
+@pytest.mark.parametrize('fields', [
+	{'bankroll': 0},
+	{'bankroll': -100},
+	{'kelly_fraction': 0},
+	{'kelly_fraction': 1.5},
+	{'max_exposure': -1},
+	{'max_exposure': 0},
+	{'max_exposure': 2},
+])
+def test_out_of_range_requests_are_rejected(match, fields):
+	status, body = request('POST', '/stakes', {'bankroll': 1000, 'candidates': [candidate(match)], **fields})
+	assert status == 422
+	assert body['detail'][0]['loc'][-1] == next(iter(fields))
+
+@pytest.mark.parametrize('market, selection', [
+	('Totalt antall mål - Over/Under 2.5', 'draw'),
+	('Totalt antall mål - Over/Under 2.5', 'home'),
+	('HUB', 'true'),
+	('Handikap 3-veis 0:1', 'false'),
+])
+def test_selections_outside_the_market_are_rejected(match, monkeypatch, market, selection):
+	with pytest.raises(ValueError, match=f"Selection '{selection}'"):
+		selection_index(market, selection)
+	monkeypatch.setattr(routes, 'StakingService', lambda: StakingService(match[0]))
+	status, body = request('POST', '/stakes', {'bankroll': 1000, 'candidates': [candidate(match), candidate(match, market, selection)]})
+	assert status == 400
+	assert market in body['detail']
+
+def test_selections_in_settlement_order():
+	assert [selection_index('HUB', selection) for selection in ('home', 'draw', 'away')] == [0, 1, 2]
+	assert [selection_index('Asiatisk handikap -0.25', selection) for selection in ('true', 'false')] == [0, 1]
+	assert selection_index('Unknown market', 'draw') is None
@@ -0,0 +1,38 @@
+from app.core import warm_cache
+from app.core.warm_cache import WarmCache, PayloadCache
+import pytest
+import os
+
+def saved_payloads(directory) -> dict:
+	payloads = PayloadCache()
+	WarmCache(str(directory), payloads=payloads).restore()
+	return {key: entry.payload for key, entry in payloads.entries.items()}
+
+def test_restore_after_save(tmp_path):
+	payloads = PayloadCache()
+	payloads.put('events/FBL', [{'eventId': '1'}])
+	WarmCache(str(tmp_path), payloads=payloads).save()
+	assert saved_payloads(tmp_path) == {'events/FBL': [{'eventId': '1'}]}
+
+def test_missing_cache_restores_nothing(tmp_path):
+	assert WarmCache(str(tmp_path), payloads=PayloadCache()).restore() == {'ratings': 0, 'fixtures': 0, 'payloads': 0}
+
+def test_crash_before_the_pointer_is_replaced_keeps_the_previous_save(tmp_path, monkeypatch):
+	payloads = PayloadCache()
+	cache = WarmCache(str(tmp_path), payloads=payloads)
+	payloads.put('events/FBL', ['first'])
+	cache.save()
+
+	payloads.put('events/FBL', ['second'])
+	def crash(*args):
+		raise KeyboardInterrupt('killed mid-save')
+	monkeypatch.setattr(warm_cache.os, 'replace', crash)
+	with pytest.raises(KeyboardInterrupt):
+		cache.save()
+	monkeypatch.undo()
+	assert saved_payloads(tmp_path) == {'events/FBL': ['first']}
+
+	# The next save makes the new state current and removes the directory the crashed save left
+	cache.save()
+	assert saved_payloads(tmp_path) == {'events/FBL': ['second']}
+	assert len([entry for entry in os.listdir(cache.directory) if os.path.isdir(os.path.join(cache.directory, entry))]) == 1